@@ -0,0 +1,40 @@
+"""Add questions.answer_pending
+
+Revision ID: a1f3c2d4e5b6
+Revises: 
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1f3c2d4e5b6'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _question_columns():
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table("questions"):
+        # Fresh database: init_db creates the table with the column
+        return None
+    return {column["name"] for column in inspector.get_columns("questions")}
+
+
+def upgrade() -> None:
+    columns = _question_columns()
+    if columns is not None and "answer_pending" not in columns:
+        op.add_column(
+            "questions",
+            sa.Column("answer_pending", sa.Boolean(), server_default=sa.false(), nullable=False)
+        )
+
+
+def downgrade() -> None:
+    columns = _question_columns()
+    if columns is not None and "answer_pending" in columns:
+        with op.batch_alter_table("questions") as batch_op:
+            batch_op.drop_column("answer_pending")
@@ -0,0 +1,124 @@
+"""
+Concurrency Utilities
+Bounded fan-out helpers for running chunk extraction concurrently while keeping document order
+"""
+import asyncio
+import os
+from typing import (
+    Any, AsyncGenerator, AsyncIterable, Awaitable, Callable, Dict, Iterable,
+    Optional, Tuple, TypeVar, Union
+)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+DEFAULT_CHUNK_CONCURRENCY = 4
+DEFAULT_ANSWER_BATCH_SIZE = 20
+DEFAULT_ANSWER_CONCURRENCY = 4
+
+
+def get_env_int(name: str, default: int, minimum: int = 0) -> int:
+    """
+    Read an integer setting from the environment.
+
+    Falls back to the default when the variable is missing or malformed.
+    """
+    try:
+        value = int(os.getenv(name, str(default)))
+    except ValueError:
+        print(f"[Config] Invalid integer for {name}, using default {default}", flush=True)
+        value = default
+    return max(minimum, value)
+
+
+def get_chunk_concurrency() -> int:
+    """Number of document chunks allowed in flight per ingestion (PARSE_CHUNK_CONCURRENCY)."""
+    return get_env_int("PARSE_CHUNK_CONCURRENCY", DEFAULT_CHUNK_CONCURRENCY, minimum=1)
+
+
+def get_answer_batch_size() -> int:
+    """Questions per AI reference-answer prompt (AI_ANSWER_BATCH_SIZE)."""
+    return get_env_int("AI_ANSWER_BATCH_SIZE", DEFAULT_ANSWER_BATCH_SIZE, minimum=1)
+
+
+def get_answer_concurrency() -> int:
+    """Number of AI reference-answer batches allowed in flight (AI_ANSWER_CONCURRENCY)."""
+    return get_env_int("AI_ANSWER_CONCURRENCY", DEFAULT_ANSWER_CONCURRENCY, minimum=1)
+
+
+async def iter_ordered_bounded(
+    items: Union[Iterable[T], AsyncIterable[T]],
+    worker: Callable[[int, T], Awaitable[R]],
+    limit: int,
+    on_complete: Optional[Callable[[int, Optional[R], Optional[BaseException], int], Awaitable[Any]]] = None
+) -> AsyncGenerator[Tuple[int, Optional[R], Optional[BaseException]], None]:
+    """
+    Run `worker(index, item)` for every item with at most `limit` calls in flight.
+
+    Items are pulled from the (sync or async) iterable lazily, only when a slot
+    frees up, so expensive producers (e.g. PDF page splitting or streaming text
+    extraction) never run far ahead of the consumers. An exception raised by
+    the producer itself propagates to the caller. Results are yielded strictly in input order as
+    `(index, result, error)` tuples; a failing item yields its exception instead
+    of aborting the whole run.
+
+    Args:
+        items: Iterable or async iterable of work items (consumed lazily)
+        worker: Coroutine function called with (index, item)
+        limit: Maximum number of concurrent worker calls
+        on_complete: Optional callback awaited in completion order with
+            (index, result, error, completed_count), e.g. for progress updates
+
+    Yields:
+        (index, result, error) tuples in input order
+    """
+    limit = max(1, limit)
+    is_async = hasattr(items, "__aiter__")
+    iterator = items.__aiter__() if is_async else iter(items)
+    in_flight: Dict[asyncio.Task, int] = {}
+    finished: Dict[int, Tuple[Optional[R], Optional[BaseException]]] = {}
+    next_index = 0
+    next_to_yield = 0
+    completed = 0
+    exhausted = False
+
+    async def launch() -> None:
+        nonlocal next_index, exhausted
+        while not exhausted and len(in_flight) < limit:
+            try:
+                item = await iterator.__anext__() if is_async else next(iterator)
+            except (StopIteration, StopAsyncIteration):
+                exhausted = True
+                break
+            task = asyncio.ensure_future(worker(next_index, item))
+            in_flight[task] = next_index
+            next_index += 1
+
+    try:
+        await launch()
+        while in_flight:
+            done, _ = await asyncio.wait(in_flight.keys(), return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                index = in_flight.pop(task)
+                error = task.exception()
+                result = None if error is not None else task.result()
+                finished[index] = (result, error)
+                completed += 1
+
+                if on_complete:
+                    await on_complete(index, result, error, completed)
+
+            # Refill the window before handing results to the consumer so
+            # provider calls keep running while merged results are processed.
+            await launch()
+
+            while next_to_yield in finished:
+                result, error = finished.pop(next_to_yield)
+                yield next_to_yield, result, error
+                next_to_yield += 1
+    finally:
+        for task in in_flight:
+            task.cancel()
+        if in_flight:
+            await asyncio.gather(*in_flight.keys(), return_exceptions=True)
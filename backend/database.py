@@ -65,9 +65,30 @@ async def init_db():
     async with engine.begin() as conn:
         # Create all tables
         await conn.run_sync(Base.metadata.create_all)
+        # create_all never alters existing tables; add columns introduced since
+        await conn.run_sync(_add_missing_columns)
         print("✅ Database tables created successfully")
 
 
+# Columns added to existing tables after their first release: (table, column, DDL type and default).
+# Alembic migrations add them too; this keeps deployments that skip `alembic upgrade` working.
+ADDED_COLUMNS = [
+    ("questions", "answer_pending", "BOOLEAN NOT NULL DEFAULT 0"),
+]
+
+
+def _add_missing_columns(connection):
+    from sqlalchemy import inspect, text
+
+    inspector = inspect(connection)
+    for table, column, ddl in ADDED_COLUMNS:
+        if not inspector.has_table(table):
+            continue
+        if column not in {existing["name"] for existing in inspector.get_columns(table)}:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+            print(f"✅ Added column {table}.{column}")
+
+
 async def init_default_config(db: AsyncSession):
     """
     Initialize default system configurations if not exists.
@@ -0,0 +1,144 @@
+"""
+Document text extractors run inside the parser process pool
+
+Pool processes are started with spawn and import this module to unpickle the
+job functions, so it must not import the `services` package (whose __init__
+builds the LLM service and its provider clients).
+"""
+import io
+import os
+import time
+from typing import Any, Callable, List, Optional, Tuple, Union
+import PyPDF2
+from docx import Document
+import openpyxl
+
+
+def read_source(source: Union[bytes, str]) -> bytes:
+    """`source` is either the raw file content or a path to the stored upload"""
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return f.read()
+    return source
+
+
+def extract_txt(file_content: bytes) -> str:
+    """Decode TXT file"""
+    try:
+        return file_content.decode('utf-8')
+    except UnicodeDecodeError:
+        try:
+            return file_content.decode('gbk')
+        except:
+            return file_content.decode('utf-8', errors='ignore')
+
+
+def count_pdf_pages(source: Union[bytes, str]) -> int:
+    """Number of pages in a PDF (only the cross-reference table is read)"""
+    try:
+        pdf_file = open(source, 'rb') if isinstance(source, str) else io.BytesIO(source)
+        with pdf_file:
+            return len(PyPDF2.PdfReader(pdf_file).pages)
+    except Exception as e:
+        raise Exception(f"Failed to parse PDF: {str(e)}")
+
+
+def pdf_page_texts(source: Union[bytes, str], start_page: int = 0, end_page: Optional[int] = None) -> List[str]:
+    """Text of the non-empty pages in [start_page, end_page)"""
+    try:
+        pdf_file = open(source, 'rb') if isinstance(source, str) else io.BytesIO(source)
+        with pdf_file:
+            pdf_reader = PyPDF2.PdfReader(pdf_file)
+            pages = pdf_reader.pages[start_page:end_page]
+
+            text_content = []
+            for page in pages:
+                text = page.extract_text()
+                if text:
+                    text_content.append(text)
+
+            return text_content
+    except Exception as e:
+        raise Exception(f"Failed to parse PDF: {str(e)}")
+
+
+def docx_segments(file_content: bytes) -> List[str]:
+    """Paragraph and table-row texts of a DOCX file"""
+    try:
+        docx_file = io.BytesIO(file_content)
+        doc = Document(docx_file)
+
+        text_content = []
+        for paragraph in doc.paragraphs:
+            if paragraph.text.strip():
+                text_content.append(paragraph.text)
+
+        # Also extract text from tables
+        for table in doc.tables:
+            for row in table.rows:
+                row_text = ' | '.join(cell.text.strip() for cell in row.cells)
+                if row_text.strip():
+                    text_content.append(row_text)
+
+        return text_content
+    except Exception as e:
+        raise Exception(f"Failed to parse DOCX: {str(e)}")
+
+
+def xlsx_segments(file_content: bytes) -> List[str]:
+    """Sheet headers and row texts of an XLSX file"""
+    try:
+        xlsx_file = io.BytesIO(file_content)
+        workbook = openpyxl.load_workbook(xlsx_file, data_only=True)
+
+        text_content = []
+        for sheet_name in workbook.sheetnames:
+            sheet = workbook[sheet_name]
+            text_content.append(f"=== Sheet: {sheet_name} ===")
+
+            for row in sheet.iter_rows(values_only=True):
+                row_text = ' | '.join(str(cell) if cell is not None else '' for cell in row)
+                if row_text.strip(' |'):
+                    text_content.append(row_text)
+
+        return text_content
+    except Exception as e:
+        raise Exception(f"Failed to parse XLSX: {str(e)}")
+
+
+def txt_segments(file_content: bytes) -> List[str]:
+    return [extract_txt(file_content)]
+
+
+SEGMENT_EXTRACTORS = {
+    'txt': txt_segments,
+    'pdf': pdf_page_texts,
+    'docx': docx_segments,
+    'doc': docx_segments,  # Try to parse DOC as DOCX
+    'xlsx': xlsx_segments,
+    'xls': xlsx_segments,  # Try to parse XLS as XLSX
+}
+
+# Segments are joined with this separator to form the document text
+SEGMENT_SEPARATOR = '\n\n'
+
+
+def extract_segments(extension: str, source: Union[bytes, str]) -> List[str]:
+    """All text segments of a document; the file is read inside the pool process"""
+    if extension == 'pdf':
+        # PdfReader opens a stored file itself
+        return pdf_page_texts(source)
+    return SEGMENT_EXTRACTORS[extension](read_source(source))
+
+
+def timed(func: Callable, *args) -> Tuple[Any, float]:
+    """Pool entry point: run `func(*args)` and return its result with the wall time"""
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def worker_pid() -> int:
+    """Pool warm-up probe; the short nap spreads the probes over all processes"""
+    time.sleep(0.05)
+    return os.getpid()
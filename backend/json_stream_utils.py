@@ -0,0 +1,190 @@
+"""
+JSON Stream Utilities
+Single-pass, tolerant JSON repair for LLM responses, usable incrementally
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+WHITESPACE = " \t\r\n"
+CONTROL_CHAR_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+CLOSERS = {"{": "}", "[": "]"}
+
+
+class JSONRepairParser:
+    """
+    Repair JSON text in one left-to-right pass; text may be fed in arbitrary pieces.
+
+    Repairs (counted in `fixes`):
+    - text before the first '{' / '[' (explanations, markdown fences) is skipped
+    - trailing commas before '}' / ']' are dropped
+    - raw control characters inside strings are escaped
+    - a quote inside a string that is not followed by ',', ':', '}' or ']'
+      is treated as a stray quote and escaped
+    - a truncated tail is cut back to the last complete value and closed
+
+    With `stream_array=True` the top-level array is never materialised: every
+    element is decoded and returned by `feed` as soon as it closes, and an
+    element that still cannot be decoded is skipped without affecting its
+    neighbours. Each character is looked at once, so cost is linear in the
+    response size.
+    """
+
+    def __init__(self, stream_array: bool = False):
+        self.stream_array = stream_array
+        self.started = False  # Opening '{' / '[' seen
+        self.complete = False  # Top-level value closed
+        self.skipped = 0  # Array elements that could not be decoded
+        self.fixes: Dict[str, int] = {}
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._held = ""  # Whitespace after a possible closing quote or a comma
+        self._held_kind: Optional[str] = None  # "quote" | "comma"
+        self._out: List[str] = []
+        self._safe: Tuple[int, Tuple[str, ...]] = (0, ())  # Last point where the output can be closed
+
+    def _fix(self, kind: str):
+        self.fixes[kind] = self.fixes.get(kind, 0) + 1
+
+    def feed(self, text: str) -> List[Any]:
+        """Consume the next piece of text; in stream_array mode returns the elements it completed"""
+        items: List[Any] = []
+        for char in text:
+            if self.complete:
+                break
+            self._consume(char, items)
+        return items
+
+    def _consume(self, char: str, items: List[Any]):
+        if not self.started:
+            if char == "[" or (char == "{" and not self.stream_array):
+                self.started = True
+                self._stack.append(char)
+                if not self.stream_array:
+                    self._out.append(char)
+                    self._mark_safe()
+            return
+
+        if self._held_kind == "quote":
+            if char in WHITESPACE:
+                self._held += char
+                return
+            held, self._held, self._held_kind = self._held, "", None
+            if char in ",:}]":
+                # The quote closed the string
+                self._in_string = False
+                self._out.append('"' + held)
+            else:
+                self._fix("stray_quotes")
+                self._out.append('\\"' + held)
+        elif self._held_kind == "comma":
+            if char in WHITESPACE:
+                self._held += char
+                return
+            held, self._held, self._held_kind = self._held, "", None
+            if char in "}]":
+                self._fix("trailing_commas")
+                self._out.append(held[1:])
+            else:
+                self._out.append(held)
+
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._held_kind = "quote"
+                return
+            elif char < " ":
+                self._fix("control_chars")
+                char = CONTROL_CHAR_ESCAPES.get(char, f"\\u{ord(char):04x}")
+            self._out.append(char)
+            return
+
+        between_elements = self.stream_array and len(self._stack) == 1
+
+        if char in "{[":
+            if between_elements:
+                self._out = []
+            self._stack.append(char)
+            self._out.append(char)
+            self._mark_safe()
+        elif char in "}]":
+            if between_elements:
+                if char == "]":
+                    self.complete = True
+                return
+            self._stack.pop()
+            self._out.append(char)
+            if not self._stack:
+                self.complete = True
+            elif self.stream_array and len(self._stack) == 1:
+                item = self._decode_element("".join(self._out))
+                if item is not None:
+                    items.append(item)
+            self._mark_safe()
+        elif between_elements:
+            # Separators (and stray tokens) between top-level elements
+            return
+        elif char == '"':
+            self._in_string = True
+            self._out.append(char)
+        elif char == ",":
+            self._mark_safe()
+            self._held_kind = "comma"
+            self._held = char
+        else:
+            self._out.append(char)
+
+    def _mark_safe(self):
+        self._safe = (len(self._out), tuple(self._stack))
+
+    def _decode_element(self, text: str) -> Optional[Any]:
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            self.skipped += 1
+            print(f"[JSON Repair] Skipped malformed element ({e.msg}): {text[:200]}", flush=True)
+            return None
+
+    def finish(self) -> str:
+        """
+        Signal the end of the input. Returns the repaired text (not used in
+        stream_array mode, where an unfinished element is simply dropped).
+        """
+        if self.complete or not self.started:
+            return "".join(self._out)
+
+        self._fix("truncated")
+        if self.stream_array:
+            return ""
+
+        # Cut back to the last complete value and close everything still open
+        length, stack = self._safe
+        closing = "".join(CLOSERS[opener] for opener in reversed(stack))
+        return "".join(self._out[:length]) + closing
+
+
+class JSONArrayStreamParser(JSONRepairParser):
+    """Incremental parser for the JSON array of objects that LLMs return"""
+
+    def __init__(self):
+        super().__init__(stream_array=True)
+
+
+def repair_json(text: str) -> Tuple[Any, Dict[str, int]]:
+    """
+    Repair and decode a complete LLM response in one pass.
+
+    Returns:
+        (decoded value, fixes applied)
+    Raises:
+        ValueError when the text contains no JSON object or array,
+        json.JSONDecodeError when it cannot be repaired
+    """
+    parser = JSONRepairParser()
+    parser.feed(text)
+    if not parser.started:
+        raise ValueError("Response does not contain a JSON object or array")
+    return json.loads(parser.finish()), parser.fixes
@@ -5,6 +5,7 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, StreamingResponse
 from contextlib import asynccontextmanager
+import asyncio
 import os
 from dotenv import load_dotenv
 import httpx
@@ -65,11 +66,32 @@ async def lifespan(app: FastAPI):
     os.makedirs(upload_dir, exist_ok=True)
     print(f"📁 Upload directory: {upload_dir}")
 
+    # Start the ingestion worker loop (drains queued document jobs) unless
+    # ingestion is delegated to standalone `python -m worker` processes
+    from routers.exam import run_ingestion_job
+    from services.ingestion_queue import ingestion_queue
+    from services.document_parser import document_parser
+    from services.llm_cache import llm_cache
+    from services.llm_clients import llm_clients
+
+    app.state.ingestion_worker = None
+    if os.getenv("INGEST_IN_PROCESS_WORKER", "true").lower() == "true":
+        app.state.ingestion_worker = asyncio.create_task(ingestion_queue.run(run_ingestion_job))
+    else:
+        print("📦 Ingestion is handled by standalone worker processes")
+
     print("✅ Application started successfully!")
 
     yield
 
     # Shutdown
+    if app.state.ingestion_worker:
+        await ingestion_queue.stop()
+        app.state.ingestion_worker.cancel()
+        await asyncio.gather(app.state.ingestion_worker, return_exceptions=True)
+    document_parser.shutdown()
+    await llm_cache.close()
+    await llm_clients.close()
     await app.state.frontend_client.aclose()
     print("👋 Shutting down QQuiz Application...")
 
@@ -8,7 +8,7 @@ from sqlalchemy import (
     ForeignKey, Text, JSON, Index, Enum
 )
 from sqlalchemy.orm import relationship, declarative_base
-from sqlalchemy.sql import func
+from sqlalchemy.sql import false, func
 
 Base = declarative_base()
 
@@ -21,6 +21,20 @@ class ExamStatus(str, PyEnum):
     FAILED = "failed"
 
 
+class IngestionJobStatus(str, PyEnum):
+    """Ingestion job lifecycle status"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class ChunkStatus(str, PyEnum):
+    """Per-chunk extraction checkpoint status"""
+    DONE = "done"
+    FAILED = "failed"
+
+
 class QuestionType(str, PyEnum):
     """Question types"""
     SINGLE = "single"      # 单选
@@ -75,6 +89,8 @@ class Exam(Base):
     # Relationships
     user = relationship("User", back_populates="exams")
     questions = relationship("Question", back_populates="exam", cascade="all, delete-orphan")
+    ingestion_jobs = relationship("IngestionJob", back_populates="exam", cascade="all, delete-orphan")
+    ingestion_chunks = relationship("IngestionChunk", back_populates="exam", cascade="all, delete-orphan")
 
     # Indexes
     __table_args__ = (
@@ -96,6 +112,7 @@ class Question(Base):
     options = Column(JSON, nullable=True)  # For single/multiple choice: ["A. Option1", "B. Option2", ...]
     answer = Column(Text, nullable=False)
     analysis = Column(Text, nullable=True)
+    answer_pending = Column(Boolean, default=False, server_default=false(), nullable=False)  # AI reference answer not generated yet (lazy mode)
     content_hash = Column(String(32), nullable=False, index=True)  # MD5 hash for deduplication
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
@@ -112,6 +129,90 @@ class Question(Base):
         return f"<Question(id={self.id}, type={self.type}, hash={self.content_hash[:8]}...)>"
 
 
+class IngestionJob(Base):
+    """Durable document ingestion job (parsed by a worker that holds a lease)"""
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    exam_id = Column(Integer, ForeignKey("exams.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    filename = Column(String(255), nullable=False)
+    file_path = Column(String(500), nullable=False)  # Uploaded document stored under UPLOAD_DIR
+    is_random = Column(Boolean, default=False, nullable=False)
+    status = Column(Enum(IngestionJobStatus), default=IngestionJobStatus.QUEUED, nullable=False, index=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=3, nullable=False)
+    lease_owner = Column(String(100), nullable=True)  # Worker currently holding the job
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    progress = Column(JSON, nullable=True)  # Latest ProgressUpdate snapshot, for SSE in other processes
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Relationships
+    exam = relationship("Exam", back_populates="ingestion_jobs")
+
+    # Indexes for claiming the next runnable job
+    __table_args__ = (
+        Index('ix_ingestion_jobs_status_lease', 'status', 'lease_expires_at'),
+    )
+
+    def __repr__(self):
+        return f"<IngestionJob(id={self.id}, exam_id={self.exam_id}, status={self.status}, attempts={self.attempts})>"
+
+
+class IngestionChunk(Base):
+    """Checkpoint of one document chunk's extraction result, used to resume failed ingestions"""
+    __tablename__ = "ingestion_chunks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    exam_id = Column(Integer, ForeignKey("exams.id", ondelete="CASCADE"), nullable=False)
+    document_hash = Column(String(64), nullable=False)  # SHA-256 of the uploaded file
+    chunk_index = Column(Integer, nullable=False)
+    chunk_hash = Column(String(64), nullable=False)  # SHA-256 of the chunk content/identity
+    status = Column(Enum(ChunkStatus), nullable=False)
+    questions = Column(JSON, nullable=True)  # Extracted question dicts (status=done)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=1, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    # Relationships
+    exam = relationship("Exam", back_populates="ingestion_chunks")
+
+    # One checkpoint per chunk of a document within an exam
+    __table_args__ = (
+        Index('ix_ingestion_chunks_key', 'exam_id', 'document_hash', 'chunk_index', unique=True),
+    )
+
+    def __repr__(self):
+        return f"<IngestionChunk(exam_id={self.exam_id}, chunk={self.chunk_index}, status={self.status})>"
+
+
+class ExtractionCache(Base):
+    """Extracted questions shared across exams, keyed by content hash + provider + model + prompt version"""
+    __tablename__ = "extraction_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String(64), unique=True, nullable=False, index=True)  # SHA-256 of the key parts
+    kind = Column(String(20), nullable=False)  # document
+    content_hash = Column(String(64), nullable=False)  # SHA-256 of the file bytes
+    provider = Column(String(50), nullable=False)
+    model = Column(String(100), nullable=False)
+    prompt_version = Column(String(20), nullable=False)
+    questions = Column(JSON, nullable=False)  # Extracted question dicts
+    question_count = Column(Integer, default=0, nullable=False)
+    hits = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<ExtractionCache(kind={self.kind}, provider={self.provider}, model={self.model}, questions={self.question_count})>"
+
+
 class UserMistake(Base):
     """User mistake records (错题本)"""
     __tablename__ = "user_mistakes"
@@ -11,6 +11,8 @@ from datetime import datetime, timedelta
 from passlib.context import CryptContext
 import io
 import json
+import os
+import re
 
 from database import get_db, engine
 from models import User, SystemConfig, Exam, Question, UserMistake, ExamStatus
@@ -20,6 +22,11 @@ from schemas import (
     UserPasswordResetRequest, AdminUserSummary
 )
 from services.auth_service import get_current_admin_user
+from services.llm_cache import llm_cache
+from services.llm_clients import llm_clients
+from services.llm_resilience import llm_resilience
+from services.llm_scheduler import llm_scheduler
+from services.config_service import config_cache
 
 router = APIRouter()
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -53,17 +60,21 @@ async def get_system_config(
     result = await db.execute(select(SystemConfig))
     configs = {config.key: config.value for config in result.scalars().all()}
 
-    # Mask API keys (show only first 10 and last 4 characters)
-    def mask_api_key(key):
-        if not key or len(key) < 20:
-            return key
-        return f"{key[:10]}...{key[-4:]}"
+    # Mask API keys (show only first 10 and last 4 characters of each key)
+    def mask_api_key(value):
+        if not value:
+            return value
+        keys = [key for key in re.split(r"[,\s]+", value) if key]
+        return ",".join(key if len(key) < 20 else f"{key[:10]}...{key[-4:]}" for key in keys)
 
     return {
         "allow_registration": configs.get("allow_registration", "true").lower() == "true",
         "max_upload_size_mb": int(configs.get("max_upload_size_mb", "10")),
         "max_daily_uploads": int(configs.get("max_daily_uploads", "20")),
+        "ingest_max_jobs_per_user": int(configs.get("ingest_max_jobs_per_user", "1")),
+        "ingest_max_chunks_per_user": int(configs.get("ingest_max_chunks_per_user", "0")),
         "ai_provider": configs.get("ai_provider", "gemini"),
+        "fallback_ai_provider": configs.get("fallback_ai_provider", os.getenv("FALLBACK_AI_PROVIDER", "")),
         # API Configuration
         "openai_api_key": mask_api_key(configs.get("openai_api_key")),
         "openai_base_url": configs.get("openai_base_url", "https://api.openai.com/v1"),
@@ -107,7 +118,9 @@ async def update_system_config(
             )
             db.add(new_config)
 
+    await config_cache.bump_version(db)
     await db.commit()
+    config_cache.invalidate()
 
     # Return updated config
     return await get_system_config(current_admin, db)
@@ -436,6 +449,7 @@ async def get_system_health(
     系统健康检查
     - 数据库连接状态
     - 数据库大小（SQLite）
+    - LLM 响应缓存命中率与大小
     - 系统信息
     """
     import os
@@ -468,6 +482,11 @@ async def get_system_health(
     except Exception as e:
         health_status["database"]["size_error"] = str(e)
 
+    health_status["llm_cache"] = await llm_cache.stats()
+    health_status["llm_clients"] = llm_clients.stats()
+    health_status["llm_resilience"] = llm_resilience.stats()
+    health_status["llm_scheduler"] = llm_scheduler.stats()
+
     return health_status
 
 
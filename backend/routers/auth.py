@@ -8,11 +8,12 @@ from datetime import timedelta
 import logging
 
 from database import get_db
-from models import User, SystemConfig
+from models import User
 from schemas import UserCreate, UserLogin, Token, UserResponse
 from utils import hash_password, verify_password, create_access_token
 from rate_limit import limiter
 from services.auth_service import get_current_user
+from services.config_service import config_cache
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -26,12 +27,9 @@ async def register(
     """Register a new user"""
 
     # Check if registration is allowed
-    result = await db.execute(
-        select(SystemConfig).where(SystemConfig.key == "allow_registration")
-    )
-    config = result.scalar_one_or_none()
+    settings = await config_cache.get(db)
 
-    if config and config.value.lower() == "false":
+    if not settings.allow_registration:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Registration is currently disabled"
@@ -1,34 +1,48 @@
 """
 Exam Router - Handles exam creation, file upload, and deduplication
 """
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, BackgroundTasks, Request
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Request
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, case
-from typing import List, Optional
+from sqlalchemy import select, func, and_, case, insert, update, delete
+from typing import Awaitable, Callable, List, Optional
 from datetime import datetime, timedelta
 import os
 import aiofiles
 import json
 import magic
 import random
+import time
+import uuid
 
 from database import get_db
-from models import User, Exam, Question, ExamStatus, SystemConfig
+from models import User, Exam, Question, ExamStatus, IngestionJob, IngestionJobStatus, IngestionChunk
 from schemas import (
     ExamCreate, ExamResponse, ExamListResponse,
     ExamUploadResponse, ParseResult, QuizProgressUpdate, ExamSummaryResponse
 )
 from services.auth_service import get_current_user
 from services.document_parser import document_parser
-from services.llm_service import LLMService
-from services.config_service import load_llm_config
+from services.llm_service import LLMService, NoQuestionsFoundError, ParsedQuestions
+from services.config_service import config_cache, load_llm_config
 from services.progress_service import progress_service
-from utils import is_allowed_file, calculate_content_hash
+from services.rule_parser import rule_parser
+from services.extraction_cache import extraction_cache, DOCUMENT_KIND, CHUNK_KIND
+from services.ingestion_queue import ingestion_queue, LeaseLostError
+from services.fair_dispatcher import fair_dispatcher
+from services.answer_service import (
+    generate_ai_reference_answers, reference_answer_service, AI_ANSWER_PREFIX, PENDING_ANSWER, MISSING_ANSWER
+)
+from services.checkpoint_service import (
+    ChunkCheckpoints, calculate_file_hash, calculate_chunk_hash, count_checkpoints
+)
+from utils import is_allowed_file, calculate_content_hash, get_file_extension
 from dedup_utils import is_duplicate_question
+from concurrency_utils import iter_ordered_bounded, get_chunk_concurrency, get_env_int
 from rate_limit import limiter
 
 router = APIRouter()
+DEFAULT_INSERT_BATCH_SIZE = 1000
 ALLOWED_MIME_TYPES = {
     "text/plain",
     "application/pdf",
@@ -79,29 +93,35 @@ async def validate_upload_file(file: UploadFile) -> None:
         )
 
 
-async def check_upload_limits(user_id: int, file_size: int, db: AsyncSession):
-    """Check if user has exceeded upload limits"""
+# Uploads are streamed to disk in blocks of this size instead of being read into memory
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
-    # Get max upload size config
-    result = await db.execute(
-        select(SystemConfig).where(SystemConfig.key == "max_upload_size_mb")
-    )
-    config = result.scalar_one_or_none()
-    max_size_mb = int(config.value) if config else 10
 
-    # Check file size
-    if file_size > max_size_mb * 1024 * 1024:
+async def check_upload_limits(user_id: int, db: AsyncSession, request: Optional[Request] = None) -> int:
+    """
+    Check if user has exceeded upload limits.
+
+    A request whose Content-Length already exceeds the size cap is rejected
+    before any of the body is stored.
+
+    Returns:
+        Maximum upload size in bytes, enforced again while the file is streamed
+    """
+
+    settings = await config_cache.get(db)
+    max_size_mb = settings.max_upload_size_mb
+    max_size = max_size_mb * 1024 * 1024
+
+    # Check declared request size
+    content_length = request.headers.get("content-length") if request else None
+    if content_length and content_length.isdigit() and int(content_length) > max_size + UPLOAD_CHUNK_SIZE:
+        # Allow one block of slack for multipart boundaries and form fields
         raise HTTPException(
             status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
             detail=f"File size exceeds limit of {max_size_mb}MB"
         )
 
-    # Get max daily uploads config
-    result = await db.execute(
-        select(SystemConfig).where(SystemConfig.key == "max_daily_uploads")
-    )
-    config = result.scalar_one_or_none()
-    max_daily = int(config.value) if config else 20
+    max_daily = settings.max_daily_uploads
 
     # Check daily upload count
     today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
@@ -121,84 +141,91 @@ async def check_upload_limits(user_id: int, file_size: int, db: AsyncSession):
             detail=f"Daily upload limit of {max_daily} reached"
         )
 
+    return max_size
+
 
-async def generate_ai_reference_answer(
-    llm_service,
-    question_content: str,
-    question_type: str,
-    options: Optional[List[str]] = None
-) -> str:
+async def store_upload(file: UploadFile, max_size: int) -> str:
     """
-    Generate an AI reference answer for a question without a provided answer.
+    Stream an uploaded document to UPLOAD_DIR so a queued job can outlive the request.
 
-    Args:
-        llm_service: LLM service instance
-        question_content: The question text
-        question_type: Type of question (single, multiple, judge, short)
-        options: Question options (for choice questions)
+    The file is copied block by block into a temporary file and aborted as soon
+    as it grows past `max_size`. Every upload gets its own stored file, owned by
+    the job it is queued with, so finishing one job never removes another's.
 
     Returns:
-        Generated answer text
+        Path of the stored file
     """
-    # Build prompt based on question type
-    if question_type in ["single", "multiple"] and options:
-        options_text = "\n".join(options)
-        q_type_text = '单选题' if question_type == 'single' else '多选题'
-        prompt = f"""这是一道{q_type_text}，但文档中没有提供答案。请根据题目内容，推理出最可能的正确答案。
+    upload_dir = os.getenv("UPLOAD_DIR", "./uploads")
+    os.makedirs(upload_dir, exist_ok=True)
 
-题目：{question_content}
+    upload_id = uuid.uuid4().hex
+    temp_path = os.path.join(upload_dir, f".{upload_id}.part")
+    size = 0
 
-选项：
-{options_text}
+    try:
+        async with aiofiles.open(temp_path, "wb") as f:
+            while True:
+                block = await file.read(UPLOAD_CHUNK_SIZE)
+                if not block:
+                    break
 
-请只返回你认为正确的选项字母（如 A 或 AB），不要有其他解释。如果无法确定，请返回"无法确定"。"""
-    elif question_type == "judge":
-        prompt = f"""这是一道判断题，但文档中没有提供答案。请根据题目内容，判断正误。
+                size += len(block)
+                if size > max_size:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"File size exceeds limit of {max_size // (1024 * 1024)}MB"
+                    )
 
-题目：{question_content}
+                await f.write(block)
 
-请只返回"对"或"错"，不要有其他解释。如果无法确定，请返回"无法确定"。"""
-    else:  # short answer
-        prompt = f"""这是一道简答题，但文档中没有提供答案。请根据题目内容，给出一个简洁的参考答案（50字以内）。
+        file_path = os.path.join(upload_dir, f"{upload_id}.{get_file_extension(file.filename)}")
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
 
-题目：{question_content}
+    return file_path
 
-请直接返回答案内容，不要有"答案："等前缀。如果无法回答，请返回"无法确定"。"""
 
-    # Generate answer using LLM
-    if llm_service.provider == "gemini":
-        # Use REST API for Gemini
-        url = f"{llm_service.gemini_base_url}/v1beta/models/{llm_service.model}:generateContent"
-        headers = {"Content-Type": "application/json"}
-        params = {"key": llm_service.gemini_api_key}
-        payload = {
-            "contents": [{
-                "parts": [{"text": prompt}]
-            }]
-        }
+def discard_upload(file_path: str):
+    """Remove a stored upload once no job will read it"""
+    try:
+        os.remove(file_path)
+    except OSError as e:
+        print(f"[Upload] ⚠️ Could not remove stored upload {file_path}: {e}", flush=True)
 
-        response = await llm_service.client.post(url, headers=headers, params=params, json=payload)
-        response.raise_for_status()
-        response_data = response.json()
-        return response_data["candidates"][0]["content"]["parts"][0]["text"].strip()
-    elif llm_service.provider == "anthropic":
-        response = await llm_service.client.messages.create(
-            model=llm_service.model,
-            max_tokens=256,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return response.content[0].text.strip()
-    else:  # OpenAI or Qwen
-        response = await llm_service.client.chat.completions.create(
-            model=llm_service.model,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that provides concise answers."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=256
-        )
-        return response.choices[0].message.content.strip()
+
+async def extract_questions_from_text(llm_service, content: str, on_question=None) -> ParsedQuestions:
+    """
+    Extract questions from one piece of text; content without questions yields [].
+
+    Well-structured questions are parsed locally by the rule parser; only the
+    blocks it cannot handle (or the whole text, when it is not confident) go
+    to the LLM, whose streamed questions are passed to `on_question` as they arrive.
+    """
+    questions: List[dict] = []
+    remaining = content
+
+    if rule_parser.is_enabled():
+        result = rule_parser.parse(content)
+        print(
+            f"[Rule Parser] {len(result.questions)}/{result.candidate_blocks} blocks parsed, "
+            f"coverage {result.coverage:.0%}, confidence {result.confidence:.0%}",
+            flush=True
+        )
+        if result.questions and result.confidence >= rule_parser.get_min_confidence():
+            questions = result.questions
+            remaining = result.unparsed_text
+
+    if not remaining.strip():
+        return ParsedQuestions(questions)
+
+    try:
+        llm_questions = await llm_service.parse_document(remaining, on_question=on_question)
+    except NoQuestionsFoundError:
+        return ParsedQuestions(questions)
+    return ParsedQuestions(questions + llm_questions, complete=llm_questions.complete)
 
 
 async def process_questions_with_dedup(
@@ -206,7 +233,8 @@ async def process_questions_with_dedup(
     questions_data: List[dict],
     db: AsyncSession,
     llm_service=None,
-    is_random: bool = False
+    is_random: bool = False,
+    before_commit: Optional[Callable[[AsyncSession], Awaitable[None]]] = None
 ) -> ParseResult:
     """
     Process parsed questions with fuzzy deduplication logic.
@@ -220,6 +248,8 @@ async def process_questions_with_dedup(
         questions_data: List of question dicts from LLM parsing
         db: Database session
         llm_service: LLM service instance for generating AI answers
+        before_commit: Awaited with the session right before the questions are
+            committed (the ingestion queue confirms the job's lease there)
 
     Returns:
         ParseResult with statistics
@@ -244,7 +274,8 @@ async def process_questions_with_dedup(
         print(f"[Dedup] Random mode enabled - shuffling {len(questions_data)} questions before saving")
         random.shuffle(questions_data)
 
-    # Insert only new questions
+    # Keep only new questions
+    new_questions: List[dict] = []
     for q_data in questions_data:
         content_hash = q_data.get("content_hash")
 
@@ -259,53 +290,69 @@ async def process_questions_with_dedup(
             duplicates_removed += 1
             continue
 
-        # Handle missing answers - generate AI reference answer
-        answer = q_data.get("answer")
-        if (answer is None or answer == "null" or answer == "") and llm_service:
-            print(f"[Question] Generating AI reference answer for: {q_data['content'][:50]}...", flush=True)
-            try:
-                # Convert question type to string if it's not already
-                q_type = q_data["type"]
-                if hasattr(q_type, 'value'):
-                    q_type = q_type.value
-                elif isinstance(q_type, str):
-                    q_type = q_type.lower()
-
-                ai_answer = await generate_ai_reference_answer(
-                    llm_service,
-                    q_data["content"],
-                    q_type,
-                    q_data.get("options")
-                )
-                answer = f"AI参考答案：{ai_answer}"
-                ai_answers_generated += 1
-                print(f"[Question] ✅ AI answer generated: {ai_answer[:50]}...", flush=True)
-            except Exception as e:
-                print(f"[Question] ⚠️ Failed to generate AI answer: {e}", flush=True)
-                answer = "（答案未提供）"
-        elif answer is None or answer == "null" or answer == "":
-            answer = "（答案未提供）"
-
-        # Create new question
-        new_question = Question(
-            exam_id=exam_id,
-            content=q_data["content"],
-            type=q_data["type"],
-            options=q_data.get("options"),
-            answer=answer,
-            analysis=q_data.get("analysis"),
-            content_hash=content_hash
-        )
-        db.add(new_question)
+        new_questions.append(q_data)
         existing_hashes.add(content_hash)  # Prevent exact duplicates in current batch
         existing_questions.append({"content": q_data["content"]})  # Prevent fuzzy duplicates in current batch
-        new_added += 1
 
+    # Generate AI reference answers for questions without one, batched and
+    # concurrently, before touching the session. In lazy mode they are only
+    # marked pending and generated when first needed.
+    missing_answers = [
+        q_data for q_data in new_questions
+        if q_data.get("answer") is None or q_data.get("answer") in ("null", "")
+    ]
+    answers_pending = bool(missing_answers and llm_service and reference_answer_service.is_lazy())
+    if answers_pending:
+        print(f"[Question] Deferring AI reference answers for {len(missing_answers)} questions", flush=True)
+    elif missing_answers and llm_service:
+        print(f"[Question] Generating AI reference answers for {len(missing_answers)} questions...", flush=True)
+        ai_answers = await generate_ai_reference_answers(llm_service, missing_answers)
+        for q_data, ai_answer in zip(missing_answers, ai_answers):
+            if ai_answer:
+                q_data["answer"] = f"{AI_ANSWER_PREFIX}{ai_answer}"  # Kept for the extraction cache
+                ai_answers_generated += 1
+        print(f"[Question] ✅ {ai_answers_generated}/{len(missing_answers)} AI answers generated", flush=True)
+
+    rows = []
+    for q_data in new_questions:
+        answer = q_data.get("answer")
+        pending = False
+        if answer is None or answer == "null" or answer == "":
+            pending = answers_pending
+            answer = PENDING_ANSWER if pending else MISSING_ANSWER
+
+        rows.append({
+            "exam_id": exam_id,
+            "content": q_data["content"],
+            "type": q_data["type"],
+            "options": q_data.get("options"),
+            "answer": answer,
+            "analysis": q_data.get("analysis"),
+            "answer_pending": pending,
+            "content_hash": q_data.get("content_hash")
+        })
+
+    # Core executemany inserts in batches instead of one ORM object per question
+    batch_size = get_env_int("QUESTION_INSERT_BATCH_SIZE", DEFAULT_INSERT_BATCH_SIZE, minimum=1)
+    for start in range(0, len(rows), batch_size):
+        await db.execute(insert(Question), rows[start:start + batch_size])
+    new_added = len(rows)
+
+    if new_added:
+        await db.execute(
+            update(Exam)
+            .where(Exam.id == exam_id)
+            .values(total_questions=Exam.total_questions + new_added)
+        )
+    if before_commit:
+        await before_commit(db)
     await db.commit()
 
     message = f"Parsed {total_parsed} questions, removed {duplicates_removed} duplicates, added {new_added} new questions"
     if ai_answers_generated > 0:
         message += f", generated {ai_answers_generated} AI reference answers"
+    elif answers_pending:
+        message += f", deferred {len(missing_answers)} AI reference answers"
 
     return ParseResult(
         total_parsed=total_parsed,
@@ -317,14 +364,19 @@ async def process_questions_with_dedup(
 
 async def async_parse_and_save(
     exam_id: int,
-    file_content: bytes,
+    file_path: str,
     filename: str,
     db_url: str,
-    is_random: bool = False
+    is_random: bool = False,
+    before_commit: Optional[Callable[[AsyncSession], Awaitable[None]]] = None
 ):
     """
-    Background task to parse document and save questions with deduplication.
-    Sends real-time progress updates via SSE.
+    Parse the stored document at `file_path` and save questions with deduplication.
+    Sends real-time progress updates via SSE. `before_commit` guards the commits
+    of the results (see process_questions_with_dedup).
+
+    Returns:
+        True if the exam reached READY, False if processing failed
     """
     from database import AsyncSessionLocal
     from sqlalchemy import select
@@ -336,6 +388,7 @@ async def async_parse_and_save(
             result = await db.execute(select(Exam).where(Exam.id == exam_id))
             exam = result.scalar_one()
             exam.status = ExamStatus.PROCESSING
+            user_id = exam.user_id
             await db.commit()
 
             # Send initial progress
@@ -350,6 +403,12 @@ async def async_parse_and_save(
             llm_config = await load_llm_config(db)
             llm_service = LLMService(config=llm_config)
 
+            # Chunks share the process-wide slots round-robin with other users' jobs
+            max_chunks_per_user = (await config_cache.get(db)).ingest_max_chunks_per_user
+
+            def chunk_slot():
+                return fair_dispatcher.slot(user_id, max_chunks_per_user)
+
             # Check if file is PDF and provider is Gemini
             is_pdf = filename.lower().endswith('.pdf')
             is_gemini = llm_config.get('ai_provider') == 'gemini'
@@ -358,11 +417,36 @@ async def async_parse_and_save(
             print(f"[Exam {exam_id}] File type: {'PDF' if is_pdf else 'Text-based'}", flush=True)
             print(f"[Exam {exam_id}] AI Provider: {llm_config.get('ai_provider')}", flush=True)
 
+            # Per-chunk checkpoints: a retried ingestion only re-runs missing or failed chunks
+            document_hash = await calculate_file_hash(file_path)
+            checkpoints = ChunkCheckpoints(exam_id, document_hash)
+            restored_chunks = await checkpoints.load()
+            if restored_chunks:
+                print(f"[Exam {exam_id}] Resuming with {restored_chunks} checkpointed chunks", flush=True)
+
+            # Identical documents (by content, provider, model and prompt version)
+            # reuse the questions extracted the first time
+            cached_questions = await extraction_cache.get(
+                DOCUMENT_KIND, document_hash, llm_service.provider, llm_service.model
+            )
+
             try:
-                if is_pdf and is_gemini:
+                if cached_questions is not None:
+                    print(f"[Exam {exam_id}] Extraction cache hit: reusing {len(cached_questions)} questions", flush=True)
+
+                    await progress_service.update_progress(ProgressUpdate(
+                        exam_id=exam_id,
+                        status=ProgressStatus.DEDUPLICATING,
+                        message=f"该文档已解析过，直接复用 {len(cached_questions)} 个题目",
+                        progress=75.0,
+                        questions_extracted=len(cached_questions)
+                    ))
+
+                    questions_data = cached_questions
+                elif is_pdf and is_gemini:
                     # Use Gemini's native PDF processing
                     print(f"[Exam {exam_id}] Using Gemini native PDF processing", flush=True)
-                    print(f"[Exam {exam_id}] PDF file size: {len(file_content)} bytes", flush=True)
+                    print(f"[Exam {exam_id}] PDF file size: {os.path.getsize(file_path)} bytes", flush=True)
 
                     await progress_service.update_progress(ProgressUpdate(
                         exam_id=exam_id,
@@ -371,7 +455,16 @@ async def async_parse_and_save(
                         progress=10.0
                     ))
 
-                    questions_data = await llm_service.parse_document_with_pdf(file_content, filename, exam_id)
+                    async with aiofiles.open(file_path, "rb") as f:
+                        file_content = await f.read()
+
+                    questions_data = await llm_service.parse_document_with_pdf(
+                        file_content,
+                        filename,
+                        exam_id,
+                        checkpoints=checkpoints,
+                        chunk_slot=chunk_slot
+                    )
                 else:
                     # Extract text first, then parse
                     if is_pdf:
@@ -385,94 +478,163 @@ async def async_parse_and_save(
                     ))
 
                     print(f"[Exam {exam_id}] Extracting text from document...", flush=True)
-                    text_content = await document_parser.parse_file(file_content, filename)
-
-                    if not text_content or len(text_content.strip()) < 10:
-                        raise Exception("Document appears to be empty or too short")
-
-                    print(f"[Exam {exam_id}] Text content length: {len(text_content)} chars", flush=True)
 
-                    # Check if document is too long and needs splitting
-                    if len(text_content) > 5000:
-                        text_chunks = document_parser.split_text_with_overlap(text_content, chunk_size=3000, overlap=1000)
-                        total_chunks = len(text_chunks)
-
-                        print(f"[Exam {exam_id}] Document is long, splitting into chunks...", flush=True)
-                        print(f"[Exam {exam_id}] Split into {total_chunks} chunks", flush=True)
+                    # Pages/paragraphs are extracted incrementally and chunked lazily,
+                    # so the first chunk reaches the LLM before extraction finishes.
+                    # Documents up to 5000 chars are still sent as a single chunk.
+                    text_stream = document_parser.stream_stored_file(file_path, filename)
+                    emitted_chunks = 0
 
+                    if os.getenv("PARSE_CHUNK_STRATEGY", "questions").lower() == "fixed":
+                        chunk_stream = document_parser.iter_text_chunks(
+                            text_stream, chunk_size=3000, overlap=1000, single_chunk_limit=5000
+                        )
+                    else:
+                        # Pack whole questions into chunks instead of overlapping windows
+                        chunk_stream = document_parser.iter_question_chunks(
+                            text_stream, max_chunk_size=3000, overlap=1000, single_chunk_limit=5000
+                        )
+
+                    async def document_chunks():
+                        nonlocal emitted_chunks
+                        async for chunk in chunk_stream:
+                            if emitted_chunks == 0:
+                                if len(chunk.strip()) < 10:
+                                    raise Exception("Document appears to be empty or too short")
+                                print(f"[Exam {exam_id}] Document content preview:\n{chunk[:500]}\n{'...' if len(chunk) > 500 else ''}", flush=True)
+                            emitted_chunks += 1
+                            yield chunk
+
+                    def estimated_total_chunks() -> int:
+                        """Exact once extraction has finished, extrapolated from extraction progress before that"""
+                        if text_stream.exhausted or text_stream.fraction_done <= 0:
+                            return max(1, emitted_chunks)
+                        return max(emitted_chunks, round(emitted_chunks / text_stream.fraction_done))
+
+                    all_questions = []
+                    streamed_questions = 0
+                    last_stream_report = 0.0
+                    chunk_progress = 15.0
+                    chunk_counts = (0, 0)  # (completed, estimated total) at the last chunk report
+                    concurrency = get_chunk_concurrency()
+                    print(f"[Exam {exam_id}] Processing up to {concurrency} chunks concurrently", flush=True)
+
+                    cached_chunks = 0
+                    chunks_complete = True
+
+                    async def extract_chunk_questions(chunk_idx: int, chunk: str, chunk_hash: str) -> List[dict]:
+                        """Reuse questions previously extracted from identical chunk text (e.g. an edited re-upload)"""
+                        nonlocal cached_chunks
+                        chunk_questions = await extraction_cache.get(
+                            CHUNK_KIND, chunk_hash, llm_service.provider, llm_service.model
+                        )
+                        if chunk_questions is not None:
+                            cached_chunks += 1
+                            print(f"[Exam {exam_id}] Chunk {chunk_idx + 1} unchanged, reusing {len(chunk_questions)} cached questions", flush=True)
+                            return chunk_questions
+
+                        async with chunk_slot():
+                            chunk_questions = await extract_questions_from_text(
+                                llm_service, chunk, on_question=report_streamed_question
+                            )
+                        if chunk_questions.complete:
+                            # A cut-off response is used once but not memoized
+                            await extraction_cache.put(
+                                CHUNK_KIND, chunk_hash, llm_service.provider, llm_service.model, chunk_questions
+                            )
+                        return chunk_questions
+
+                    async def extract_chunk(chunk_idx: int, chunk: str) -> List[dict]:
+                        print(f"[Exam {exam_id}] Processing chunk {chunk_idx + 1}...", flush=True)
+                        chunk_hash = calculate_chunk_hash(chunk)
+                        return await checkpoints.run(
+                            chunk_idx,
+                            chunk_hash,
+                            lambda: extract_chunk_questions(chunk_idx, chunk, chunk_hash)
+                        )
+
+                    async def report_streamed_question(question: dict):
+                        """Live count while responses are still streaming (at most one update per second)"""
+                        nonlocal streamed_questions, last_stream_report
+                        streamed_questions += 1
+                        now = time.monotonic()
+                        if now - last_stream_report < 1.0:
+                            return
+                        last_stream_report = now
                         await progress_service.update_progress(ProgressUpdate(
                             exam_id=exam_id,
-                            status=ProgressStatus.SPLITTING,
-                            message=f"文档已拆分为 {total_chunks} 个部分",
-                            progress=15.0,
-                            total_chunks=total_chunks
+                            status=ProgressStatus.PROCESSING_CHUNK,
+                            message=f"AI 正在识别题目，已识别 {streamed_questions} 个...",
+                            progress=chunk_progress,
+                            total_chunks=chunk_counts[1],
+                            current_chunk=chunk_counts[0],
+                            questions_extracted=max(streamed_questions, len(all_questions))
                         ))
 
-                        all_questions = []
-
-                        for chunk_idx, chunk in enumerate(text_chunks):
-                            current_chunk = chunk_idx + 1
-                            chunk_progress = 15.0 + (60.0 * current_chunk / total_chunks)
-
-                            await progress_service.update_progress(ProgressUpdate(
-                                exam_id=exam_id,
-                                status=ProgressStatus.PROCESSING_CHUNK,
-                                message=f"正在处理第 {current_chunk}/{total_chunks} 部分...",
-                                progress=chunk_progress,
-                                total_chunks=total_chunks,
-                                current_chunk=current_chunk,
-                                questions_extracted=len(all_questions)
-                            ))
-
-                            print(f"[Exam {exam_id}] Processing chunk {current_chunk}/{total_chunks}...", flush=True)
-                            try:
-                                chunk_questions = await llm_service.parse_document(chunk)
-                                print(f"[Exam {exam_id}] Chunk {current_chunk} extracted {len(chunk_questions)} questions", flush=True)
-
-                                # Fuzzy deduplicate across chunks
-                                for q in chunk_questions:
-                                    # Use fuzzy matching to check for duplicates
-                                    if not is_duplicate_question(q, all_questions, threshold=0.85):
-                                        all_questions.append(q)
-                                    else:
-                                        print(f"[Exam {exam_id}] Skipped fuzzy duplicate from chunk {current_chunk}", flush=True)
-
-                            except Exception as chunk_error:
-                                print(f"[Exam {exam_id}] Chunk {chunk_idx + 1} failed: {str(chunk_error)}", flush=True)
-                                continue
-
-                        questions_data = all_questions
-                        print(f"[Exam {exam_id}] Total questions after fuzzy deduplication: {len(questions_data)}", flush=True)
-
+                    async def report_chunk_done(chunk_idx, chunk_questions, chunk_error, completed_chunks):
+                        nonlocal chunk_progress, chunk_counts
+                        total_chunks = estimated_total_chunks()
+                        chunk_progress = 15.0 + (60.0 * min(1.0, completed_chunks / total_chunks))
+                        chunk_counts = (completed_chunks, total_chunks)
                         await progress_service.update_progress(ProgressUpdate(
                             exam_id=exam_id,
-                            status=ProgressStatus.DEDUPLICATING,
-                            message=f"所有部分处理完成，提取了 {len(questions_data)} 个题目",
-                            progress=75.0,
+                            status=ProgressStatus.PROCESSING_CHUNK,
+                            message=(
+                                f"已完成 {completed_chunks}/{total_chunks} 部分..." if text_stream.exhausted
+                                else f"已完成 {completed_chunks} 部分，文档读取中 ({text_stream.fraction_done:.0%})..."
+                            ),
+                            progress=chunk_progress,
                             total_chunks=total_chunks,
-                            current_chunk=total_chunks,
-                            questions_extracted=len(questions_data)
+                            current_chunk=completed_chunks,
+                            questions_extracted=len(all_questions)
                         ))
-                    else:
-                        print(f"[Exam {exam_id}] Document content preview:\n{text_content[:500]}\n{'...' if len(text_content) > 500 else ''}", flush=True)
-                        print(f"[Exam {exam_id}] Calling LLM to extract questions...", flush=True)
 
-                        await progress_service.update_progress(ProgressUpdate(
-                            exam_id=exam_id,
-                            status=ProgressStatus.PARSING,
-                            message="正在提取题目...",
-                            progress=30.0
-                        ))
+                    # Chunks run concurrently but are merged in document order,
+                    # so fuzzy dedup keeps the first occurrence as before.
+                    async for chunk_idx, chunk_questions, chunk_error in iter_ordered_bounded(
+                        document_chunks(),
+                        extract_chunk,
+                        concurrency,
+                        on_complete=report_chunk_done
+                    ):
+                        current_chunk = chunk_idx + 1
+
+                        if chunk_error is not None:
+                            print(f"[Exam {exam_id}] Chunk {current_chunk} failed: {str(chunk_error)}", flush=True)
+                            chunks_complete = False
+                            continue
+                        if not getattr(chunk_questions, "complete", True):
+                            chunks_complete = False
+
+                        print(f"[Exam {exam_id}] Chunk {current_chunk} extracted {len(chunk_questions)} questions", flush=True)
+
+                        # Fuzzy deduplicate across chunks
+                        for q in chunk_questions:
+                            # Use fuzzy matching to check for duplicates
+                            if not is_duplicate_question(q, all_questions, threshold=0.85):
+                                all_questions.append(q)
+                            else:
+                                print(f"[Exam {exam_id}] Skipped fuzzy duplicate from chunk {current_chunk}", flush=True)
+
+                    total_chunks = emitted_chunks
+                    questions_data = ParsedQuestions(all_questions, complete=chunks_complete and checkpoints.complete)
+                    print(f"[Exam {exam_id}] Processed {total_chunks} chunks ({cached_chunks} reused from cache)", flush=True)
+                    print(f"[Exam {exam_id}] Total questions after fuzzy deduplication: {len(questions_data)}", flush=True)
 
-                        questions_data = await llm_service.parse_document(text_content)
+                    await progress_service.update_progress(ProgressUpdate(
+                        exam_id=exam_id,
+                        status=ProgressStatus.DEDUPLICATING,
+                        message=f"所有部分处理完成，提取了 {len(questions_data)} 个题目",
+                        progress=75.0,
+                        total_chunks=total_chunks,
+                        current_chunk=total_chunks,
+                        questions_extracted=len(questions_data)
+                    ))
 
-                        await progress_service.update_progress(ProgressUpdate(
-                            exam_id=exam_id,
-                            status=ProgressStatus.DEDUPLICATING,
-                            message=f"提取了 {len(questions_data)} 个题目",
-                            progress=60.0,
-                            questions_extracted=len(questions_data)
-                        ))
+                if checkpoints.failed_chunks:
+                    raise Exception(
+                        f"{len(checkpoints.failed_chunks)} 个部分解析失败，已完成的部分已保存，可重试继续解析"
+                    )
 
             except Exception as parse_error:
                 print(f"[Exam {exam_id}] ⚠️ Parse error details: {type(parse_error).__name__}", flush=True)
@@ -494,22 +656,29 @@ async def async_parse_and_save(
             ))
 
             print(f"[Exam {exam_id}] Processing questions with deduplication...")
-            parse_result = await process_questions_with_dedup(exam_id, questions_data, db, llm_service, is_random)
+            extracted_questions = list(questions_data)  # Document order (is_random shuffles in place)
+            # Cache hits are complete; fresh results only when no chunk failed or was cut off
+            extraction_complete = cached_questions is not None or getattr(questions_data, "complete", False)
+            parse_result = await process_questions_with_dedup(
+                exam_id, questions_data, db, llm_service, is_random, before_commit
+            )
 
-            # Update exam status and total questions
-            result = await db.execute(select(Exam).where(Exam.id == exam_id))
-            exam = result.scalar_one()
+            if cached_questions is None and extraction_complete:
+                # Stored after processing so generated AI reference answers are reused too
+                await extraction_cache.put(
+                    DOCUMENT_KIND, document_hash, llm_service.provider, llm_service.model, extracted_questions
+                )
 
-            # Get updated question count
-            result = await db.execute(
-                select(func.count(Question.id)).where(Question.exam_id == exam_id)
+            # total_questions was already advanced by the inserted count
+            await db.execute(
+                update(Exam).where(Exam.id == exam_id).values(status=ExamStatus.READY)
             )
-            total_questions = result.scalar()
-
-            exam.status = ExamStatus.READY
-            exam.total_questions = total_questions
+            if before_commit:
+                await before_commit(db)
             await db.commit()
 
+            await checkpoints.clear()
+
             print(f"[Exam {exam_id}] ✅ {parse_result.message}")
 
             # Send completion progress
@@ -523,6 +692,13 @@ async def async_parse_and_save(
                 duplicates_removed=parse_result.duplicates_removed
             ))
 
+            return True
+
+        except LeaseLostError:
+            # Another worker runs the job now; it owns the exam's state
+            await db.rollback()
+            raise
+
         except Exception as e:
             print(f"[Exam {exam_id}] ❌ Error: {str(e)}")
 
@@ -540,12 +716,34 @@ async def async_parse_and_save(
             exam.status = ExamStatus.FAILED
             await db.commit()
 
+            return False
+
+
+async def run_ingestion_job(job: IngestionJob) -> bool:
+    """
+    Ingestion queue handler: run the parsing pipeline on the stored upload.
+    The job's stored file is removed once the exam has been ingested
+    successfully; failed jobs keep it so they can be retried.
+    """
+    succeeded = await async_parse_and_save(
+        job.exam_id,
+        job.file_path,
+        job.filename,
+        os.getenv("DATABASE_URL"),
+        job.is_random,
+        before_commit=lambda db: ingestion_queue.confirm_lease(db, job.id)
+    )
+
+    if succeeded:
+        discard_upload(job.file_path)
+
+    return succeeded
+
 
 @router.post("/create", response_model=ExamUploadResponse, status_code=status.HTTP_201_CREATED)
 @limiter.limit("10/minute")
 async def create_exam_with_upload(
     request: Request,
-    background_tasks: BackgroundTasks,
     title: str = Form(...),
     is_random: bool = Form(False),
     file: UploadFile = File(...),
@@ -554,37 +752,42 @@ async def create_exam_with_upload(
 ):
     """
     Create a new exam and upload the first document.
-    Document will be parsed asynchronously in background.
+    Document is queued as an ingestion job and parsed by a worker.
     """
 
     # Validate file
     await validate_upload_file(file)
 
-    # Read file content
-    file_content = await file.read()
-
     # Check upload limits
-    await check_upload_limits(current_user.id, len(file_content), db)
+    max_upload_size = await check_upload_limits(current_user.id, db, request)
 
-    # Create exam
-    new_exam = Exam(
-        user_id=current_user.id,
-        title=title,
-        status=ExamStatus.PENDING
-    )
-    db.add(new_exam)
-    await db.commit()
-    await db.refresh(new_exam)
+    # Stream file to disk (rejected as soon as it exceeds the size limit)
+    file_path = await store_upload(file, max_upload_size)
 
-    # Start background parsing
-    background_tasks.add_task(
-        async_parse_and_save,
-        new_exam.id,
-        file_content,
-        file.filename,
-        os.getenv("DATABASE_URL"),
-        is_random
-    )
+    try:
+        # Create exam
+        new_exam = Exam(
+            user_id=current_user.id,
+            title=title,
+            status=ExamStatus.PENDING
+        )
+        db.add(new_exam)
+        await db.flush()
+
+        # Queue document for parsing (commits the exam together with the job)
+        await ingestion_queue.enqueue(
+            db,
+            exam_id=new_exam.id,
+            user_id=current_user.id,
+            filename=file.filename,
+            file_path=file_path,
+            is_random=is_random
+        )
+    except BaseException:
+        # No job references the file
+        discard_upload(file_path)
+        raise
+    await db.refresh(new_exam)
 
     return ExamUploadResponse(
         exam_id=new_exam.id,
@@ -599,7 +802,6 @@ async def create_exam_with_upload(
 async def append_document_to_exam(
     request: Request,
     exam_id: int,
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
@@ -633,26 +835,96 @@ async def append_document_to_exam(
     # Validate file
     await validate_upload_file(file)
 
-    # Read file content
-    file_content = await file.read()
-
     # Check upload limits
-    await check_upload_limits(current_user.id, len(file_content), db)
-
-    # Start background parsing (will auto-deduplicate)
-    background_tasks.add_task(
-        async_parse_and_save,
-        exam.id,
-        file_content,
-        file.filename,
-        os.getenv("DATABASE_URL")
+    max_upload_size = await check_upload_limits(current_user.id, db, request)
+
+    # Stream file to disk (rejected as soon as it exceeds the size limit)
+    file_path = await store_upload(file, max_upload_size)
+
+    # Queue document for parsing (will auto-deduplicate); commits the status with the job
+    exam.status = ExamStatus.PENDING
+    try:
+        await ingestion_queue.enqueue(
+            db,
+            exam_id=exam.id,
+            user_id=current_user.id,
+            filename=file.filename,
+            file_path=file_path
+        )
+    except BaseException:
+        discard_upload(file_path)
+        raise
+
+    return ExamUploadResponse(
+        exam_id=exam.id,
+        title=exam.title,
+        status=ExamStatus.PENDING.value,
+        message=f"Document '{file.filename}' is being processed. Duplicates will be automatically removed."
     )
 
+
+@router.post("/{exam_id}/retry", response_model=ExamUploadResponse)
+@limiter.limit("10/minute")
+async def retry_exam_ingestion(
+    request: Request,
+    exam_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Resume the most recent failed ingestion of an exam.
+    Chunks that were already extracted are restored from checkpoints;
+    only missing or failed chunks are sent to the LLM again.
+    """
+
+    # Get exam and verify ownership
+    result = await db.execute(
+        select(Exam).where(
+            and_(Exam.id == exam_id, Exam.user_id == current_user.id)
+        )
+    )
+    exam = result.scalar_one_or_none()
+
+    if not exam:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Exam not found"
+        )
+
+    result = await db.execute(
+        select(IngestionJob)
+        .where(IngestionJob.exam_id == exam_id)
+        .order_by(IngestionJob.id.desc())
+        .limit(1)
+    )
+    job = result.scalar_one_or_none()
+
+    if not job or job.status != IngestionJobStatus.FAILED:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="No failed document to resume for this exam"
+        )
+
+    if not os.path.exists(job.file_path):
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="The original document is no longer available. Please upload it again."
+        )
+
+    checkpoint_counts = await count_checkpoints(db, exam_id)
+
+    if exam.status == ExamStatus.FAILED:
+        exam.status = ExamStatus.PENDING
+    await ingestion_queue.retry(db, job)
+
     return ExamUploadResponse(
         exam_id=exam.id,
         title=exam.title,
         status=ExamStatus.PROCESSING.value,
-        message=f"Document '{file.filename}' is being processed. Duplicates will be automatically removed."
+        message=(
+            f"Resuming '{job.filename}': {checkpoint_counts['done']} parts already extracted, "
+            f"{checkpoint_counts['failed']} failed parts will be retried."
+        )
     )
 
 
@@ -803,7 +1075,12 @@ async def get_exam_progress(
 
     async def event_generator():
         """Generate SSE events"""
-        async for update in progress_service.subscribe(exam_id):
+        # The exam may be processed by a standalone worker process, so fall
+        # back to the progress snapshot persisted on its ingestion job.
+        async for update in progress_service.subscribe(
+            exam_id,
+            poll=lambda: ingestion_queue.get_persisted_progress(exam_id)
+        ):
             # Format as SSE
             data = json.dumps(update.to_dict())
             yield f"data: {data}\n\n"
@@ -844,9 +1121,20 @@ async def delete_exam(
             detail="Exam not found"
         )
 
+    # Ingestion state goes with the exam; a job still running loses its lease and stops
+    result = await db.execute(select(IngestionJob.file_path).where(IngestionJob.exam_id == exam_id))
+    file_paths = result.scalars().all()
+    await db.execute(delete(IngestionChunk).where(IngestionChunk.exam_id == exam_id))
+    await db.execute(delete(IngestionJob).where(IngestionJob.exam_id == exam_id))
+
     await db.delete(exam)
     await db.commit()
 
+    # Uploads of succeeded jobs were already removed
+    for file_path in file_paths:
+        if os.path.exists(file_path):
+            discard_upload(file_path)
+
 
 @router.put("/{exam_id}/progress", response_model=ExamResponse)
 async def update_quiz_progress(
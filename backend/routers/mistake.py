@@ -10,6 +10,7 @@ from database import get_db
 from models import User, Question, UserMistake, Exam
 from schemas import MistakeAdd, MistakeResponse, MistakeListResponse
 from services.auth_service import get_current_user
+from services.answer_service import reference_answer_service
 
 router = APIRouter()
 
@@ -48,6 +49,9 @@ async def get_user_mistakes(
     result = await db.execute(query.offset(skip).limit(limit))
     mistakes = result.scalars().all()
 
+    # Mistakes show the answer: generate deferred reference answers for this page in one go
+    await reference_answer_service.ensure_answers(db, [mistake.question for mistake in mistakes])
+
     # Format response
     mistake_responses = []
     for mistake in mistakes:
@@ -124,6 +128,7 @@ async def add_to_mistakes(
         .where(UserMistake.id == new_mistake.id)
     )
     new_mistake = result.scalar_one()
+    await reference_answer_service.ensure_answers(db, [new_mistake.question])
 
     return MistakeResponse(
         id=new_mistake.id,
@@ -15,6 +15,7 @@ from schemas import (
 from services.auth_service import get_current_user
 from services.llm_service import LLMService
 from services.config_service import load_llm_config
+from services.answer_service import reference_answer_service
 
 router = APIRouter()
 
@@ -153,6 +154,10 @@ async def get_current_question(
             detail="No more questions available. You've completed this exam!"
         )
 
+    # Have the deferred reference answer ready by the time the user submits
+    if question.answer_pending:
+        reference_answer_service.prefetch(question.id)
+
     return question
 
 
@@ -183,6 +188,9 @@ async def get_question_by_id(
             detail="Question not found"
         )
 
+    if question.answer_pending:
+        reference_answer_service.prefetch(question.id)
+
     return question
 
 
@@ -217,6 +225,14 @@ async def check_answer(
             detail="Question not found"
         )
 
+    # Lazy mode: the reference answer is generated on first use
+    await reference_answer_service.ensure_answers(db, [question])
+    if question.answer_pending:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="参考答案生成失败，请稍后重试"
+        )
+
     user_answer = answer_data.user_answer.strip()
     correct_answer = question.answer.strip()
     is_correct = False
@@ -230,11 +246,18 @@ async def check_answer(
         llm_service = LLMService(config=llm_config)
 
         # Use AI to grade short answer
-        grading = await llm_service.grade_short_answer(
-            question.content,
-            correct_answer,
-            user_answer
-        )
+        try:
+            grading = await llm_service.grade_short_answer(
+                question.content,
+                correct_answer,
+                user_answer
+            )
+        except Exception as e:
+            print(f"[Grading] Failed to grade question {question.id}: {e}", flush=True)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="AI 评分暂时不可用，请稍后重试"
+            )
         ai_score = grading["score"]
         ai_feedback = grading["feedback"]
         is_correct = ai_score >= 0.7  # Consider 70% as correct
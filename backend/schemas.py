@@ -80,7 +80,10 @@ class SystemConfigUpdate(BaseModel):
     allow_registration: Optional[bool] = None
     max_upload_size_mb: Optional[int] = None
     max_daily_uploads: Optional[int] = None
+    ingest_max_jobs_per_user: Optional[int] = Field(None, ge=0)
+    ingest_max_chunks_per_user: Optional[int] = Field(None, ge=0)
     ai_provider: Optional[str] = None
+    fallback_ai_provider: Optional[str] = None
     # API Configuration
     openai_api_key: Optional[str] = None
     openai_base_url: Optional[str] = None
@@ -99,7 +102,10 @@ class SystemConfigResponse(BaseModel):
     allow_registration: bool
     max_upload_size_mb: int
     max_daily_uploads: int
+    ingest_max_jobs_per_user: int = 1
+    ingest_max_chunks_per_user: int = 0
     ai_provider: str
+    fallback_ai_provider: Optional[str] = None
     # API Configuration
     openai_api_key: Optional[str] = None
     openai_base_url: Optional[str] = None
@@ -0,0 +1,284 @@
+"""
+Reference Answer Service - AI reference answers for questions without an answer key
+
+Answers are generated either at ingest time (AI_ANSWER_MODE=eager) or lazily
+(AI_ANSWER_MODE=lazy): questions are stored with answer_pending set, the exam
+becomes READY immediately, and the answer is generated the first time a
+request needs it. Concurrent requests for the same question share one LLM call.
+"""
+import asyncio
+import os
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from models import Question
+from services.llm_service import LLMService
+from services.config_service import load_llm_config
+from json_stream_utils import repair_json
+from concurrency_utils import iter_ordered_bounded, get_answer_batch_size, get_answer_concurrency
+
+AI_ANSWER_PREFIX = "AI参考答案："
+PENDING_ANSWER = "（AI参考答案生成中）"
+MISSING_ANSWER = "（答案未提供）"
+
+
+async def generate_ai_reference_answer(
+    llm_service,
+    question_content: str,
+    question_type: str,
+    options: Optional[List[str]] = None,
+    interactive: bool = False
+) -> str:
+    """
+    Generate an AI reference answer for a question without a provided answer.
+
+    Args:
+        llm_service: LLM service instance
+        question_content: The question text
+        question_type: Type of question (single, multiple, judge, short)
+        options: Question options (for choice questions)
+        interactive: A user is waiting (goes ahead of bulk LLM work)
+
+    Returns:
+        Generated answer text
+    """
+    # Build prompt based on question type
+    if question_type in ["single", "multiple"] and options:
+        options_text = "\n".join(options)
+        q_type_text = '单选题' if question_type == 'single' else '多选题'
+        prompt = f"""这是一道{q_type_text}，但文档中没有提供答案。请根据题目内容，推理出最可能的正确答案。
+
+题目：{question_content}
+
+选项：
+{options_text}
+
+请只返回你认为正确的选项字母（如 A 或 AB），不要有其他解释。如果无法确定，请返回"无法确定"。"""
+    elif question_type == "judge":
+        prompt = f"""这是一道判断题，但文档中没有提供答案。请根据题目内容，判断正误。
+
+题目：{question_content}
+
+请只返回"对"或"错"，不要有其他解释。如果无法确定，请返回"无法确定"。"""
+    else:  # short answer
+        prompt = f"""这是一道简答题，但文档中没有提供答案。请根据题目内容，给出一个简洁的参考答案（50字以内）。
+
+题目：{question_content}
+
+请直接返回答案内容，不要有"答案："等前缀。如果无法回答，请返回"无法确定"。"""
+
+    # Generate answer using LLM
+    return await llm_service.complete(
+        prompt,
+        system_prompt="You are a helpful assistant that provides concise answers.",
+        temperature=0.7,
+        max_tokens=256,
+        call_site="reference_answer",
+        parse=str.strip,
+        interactive=interactive
+    )
+
+
+def normalize_question_type(q_type) -> str:
+    """Question type as a lowercase string (accepts QuestionType enums)"""
+    if hasattr(q_type, 'value'):
+        return q_type.value
+    return str(q_type).lower()
+
+
+def load_answer_array(result: str) -> Dict[int, str]:
+    """Parse a batched answer response into {index: answer}; raises when it is not a JSON array"""
+    items, fixes = repair_json(result)
+    if fixes:
+        print(f"[JSON Repair] Answer batch repaired: {fixes}", flush=True)
+    if not isinstance(items, list):
+        raise Exception("Expected a JSON array of answers")
+
+    answers = {}
+    for item in items:
+        if not isinstance(item, dict) or item.get("answer") in (None, ""):
+            continue
+        try:
+            answers[int(item["index"])] = str(item["answer"]).strip()
+        except (KeyError, TypeError, ValueError):
+            continue
+    return answers
+
+
+async def generate_ai_reference_answers(
+    llm_service,
+    questions: List[dict],
+    interactive: bool = False
+) -> List[Optional[str]]:
+    """
+    Generate AI reference answers for many questions, AI_ANSWER_BATCH_SIZE per prompt.
+
+    Batches run concurrently (AI_ANSWER_CONCURRENCY). Answers are mapped back
+    by index; questions a batch could not answer fall back to a single-question
+    prompt, and None is returned for those that still fail.
+
+    Returns:
+        Answers aligned with `questions`
+    """
+    batch_size = get_answer_batch_size()
+    batches = [questions[i:i + batch_size] for i in range(0, len(questions), batch_size)]
+    type_names = {"single": "单选题", "multiple": "多选题", "judge": "判断题", "short": "简答题"}
+
+    async def answer_batch(batch_idx: int, batch: List[dict]) -> List[Optional[str]]:
+        answers: Dict[int, str] = {}
+        if len(batch) > 1:
+            blocks = []
+            for i, q_data in enumerate(batch, start=1):
+                q_type = normalize_question_type(q_data["type"])
+                block = f"[{i}] {type_names.get(q_type, '简答题')}\n题目：{q_data['content']}"
+                if q_type in ["single", "multiple"] and q_data.get("options"):
+                    block += "\n选项：\n" + "\n".join(q_data["options"])
+                blocks.append(block)
+            questions_text = "\n\n".join(blocks)
+
+            prompt = f"""以下 {len(batch)} 道题目在文档中没有提供答案。请根据题目内容，为每道题推理出最可能的正确答案。
+
+{questions_text}
+
+**返回要求**：
+- 只返回一个 JSON 数组，每道题一个元素：{{"index": 题目编号, "answer": "答案"}}
+- 单选题、多选题只返回正确的选项字母（如 A 或 AB）
+- 判断题只返回"对"或"错"
+- 简答题给出简洁的参考答案（50字以内），不要有"答案："等前缀
+- 无法确定的题目返回"无法确定"
+- 不要包含其他任何内容"""
+
+            try:
+                answers = await llm_service.complete(
+                    prompt,
+                    system_prompt="You are a helpful assistant that provides concise answers. Return only JSON.",
+                    temperature=0.7,
+                    max_tokens=min(4096, 128 * len(batch)),
+                    call_site="reference_answers",
+                    parse=load_answer_array,
+                    interactive=interactive
+                )
+            except Exception as e:
+                print(f"[Question] ⚠️ AI answer batch {batch_idx + 1} failed, answering one by one: {e}", flush=True)
+
+        results: List[Optional[str]] = []
+        for i, q_data in enumerate(batch, start=1):
+            if i not in answers:
+                try:
+                    answers[i] = await generate_ai_reference_answer(
+                        llm_service,
+                        q_data["content"],
+                        normalize_question_type(q_data["type"]),
+                        q_data.get("options"),
+                        interactive
+                    )
+                except Exception as e:
+                    print(f"[Question] ⚠️ Failed to generate AI answer: {e}", flush=True)
+            results.append(answers.get(i))
+        return results
+
+    all_answers: List[Optional[str]] = []
+    async for batch_idx, batch_answers, batch_error in iter_ordered_bounded(
+        batches, answer_batch, get_answer_concurrency()
+    ):
+        if batch_error is not None:
+            print(f"[Question] ⚠️ AI answer batch {batch_idx + 1} failed: {batch_error}", flush=True)
+            batch_answers = [None] * len(batches[batch_idx])
+        all_answers.extend(batch_answers)
+    return all_answers
+
+
+class ReferenceAnswerService:
+    """Lazily generate pending reference answers with per-question single-flight"""
+
+    def __init__(self):
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self._background: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def is_lazy() -> bool:
+        return os.getenv("AI_ANSWER_MODE", "eager").lower() == "lazy"
+
+    async def ensure_answers(self, db: AsyncSession, questions: List[Question], interactive: bool = True):
+        """
+        Generate answers for the pending questions among `questions` and refresh them.
+
+        Questions already being generated by another request are awaited
+        instead of generated twice. Questions whose generation failed stay
+        pending and are retried by the next request. Commits `db`, so the
+        refresh also sees answers written by other requests (a REPEATABLE READ
+        snapshot taken before them would still show the questions pending).
+
+        Args:
+            interactive: A user is waiting for the answers (False for prefetch)
+        """
+        pending = [q for q in questions if q.answer_pending]
+        if not pending:
+            return
+
+        owned = [q for q in pending if q.id not in self._inflight]
+        shared = [self._inflight[q.id] for q in pending if q.id in self._inflight]
+
+        if owned:
+            loop = asyncio.get_running_loop()
+            futures = {q.id: loop.create_future() for q in owned}
+            self._inflight.update(futures)
+            try:
+                await self._generate(db, owned, interactive)
+            finally:
+                for question_id, future in futures.items():
+                    self._inflight.pop(question_id, None)
+                    if not future.done():
+                        future.set_result(None)
+
+        if shared:
+            await asyncio.gather(*(asyncio.shield(future) for future in shared))
+
+        # End the transaction so the refresh reads the committed answers
+        await db.commit()
+        for question in pending:
+            await db.refresh(question)
+
+    async def _generate(self, db: AsyncSession, questions: List[Question], interactive: bool):
+        print(f"[Answer] Generating {len(questions)} pending AI reference answers on demand", flush=True)
+        try:
+            llm_config = await load_llm_config(db)
+            llm_service = LLMService(config=llm_config)
+            answers = await generate_ai_reference_answers(llm_service, [
+                {"content": q.content, "type": q.type, "options": q.options}
+                for q in questions
+            ], interactive=interactive)
+        except Exception as e:
+            print(f"[Answer] ⚠️ Failed to generate pending answers: {e}", flush=True)
+            return
+
+        # The guard keeps the first answer if another process resolved the
+        # question meanwhile
+        for question, answer in zip(questions, answers):
+            if not answer:
+                continue
+            await db.execute(
+                update(Question)
+                .where(Question.id == question.id, Question.answer_pending.is_(True))
+                .values(answer=f"{AI_ANSWER_PREFIX}{answer}", answer_pending=False)
+            )
+        await db.commit()
+
+    def prefetch(self, question_id: int):
+        """Start generating a pending answer in the background (e.g. when the question is shown)"""
+        async def run():
+            async with AsyncSessionLocal() as db:
+                question = await db.get(Question, question_id)
+                if question is not None:
+                    await self.ensure_answers(db, [question], interactive=False)
+
+        task = asyncio.create_task(run())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+
+# Singleton instance
+reference_answer_service = ReferenceAnswerService()
@@ -0,0 +1,173 @@
+"""
+Checkpoint Service - Persist per-chunk extraction results so ingestions can resume
+
+Every chunk's questions are stored as soon as the LLM returns them, keyed by
+exam, document hash and chunk index. When an ingestion is retried, chunks with
+a matching checkpoint are reused and only missing or failed chunks are sent to
+the LLM again.
+"""
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, List, Set, Tuple, Union
+
+import aiofiles
+from sqlalchemy import select, delete, func, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from models import IngestionChunk, ChunkStatus
+
+# Stored in `error` of a done checkpoint whose LLM response was cut off
+TRUNCATED_NOTE = "response truncated, partial questions kept"
+
+
+async def calculate_file_hash(file_path: str, block_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a stored upload, read in blocks"""
+    digest = hashlib.sha256()
+    async with aiofiles.open(file_path, "rb") as f:
+        while True:
+            block = await f.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def calculate_chunk_hash(chunk: Union[str, bytes]) -> str:
+    """SHA-256 of a chunk's text (or identity string for binary chunks)"""
+    if isinstance(chunk, str):
+        chunk = chunk.encode("utf-8")
+    return hashlib.sha256(chunk).hexdigest()
+
+
+class ChunkCheckpoints:
+    """Checkpoints for the chunks of one document within one exam"""
+
+    def __init__(self, exam_id: int, document_hash: str):
+        self.exam_id = exam_id
+        self.document_hash = document_hash
+        self.failed_chunks: List[int] = []
+        self.incomplete_chunks: Set[int] = set()  # Done, but from a truncated response
+        self.reused_chunks = 0
+        self._done: Dict[int, Tuple[str, List[Dict[str, Any]]]] = {}
+
+    async def load(self) -> int:
+        """Load finished checkpoints from previous attempts. Returns how many were found."""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(IngestionChunk).where(
+                    and_(
+                        IngestionChunk.exam_id == self.exam_id,
+                        IngestionChunk.document_hash == self.document_hash,
+                        IngestionChunk.status == ChunkStatus.DONE
+                    )
+                )
+            )
+            for checkpoint in result.scalars().all():
+                self._done[checkpoint.chunk_index] = (checkpoint.chunk_hash, checkpoint.questions or [])
+                if checkpoint.error == TRUNCATED_NOTE:
+                    self.incomplete_chunks.add(checkpoint.chunk_index)
+
+        return len(self._done)
+
+    async def run(
+        self,
+        chunk_index: int,
+        chunk_hash: str,
+        extract: Callable[[], Awaitable[List[Dict[str, Any]]]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Return the checkpointed questions for a chunk, or extract and checkpoint them.
+        Failures are recorded (and re-raised) so the chunk is retried on resume.
+        """
+        checkpoint = self._done.get(chunk_index)
+        if checkpoint and checkpoint[0] == chunk_hash:
+            self.reused_chunks += 1
+            print(f"[Checkpoint] Exam {self.exam_id} chunk {chunk_index + 1} restored from checkpoint ({len(checkpoint[1])} questions)", flush=True)
+            return checkpoint[1]
+
+        try:
+            questions = await extract()
+        except Exception as e:
+            self.failed_chunks.append(chunk_index)
+            await self._store(chunk_index, chunk_hash, ChunkStatus.FAILED, None, str(e))
+            raise
+
+        complete = getattr(questions, "complete", True)
+        if complete:
+            self.incomplete_chunks.discard(chunk_index)
+        else:
+            self.incomplete_chunks.add(chunk_index)
+        await self._store(chunk_index, chunk_hash, ChunkStatus.DONE, questions, None if complete else TRUNCATED_NOTE)
+        self._done[chunk_index] = (chunk_hash, questions)
+        return questions
+
+    @property
+    def complete(self) -> bool:
+        """Whether no chunk failed or was restored/extracted from a truncated response"""
+        return not self.failed_chunks and not self.incomplete_chunks
+
+    async def _store(
+        self,
+        chunk_index: int,
+        chunk_hash: str,
+        status: ChunkStatus,
+        questions: Any,
+        error: Any
+    ):
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(IngestionChunk).where(
+                    and_(
+                        IngestionChunk.exam_id == self.exam_id,
+                        IngestionChunk.document_hash == self.document_hash,
+                        IngestionChunk.chunk_index == chunk_index
+                    )
+                )
+            )
+            checkpoint = result.scalar_one_or_none()
+
+            if checkpoint:
+                checkpoint.chunk_hash = chunk_hash
+                checkpoint.status = status
+                checkpoint.questions = questions
+                checkpoint.error = error
+                checkpoint.attempts += 1
+            else:
+                db.add(IngestionChunk(
+                    exam_id=self.exam_id,
+                    document_hash=self.document_hash,
+                    chunk_index=chunk_index,
+                    chunk_hash=chunk_hash,
+                    status=status,
+                    questions=questions,
+                    error=error
+                ))
+
+            await db.commit()
+
+    async def clear(self):
+        """Drop the checkpoints once the document has been ingested"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                delete(IngestionChunk).where(
+                    and_(
+                        IngestionChunk.exam_id == self.exam_id,
+                        IngestionChunk.document_hash == self.document_hash
+                    )
+                )
+            )
+            await db.commit()
+
+
+async def count_checkpoints(db: AsyncSession, exam_id: int) -> Dict[str, int]:
+    """Number of done/failed chunk checkpoints stored for an exam"""
+    result = await db.execute(
+        select(IngestionChunk.status, func.count(IngestionChunk.id))
+        .where(IngestionChunk.exam_id == exam_id)
+        .group_by(IngestionChunk.status)
+    )
+    counts = {status.value: count for status, count in result.all()}
+    return {
+        "done": counts.get(ChunkStatus.DONE.value, 0),
+        "failed": counts.get(ChunkStatus.FAILED.value, 0)
+    }
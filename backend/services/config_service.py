@@ -1,15 +1,136 @@
 """
 Configuration Service - Load system configuration from database
+
+SystemConfig is read on hot paths (short-answer grading, every upload and
+ingestion), so a typed snapshot is cached in-process. Admin updates bump the
+`config_version` row and refresh the local snapshot at once; other processes
+(workers, extra API replicas) compare their version every
+CONFIG_CACHE_TTL_SECONDS and reload when it changed.
 """
+import asyncio
+import time
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from typing import Dict
+from typing import Dict, Optional
 from models import SystemConfig
+from concurrency_utils import get_env_int
+
+CONFIG_VERSION_KEY = "config_version"
+DEFAULT_CONFIG_CACHE_TTL_SECONDS = 5
+
+
+def _parse_int(value: Optional[str], default: int) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class SystemSettings:
+    """Immutable snapshot of the system_configs table"""
+
+    def __init__(self, values: Dict[str, str]):
+        self.values = values
+        self.version = values.get(CONFIG_VERSION_KEY, "0")
+        self.allow_registration = values.get("allow_registration", "true").lower() != "false"
+        self.max_upload_size_mb = _parse_int(values.get("max_upload_size_mb"), 10)
+        self.max_daily_uploads = _parse_int(values.get("max_daily_uploads"), 20)
+        # Per-user ingestion caps (0 = unlimited)
+        self.ingest_max_jobs_per_user = _parse_int(values.get("ingest_max_jobs_per_user"), 1)
+        self.ingest_max_chunks_per_user = _parse_int(values.get("ingest_max_chunks_per_user"), 0)
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        return self.values.get(key, default)
+
+    def llm_config(self) -> Dict[str, str]:
+        """LLM-related configuration in the shape LLMService expects"""
+        db_configs = self.values
+        return {
+            'ai_provider': db_configs.get('ai_provider', 'gemini'),
+            'fallback_ai_provider': db_configs.get('fallback_ai_provider'),  # Optional secondary provider
+            # OpenAI
+            'openai_api_key': db_configs.get('openai_api_key'),
+            'openai_base_url': db_configs.get('openai_base_url', 'https://api.openai.com/v1'),
+            'openai_model': db_configs.get('openai_model', 'gpt-4o-mini'),
+            # Anthropic
+            'anthropic_api_key': db_configs.get('anthropic_api_key'),
+            'anthropic_model': db_configs.get('anthropic_model', 'claude-3-haiku-20240307'),
+            # Qwen
+            'qwen_api_key': db_configs.get('qwen_api_key'),
+            'qwen_base_url': db_configs.get('qwen_base_url', 'https://dashscope.aliyuncs.com/compatible-mode/v1'),
+            'qwen_model': db_configs.get('qwen_model', 'qwen-plus'),
+            # Gemini
+            'gemini_api_key': db_configs.get('gemini_api_key'),
+            'gemini_base_url': db_configs.get('gemini_base_url'),  # Optional, defaults to Google's API
+            'gemini_model': db_configs.get('gemini_model', 'gemini-2.0-flash-exp')
+        }
+
+
+class SystemConfigCache:
+    """Process-wide SystemConfig cache with version-checked refresh"""
+
+    def __init__(self):
+        self._settings: Optional[SystemSettings] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _ttl() -> int:
+        return get_env_int("CONFIG_CACHE_TTL_SECONDS", DEFAULT_CONFIG_CACHE_TTL_SECONDS)
+
+    async def _load(self, db: AsyncSession) -> SystemSettings:
+        result = await db.execute(select(SystemConfig))
+        settings = SystemSettings({config.key: config.value for config in result.scalars().all()})
+        self._settings = settings
+        self._checked_at = time.monotonic()
+        return settings
+
+    async def get(self, db: AsyncSession) -> SystemSettings:
+        """
+        Return the cached settings. Within the TTL this does no I/O; after it,
+        a single primary-key lookup decides whether the table must be reloaded.
+        """
+        settings = self._settings
+        if settings is not None and time.monotonic() - self._checked_at < self._ttl():
+            return settings
+
+        async with self._lock:
+            settings = self._settings
+            if settings is not None and time.monotonic() - self._checked_at < self._ttl():
+                return settings
+
+            if settings is not None:
+                result = await db.execute(
+                    select(SystemConfig.value).where(SystemConfig.key == CONFIG_VERSION_KEY)
+                )
+                if (result.scalar_one_or_none() or "0") == settings.version:
+                    self._checked_at = time.monotonic()
+                    return settings
+                print("[Config] System configuration changed, reloading", flush=True)
+
+            return await self._load(db)
+
+    async def bump_version(self, db: AsyncSession):
+        """Mark the configuration as changed; call before committing an admin update"""
+        result = await db.execute(select(SystemConfig).where(SystemConfig.key == CONFIG_VERSION_KEY))
+        config = result.scalar_one_or_none()
+        if config:
+            config.value = str(_parse_int(config.value, 0) + 1)
+        else:
+            db.add(SystemConfig(key=CONFIG_VERSION_KEY, value="1"))
+
+    def invalidate(self):
+        """Drop the local snapshot so the next read reloads it"""
+        self._settings = None
+
+
+# Singleton instance
+config_cache = SystemConfigCache()
 
 
 async def load_llm_config(db: AsyncSession) -> Dict[str, str]:
     """
-    Load LLM configuration from database.
+    Load LLM configuration (served from the in-process cache).
 
     Returns a dictionary with all LLM-related configuration:
     {
@@ -20,28 +141,5 @@ async def load_llm_config(db: AsyncSession) -> Dict[str, str]:
         ...
     }
     """
-    # Fetch all config from database
-    result = await db.execute(select(SystemConfig))
-    db_configs = {config.key: config.value for config in result.scalars().all()}
-
-    # Build configuration dictionary
-    config = {
-        'ai_provider': db_configs.get('ai_provider', 'gemini'),
-        # OpenAI
-        'openai_api_key': db_configs.get('openai_api_key'),
-        'openai_base_url': db_configs.get('openai_base_url', 'https://api.openai.com/v1'),
-        'openai_model': db_configs.get('openai_model', 'gpt-4o-mini'),
-        # Anthropic
-        'anthropic_api_key': db_configs.get('anthropic_api_key'),
-        'anthropic_model': db_configs.get('anthropic_model', 'claude-3-haiku-20240307'),
-        # Qwen
-        'qwen_api_key': db_configs.get('qwen_api_key'),
-        'qwen_base_url': db_configs.get('qwen_base_url', 'https://dashscope.aliyuncs.com/compatible-mode/v1'),
-        'qwen_model': db_configs.get('qwen_model', 'qwen-plus'),
-        # Gemini
-        'gemini_api_key': db_configs.get('gemini_api_key'),
-        'gemini_base_url': db_configs.get('gemini_base_url'),  # Optional, defaults to Google's API
-        'gemini_model': db_configs.get('gemini_model', 'gemini-2.0-flash-exp')
-    }
-
-    return config
+    settings = await config_cache.get(db)
+    return settings.llm_config()
@@ -1,44 +1,223 @@
 """
 Document Parser Service
 Supports: TXT, PDF, DOCX, XLSX
+
+Text extraction (PyPDF2, python-docx, openpyxl) is CPU-bound, so it runs in a
+process pool instead of on the event loop. Configure with:
+    PARSE_PROCESS_WORKERS  - pool size (default 2, 0 = run in a thread of this process)
+    PARSE_TIMEOUT_SECONDS  - per-document extraction timeout (default 120)
+    PARSE_PDF_PAGES_PER_TASK - PDF pages extracted per pool job when streaming (default 4)
 """
-import io
-from typing import Optional, List
-import PyPDF2
-from docx import Document
-import openpyxl
+import asyncio
+import multiprocessing
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Callable, Optional, List, Tuple, Union
+
+from concurrency_utils import get_env_int
+from document_extractors import (
+    SEGMENT_EXTRACTORS, SEGMENT_SEPARATOR, count_pdf_pages, extract_segments, pdf_page_texts, timed, worker_pid
+)
+
+DEFAULT_PARSE_PROCESS_WORKERS = 2
+DEFAULT_PARSE_TIMEOUT_SECONDS = 120
+MAX_POOL_REQUEUES = 2  # Re-runs of a job whose pool was recycled because of another job's timeout
+DEFAULT_PDF_PAGES_PER_TASK = 4
+
+
+# Lines that start a new question: "1." / "1、" / "（1）" / "(1)" / "一、" / "第3题" / "第十二题"
+# Option lines ("A. ..."), answers and analyses never start a question.
+QUESTION_START_PATTERN = re.compile(
+    r'^\s*(?:'
+    r'\d{1,4}\s*[.．、](?!\d)'
+    r'|[（(]\s*\d{1,4}\s*[)）]'
+    r'|[一二三四五六七八九十百]{1,4}\s*[、.．]'
+    r'|第\s*[\d一二三四五六七八九十百]{1,4}\s*[题道]'
+    r')'
+)
+
+
+
+class TextStream:
+    """
+    Async iterator over the text segments (pages, paragraphs or rows) of a
+    document, extracted incrementally in the parser pool.
+    `units_done / units_total` tracks how much of the document has been read.
+    """
+
+    def __init__(self, segments: AsyncIterator[str], units_total: int = 1):
+        self._segments = segments
+        self.units_total = units_total
+        self.units_done = 0
+        self.exhausted = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        try:
+            return await self._segments.__anext__()
+        except StopAsyncIteration:
+            self.exhausted = True
+            self.units_done = self.units_total
+            raise
+
+    @property
+    def fraction_done(self) -> float:
+        return 1.0 if self.exhausted else min(1.0, self.units_done / max(1, self.units_total))
 
 
 class DocumentParser:
     """Parse various document formats to extract text content"""
 
+    def __init__(self):
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # One slot per worker process: a job only enters the pool when a process
+        # is free, so its timeout measures extraction time, not queueing
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._generation = 0  # Bumped whenever the pool is recycled
+        self._ready: Optional[asyncio.Future] = None  # Warm-up of the current pool's processes
+
+    # ==================== Process pool ====================
+
     @staticmethod
-    async def parse_txt(file_content: bytes) -> str:
-        """Parse TXT file"""
+    def get_process_workers() -> int:
+        return get_env_int("PARSE_PROCESS_WORKERS", DEFAULT_PARSE_PROCESS_WORKERS)
+
+    @staticmethod
+    def get_timeout() -> int:
+        return get_env_int("PARSE_TIMEOUT_SECONDS", DEFAULT_PARSE_TIMEOUT_SECONDS, minimum=1)
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        """Lazily start the extraction pool (None when PARSE_PROCESS_WORKERS=0)"""
+        workers = self.get_process_workers()
+        if workers == 0:
+            return None
+
+        if self._pool is None:
+            # spawn: never fork a process that is running an event loop
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            if self._slots is None:
+                self._slots = asyncio.Semaphore(workers)
+            self._ready = None
+            print(f"[Parser] Started extraction pool with {workers} processes", flush=True)
+        return self._pool
+
+    async def _start_workers(self, pool: ProcessPoolExecutor, workers: int):
+        """Wait until every process of a new pool answered, so process start-up is not billed to a job's timeout"""
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + self.get_timeout()
+        pids = set()
         try:
-            return file_content.decode('utf-8')
-        except UnicodeDecodeError:
+            while len(pids) < workers and time.monotonic() < deadline:
+                pids.update(await asyncio.gather(*(loop.run_in_executor(pool, worker_pid) for _ in range(workers))))
+        except Exception as e:
+            # The job itself will run into the broken pool and report it
+            print(f"[Parser] Extraction pool warm-up failed: {e}", flush=True)
+
+    async def _wait_pool_ready(self, pool: ProcessPoolExecutor):
+        if self._ready is None:
+            self._ready = asyncio.ensure_future(self._start_workers(pool, self.get_process_workers()))
+        await asyncio.shield(self._ready)
+
+    def _recycle_pool(self):
+        """Kill the pool after a timeout; a hung extractor cannot be cancelled otherwise"""
+        pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        self._generation += 1
+
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        """Stop the extraction pool (called on application/worker shutdown)"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _run_in_pool(self, label: str, func: Callable, *args) -> Tuple[Any, float]:
+        """
+        Run one extraction job off the event loop with a timeout.
+        Returns the job's result and its own wall time inside the pool.
+
+        The timeout starts once a worker process is free for the job. A timed
+        out job recycles the pool (a hung extractor cannot be cancelled
+        otherwise); the other jobs running in it are re-queued on the new pool
+        instead of failing.
+        """
+        loop = asyncio.get_running_loop()
+        timeout = self.get_timeout()
+
+        if self._get_pool() is None:
             try:
-                return file_content.decode('gbk')
-            except:
-                return file_content.decode('utf-8', errors='ignore')
+                return await asyncio.wait_for(loop.run_in_executor(None, timed, func, *args), timeout=timeout)
+            except asyncio.TimeoutError:
+                print(f"[Parser] ❌ Extraction of {label} timed out after {timeout}s", flush=True)
+                raise Exception(f"Document parsing timed out after {timeout}s")
+
+        requeues = 0
+        while True:
+            async with self._slots:
+                pool = self._get_pool()
+                generation = self._generation
+                await self._wait_pool_ready(pool)
+                try:
+                    return await asyncio.wait_for(
+                        loop.run_in_executor(pool, timed, func, *args),
+                        timeout=timeout
+                    )
+                except asyncio.TimeoutError:
+                    print(f"[Parser] ❌ Extraction of {label} timed out after {timeout}s", flush=True)
+                    if generation == self._generation:
+                        self._recycle_pool()
+                    raise Exception(f"Document parsing timed out after {timeout}s")
+                except BrokenProcessPool:
+                    if generation == self._generation:
+                        # This pool broke on its own: a worker process crashed
+                        self._recycle_pool()
+                        raise Exception("Document parser process crashed")
+                    if requeues >= MAX_POOL_REQUEUES:
+                        raise Exception("Document parser pool was restarted repeatedly")
+                    requeues += 1
+                    print(f"[Parser] Pool was recycled while extracting {label}, re-queuing it", flush=True)
 
     @staticmethod
-    async def parse_pdf(file_content: bytes) -> str:
-        """Parse PDF file"""
-        try:
-            pdf_file = io.BytesIO(file_content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
+    def _check_extension(extension: str):
+        if extension not in SEGMENT_EXTRACTORS:
+            raise Exception(f"Unsupported file format: {extension}")
 
-            text_content = []
-            for page in pdf_reader.pages:
-                text = page.extract_text()
-                if text:
-                    text_content.append(text)
+    async def _extract(self, extension: str, source: Union[bytes, str], label: str) -> str:
+        """Extract the full text of a document in one pool job and log its wall time"""
+        self._check_extension(extension)
+        started = time.perf_counter()
 
-            return '\n\n'.join(text_content)
-        except Exception as e:
-            raise Exception(f"Failed to parse PDF: {str(e)}")
+        segments, extract_seconds = await self._run_in_pool(label, extract_segments, extension, source)
+        text = SEGMENT_SEPARATOR.join(segments)
+
+        total_seconds = time.perf_counter() - started
+        print(
+            f"[Parser] {extension.upper()} extraction of {label}: {len(text)} chars "
+            f"in {extract_seconds:.2f}s (wall {total_seconds:.2f}s incl. queueing)",
+            flush=True
+        )
+        return text
+
+    # ==================== Parsers ====================
+
+    async def parse_txt(self, file_content: bytes) -> str:
+        """Parse TXT file"""
+        return await self._extract('txt', file_content, 'upload')
+
+    async def parse_pdf(self, file_content: bytes) -> str:
+        """Parse PDF file"""
+        return await self._extract('pdf', file_content, 'upload')
 
     @staticmethod
     def split_text_with_overlap(text: str, chunk_size: int = 3000, overlap: int = 500) -> List[str]:
@@ -73,51 +252,214 @@ class DocumentParser:
         return chunks
 
     @staticmethod
-    async def parse_docx(file_content: bytes) -> str:
-        """Parse DOCX file"""
-        try:
-            docx_file = io.BytesIO(file_content)
-            doc = Document(docx_file)
-
-            text_content = []
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():
-                    text_content.append(paragraph.text)
-
-            # Also extract text from tables
-            for table in doc.tables:
-                for row in table.rows:
-                    row_text = ' | '.join(cell.text.strip() for cell in row.cells)
-                    if row_text.strip():
-                        text_content.append(row_text)
-
-            return '\n\n'.join(text_content)
-        except Exception as e:
-            raise Exception(f"Failed to parse DOCX: {str(e)}")
+    async def iter_text_chunks(
+        segments: AsyncIterator[str],
+        chunk_size: int = 3000,
+        overlap: int = 500,
+        single_chunk_limit: int = 0
+    ) -> AsyncIterator[str]:
+        """
+        Lazy counterpart of split_text_with_overlap for a stream of segments.
+
+        Segments are joined with SEGMENT_SEPARATOR and sliced into exactly the
+        chunks split_text_with_overlap would produce for the joined text, but
+        each chunk is yielded as soon as enough text has arrived, and only the
+        text from the current chunk onwards is kept in memory.
+
+        Args:
+            segments: Async iterator of text segments (pages, paragraphs, rows)
+            chunk_size: Characters per chunk (default: 3000)
+            overlap: Overlapping characters between chunks (default: 500)
+            single_chunk_limit: Documents up to this length are yielded whole
+
+        Yields:
+            Text chunks in document order
+        """
+        iterator = segments.__aiter__()
+        window = ""  # Joined document text starting at offset `base`
+        base = 0
+        exhausted = False
+        has_text = False
+
+        async def read_past(length: int):
+            """Pull segments until the document is known to extend beyond `length` chars"""
+            nonlocal window, exhausted, has_text
+            while not exhausted and base + len(window) <= length:
+                try:
+                    segment = await iterator.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                window += (SEGMENT_SEPARATOR + segment) if has_text else segment
+                has_text = True
+
+        whole_limit = max(chunk_size, single_chunk_limit)
+        await read_past(whole_limit)
+        if exhausted and len(window) <= whole_limit:
+            yield window
+            return
+
+        chunk_count = 0
+        start = 0
+        while True:
+            await read_past(start + chunk_size)
+            text_end = base + len(window)
+            end = min(start + chunk_size, text_end)
+            chunk_count += 1
+
+            print(f"[Text Split] Chunk {chunk_count}: chars {start}-{end}")
+            yield window[start - base:end - base]
+
+            if exhausted and end >= text_end:
+                break
+
+            # Move to next chunk with overlap, dropping text that is no longer needed
+            start = end - overlap
+            window = window[start - base:]
+            base = start
+
+        print(f"[Text Split] Total chunks: {chunk_count}")
 
     @staticmethod
-    async def parse_xlsx(file_content: bytes) -> str:
-        """Parse XLSX file"""
-        try:
-            xlsx_file = io.BytesIO(file_content)
-            workbook = openpyxl.load_workbook(xlsx_file, data_only=True)
+    def is_question_start(line: str) -> bool:
+        """Whether a line begins a new numbered question or section"""
+        return bool(QUESTION_START_PATTERN.match(line))
 
-            text_content = []
-            for sheet_name in workbook.sheetnames:
-                sheet = workbook[sheet_name]
-                text_content.append(f"=== Sheet: {sheet_name} ===")
+    @staticmethod
+    async def iter_question_chunks(
+        segments: AsyncIterator[str],
+        max_chunk_size: int = 3000,
+        overlap: int = 1000,
+        single_chunk_limit: int = 0
+    ) -> AsyncIterator[str]:
+        """
+        Split a stream of segments into chunks along question boundaries.
 
-                for row in sheet.iter_rows(values_only=True):
-                    row_text = ' | '.join(str(cell) if cell is not None else '' for cell in row)
-                    if row_text.strip(' |'):
-                        text_content.append(row_text)
+        Lines are grouped into question blocks, each starting at a numbered
+        line ("1.", "（1）", "一、", "第X题"; see QUESTION_START_PATTERN), and
+        whole blocks are packed into chunks of up to `max_chunk_size`
+        characters without overlap, so no question is cut in half or sent to
+        the LLM twice. Text without numbering (or a single block longer than
+        `max_chunk_size`) falls back to fixed windows with `overlap`.
 
-            return '\n\n'.join(text_content)
-        except Exception as e:
-            raise Exception(f"Failed to parse XLSX: {str(e)}")
+        Args:
+            segments: Async iterator of text segments (pages, paragraphs, rows)
+            max_chunk_size: Maximum characters per packed chunk (default: 3000)
+            overlap: Overlap used only when an oversized block must be windowed
+            single_chunk_limit: Documents up to this length are yielded whole
+
+        Yields:
+            Text chunks in document order
+        """
+        lines: List[str] = []  # Lines read ahead for the single-chunk check
+        text_length = 0
+        exhausted = False
+        iterator = segments.__aiter__()
+        first_segment = True
+
+        # Read ahead until the document is known to be longer than single_chunk_limit
+        while not exhausted and text_length <= single_chunk_limit:
+            try:
+                segment = await iterator.__anext__()
+            except StopAsyncIteration:
+                exhausted = True
+                break
+            if not first_segment:
+                lines.append('')  # SEGMENT_SEPARATOR
+            lines.extend(segment.split('\n'))
+            text_length += len(segment) + (0 if first_segment else len(SEGMENT_SEPARATOR))
+            first_segment = False
+
+        if exhausted and text_length <= single_chunk_limit:
+            yield '\n'.join(lines)
+            return
+
+        async def iter_lines():
+            nonlocal first_segment
+            for line in lines:
+                yield line
+            async for segment in iterator:
+                if not first_segment:
+                    yield ''
+                for line in segment.split('\n'):
+                    yield line
+                first_segment = False
+
+        chunk_blocks: List[str] = []  # Whole question blocks packed into the next chunk
+        chunk_length = 0
+        block_lines: List[str] = []  # Lines of the question currently being read
+        block_length = 0
+        chunk_count = 0
+
+        def take_chunk() -> Optional[str]:
+            nonlocal chunk_blocks, chunk_length
+            chunk = '\n'.join(chunk_blocks).strip('\n')
+            chunk_blocks, chunk_length = [], 0
+            return chunk if chunk.strip() else None
+
+        def add_block(block: str) -> Optional[str]:
+            """Pack a finished block; returns a full chunk when the block does not fit"""
+            nonlocal chunk_length
+            full_chunk = None
+            if chunk_blocks and chunk_length + 1 + len(block) > max_chunk_size:
+                full_chunk = take_chunk()
+            chunk_blocks.append(block)
+            chunk_length += len(block) + (1 if len(chunk_blocks) > 1 else 0)
+            return full_chunk
+
+        async for line in iter_lines():
+            if block_lines and DocumentParser.is_question_start(line):
+                full_chunk = add_block('\n'.join(block_lines))
+                block_lines, block_length = [], 0
+                if full_chunk:
+                    chunk_count += 1
+                    yield full_chunk
+
+            block_lines.append(line)
+            block_length += len(line) + 1
+
+            if block_length > max_chunk_size:
+                # A block that cannot fit in any chunk (e.g. unnumbered text):
+                # emit it in fixed windows and keep the overlapping tail open.
+                if chunk_blocks:
+                    full_chunk = take_chunk()
+                    if full_chunk:
+                        chunk_count += 1
+                        yield full_chunk
+
+                block_text = '\n'.join(block_lines)
+                while len(block_text) > max_chunk_size:
+                    chunk_count += 1
+                    yield block_text[:max_chunk_size]
+                    block_text = block_text[max_chunk_size - overlap:]
+                block_lines, block_length = [block_text], len(block_text) + 1
+
+        if block_lines:
+            full_chunk = add_block('\n'.join(block_lines))
+            if full_chunk:
+                chunk_count += 1
+                yield full_chunk
+
+        last_chunk = take_chunk()
+        if last_chunk:
+            chunk_count += 1
+            yield last_chunk
+
+        print(f"[Question Split] Total chunks: {chunk_count}")
+
+    async def parse_docx(self, file_content: bytes) -> str:
+        """Parse DOCX file"""
+        return await self._extract('docx', file_content, 'upload')
+
+    async def parse_xlsx(self, file_content: bytes) -> str:
+        """Parse XLSX file"""
+        return await self._extract('xlsx', file_content, 'upload')
 
     @staticmethod
-    async def parse_file(file_content: bytes, filename: str) -> str:
+    def _get_extension(filename: str) -> str:
+        return filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+
+    async def parse_file(self, file_content: bytes, filename: str) -> str:
         """
         Parse file based on extension.
 
@@ -131,22 +473,90 @@ class DocumentParser:
         Raises:
             Exception: If file format is unsupported or parsing fails
         """
-        extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
-
-        parsers = {
-            'txt': DocumentParser.parse_txt,
-            'pdf': DocumentParser.parse_pdf,
-            'docx': DocumentParser.parse_docx,
-            'doc': DocumentParser.parse_docx,  # Try to parse DOC as DOCX
-            'xlsx': DocumentParser.parse_xlsx,
-            'xls': DocumentParser.parse_xlsx,  # Try to parse XLS as XLSX
-        }
-
-        parser = parsers.get(extension)
-        if not parser:
-            raise Exception(f"Unsupported file format: {extension}")
+        return await self._extract(self._get_extension(filename), file_content, filename)
+
+    async def parse_stored_file(self, file_path: str, filename: str) -> str:
+        """
+        Parse a stored upload by path. The pool process reads the file itself,
+        so the document is never loaded into the calling process.
+
+        Args:
+            file_path: Path of the stored upload
+            filename: Original filename (used for the extension)
+
+        Returns:
+            Extracted text content
+        """
+        return await self._extract(self._get_extension(filename), file_path, filename)
+
+    def stream_stored_file(self, file_path: str, filename: str) -> TextStream:
+        """
+        Stream the text segments of a stored upload.
+
+        PDFs are extracted PARSE_PDF_PAGES_PER_TASK pages per pool job, with the
+        next batch extracted while the current one is consumed, so the first
+        pages are available long before the whole document has been read.
+        Other formats are extracted in a single pool job and then streamed.
+
+        Args:
+            file_path: Path of the stored upload
+            filename: Original filename (used for the extension)
+
+        Returns:
+            TextStream of page / paragraph / row texts
+        """
+        extension = self._get_extension(filename)
+        self._check_extension(extension)
+
+        async def pdf_segments() -> AsyncIterator[str]:
+            started = time.perf_counter()
+            extract_seconds = 0.0
+            total_pages, _ = await self._run_in_pool(filename, count_pdf_pages, file_path)
+            stream.units_total = total_pages
+
+            pages_per_task = get_env_int("PARSE_PDF_PAGES_PER_TASK", DEFAULT_PDF_PAGES_PER_TASK, minimum=1)
+            batches = [(page, min(page + pages_per_task, total_pages)) for page in range(0, total_pages, pages_per_task)]
+
+            def extract_batch(batch_index: int) -> asyncio.Future:
+                start_page, end_page = batches[batch_index]
+                label = f"{filename} pages {start_page + 1}-{end_page}"
+                return asyncio.ensure_future(self._run_in_pool(label, pdf_page_texts, file_path, start_page, end_page))
+
+            pending = extract_batch(0) if batches else None
+            try:
+                for batch_index, (_, end_page) in enumerate(batches):
+                    current, pending = pending, (extract_batch(batch_index + 1) if batch_index + 1 < len(batches) else None)
+                    page_texts, batch_seconds = await current
+                    extract_seconds += batch_seconds
+                    stream.units_done = end_page
+
+                    for text in page_texts:
+                        yield text
+            finally:
+                if pending is not None:
+                    pending.cancel()
+
+            print(
+                f"[Parser] PDF extraction of {filename}: {total_pages} pages "
+                f"in {extract_seconds:.2f}s (wall {time.perf_counter() - started:.2f}s incl. LLM backpressure)",
+                flush=True
+            )
+
+        async def document_segments() -> AsyncIterator[str]:
+            started = time.perf_counter()
+            segments, extract_seconds = await self._run_in_pool(filename, extract_segments, extension, file_path)
+            print(
+                f"[Parser] {extension.upper()} extraction of {filename}: {len(segments)} segments "
+                f"in {extract_seconds:.2f}s (wall {time.perf_counter() - started:.2f}s incl. queueing)",
+                flush=True
+            )
+            stream.units_done = stream.units_total
+
+            for segment in segments:
+                yield segment
 
-        return await parser(file_content)
+        stream = TextStream(pdf_segments() if extension == 'pdf' else document_segments())
+        return stream
 
 
 # Singleton instance
@@ -0,0 +1,97 @@
+"""
+Extraction Cache Service - Reuse extracted questions for identical content
+
+Results are keyed by the SHA-256 of the content plus the AI provider, model
+and PROMPT_VERSION, so a document that was already ingested (by any user)
+is copied into a new exam without another round of extraction and LLM calls.
+Individual text chunks are cached the same way, so re-uploading an edited
+document only sends the chunks whose text actually changed to the LLM.
+Changing provider, model or prompts naturally misses the old entries.
+"""
+import copy
+import hashlib
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+from database import AsyncSessionLocal
+from models import ExtractionCache
+from services.llm_service import PROMPT_VERSION
+
+DOCUMENT_KIND = "document"
+CHUNK_KIND = "chunk"
+
+
+class ExtractionCacheService:
+    """Read and write extraction results shared across exams"""
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+
+    @staticmethod
+    def make_key(kind: str, content_hash: str, provider: str, model: str) -> str:
+        """Cache key: SHA-256 over kind, content hash, provider, model and prompt version"""
+        raw = "|".join([kind, content_hash, provider or "", model or "", PROMPT_VERSION])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, kind: str, content_hash: str, provider: str, model: str) -> Optional[List[Dict[str, Any]]]:
+        """Cached questions for the content, or None on a miss"""
+        if not self.is_enabled():
+            return None
+
+        cache_key = self.make_key(kind, content_hash, provider, model)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(ExtractionCache.questions).where(ExtractionCache.cache_key == cache_key)
+            )
+            questions = result.scalar_one_or_none()
+            if questions is None:
+                return None
+
+            await db.execute(
+                update(ExtractionCache)
+                .where(ExtractionCache.cache_key == cache_key)
+                .values(hits=ExtractionCache.hits + 1, last_used_at=datetime.utcnow())
+            )
+            await db.commit()
+
+        # Callers mutate question dicts (answers, shuffling); never hand out shared state
+        return copy.deepcopy(questions)
+
+    async def put(
+        self,
+        kind: str,
+        content_hash: str,
+        provider: str,
+        model: str,
+        questions: List[Dict[str, Any]]
+    ):
+        """Store extracted questions; an existing entry for the same key is kept"""
+        if not self.is_enabled():
+            return
+
+        cache_key = self.make_key(kind, content_hash, provider, model)
+        async with AsyncSessionLocal() as db:
+            db.add(ExtractionCache(
+                cache_key=cache_key,
+                kind=kind,
+                content_hash=content_hash,
+                provider=provider or "",
+                model=model or "",
+                prompt_version=PROMPT_VERSION,
+                questions=questions,
+                question_count=len(questions)
+            ))
+            try:
+                await db.commit()
+            except IntegrityError:
+                # Another worker stored the same content concurrently
+                await db.rollback()
+
+
+# Singleton instance
+extraction_cache = ExtractionCacheService()
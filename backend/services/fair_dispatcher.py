@@ -0,0 +1,130 @@
+"""
+Fair Dispatcher - Round-robin scheduling of ingestion chunks across users
+
+All ingestion jobs in a process share INGEST_CHUNK_SLOTS chunk slots. When the
+slots are busy, waiting chunks are queued per user and freed slots are handed
+out round-robin over the users with waiting work, so one user's 500-page PDF
+cannot starve other users' small uploads. An optional per-user cap
+(`ingest_max_chunks_per_user` in SystemConfig) bounds how many slots a single
+user may hold even when the others are idle.
+"""
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Tuple
+
+from concurrency_utils import get_chunk_concurrency, get_env_int
+
+
+class FairDispatcher:
+    """Process-wide chunk slots shared round-robin between users"""
+
+    def __init__(self):
+        self._active = 0
+        self._in_flight: Dict[int, int] = {}
+        self._waiting: Dict[int, Deque[Tuple[asyncio.Future, int]]] = {}
+        self._rotation: Deque[int] = deque()  # Users with waiting chunks, next to serve first
+        self.dispatched: Dict[int, int] = {}
+        self.queued = 0
+
+    @staticmethod
+    def capacity() -> int:
+        """INGEST_CHUNK_SLOTS, by default every job slot times its chunk concurrency"""
+        default = get_chunk_concurrency() * get_env_int("INGEST_WORKER_CONCURRENCY", 2, minimum=1)
+        return get_env_int("INGEST_CHUNK_SLOTS", default, minimum=1)
+
+    def _grant(self, user_id: int):
+        self._active += 1
+        self._in_flight[user_id] = self._in_flight.get(user_id, 0) + 1
+        self.dispatched[user_id] = self.dispatched.get(user_id, 0) + 1
+
+    def _dispatch(self):
+        """Hand free slots to waiting users in round-robin order"""
+        skipped = 0
+        while self._active < self.capacity() and self._rotation and skipped < len(self._rotation):
+            user_id = self._rotation.popleft()
+            waiting = self._waiting[user_id]
+            future, cap = waiting[0]
+
+            if cap and self._in_flight.get(user_id, 0) >= cap:
+                # At its own cap: keep its turn for when one of its chunks finishes
+                self._rotation.append(user_id)
+                skipped += 1
+                continue
+
+            waiting.popleft()
+            if not future.done():
+                self._grant(user_id)
+                future.set_result(None)
+                skipped = 0
+            if waiting:
+                self._rotation.append(user_id)
+            else:
+                del self._waiting[user_id]
+
+    def _release(self, user_id: int):
+        self._active -= 1
+        self._in_flight[user_id] -= 1
+        if not self._in_flight[user_id]:
+            del self._in_flight[user_id]
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user_id: int, max_per_user: int = 0) -> AsyncIterator[None]:
+        """
+        Hold one chunk slot for `user_id` while the block runs.
+
+        Args:
+            user_id: Owner of the ingestion job
+            max_per_user: Slots this user may hold at once (0 = no cap)
+        """
+        under_cap = not max_per_user or self._in_flight.get(user_id, 0) < max_per_user
+        if self._active < self.capacity() and not self._rotation and under_cap:
+            self._grant(user_id)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            if user_id not in self._waiting:
+                self._waiting[user_id] = deque()
+                self._rotation.append(user_id)
+            self._waiting[user_id].append((future, max_per_user))
+            self.queued += 1
+            # Slots may be free while every queued user is at its cap
+            self._dispatch()
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was granted just before the cancellation
+                    self._release(user_id)
+                else:
+                    self._forget(user_id, future)
+                raise
+
+        try:
+            yield
+        finally:
+            self._release(user_id)
+
+    def _forget(self, user_id: int, future: asyncio.Future):
+        waiting = self._waiting.get(user_id)
+        if waiting is None:
+            return
+        for entry in list(waiting):
+            if entry[0] is future:
+                waiting.remove(entry)
+        if not waiting:
+            del self._waiting[user_id]
+            self._rotation.remove(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "slots": self.capacity(),
+            "active": self._active,
+            "waiting": {user_id: len(waiting) for user_id, waiting in self._waiting.items()},
+            "in_flight": dict(self._in_flight),
+            "queued_total": self.queued
+        }
+
+
+# Singleton instance
+fair_dispatcher = FairDispatcher()
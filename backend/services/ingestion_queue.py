@@ -0,0 +1,476 @@
+"""
+Ingestion Queue Service - Durable, database-backed document ingestion jobs
+
+Uploads are persisted as rows in `ingestion_jobs` and drained by a worker loop.
+Workers claim a job atomically (compare-and-set on status/attempts), hold it
+with a lease that is renewed by heartbeats, and release it when done. If a
+process dies mid-job, its lease expires and another worker picks the job up.
+"""
+import asyncio
+import os
+import socket
+import traceback
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import select, update, func, and_, or_, exists
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from concurrency_utils import get_env_int
+from database import AsyncSessionLocal
+from models import Exam, ExamStatus, IngestionJob, IngestionJobStatus
+from services.config_service import config_cache
+from services.progress_service import progress_service, ProgressUpdate, ProgressStatus
+
+
+class LeaseLostError(Exception):
+    """Another worker reclaimed the job after this worker's lease expired"""
+
+
+# A handler returns True when the document was ingested, False when the
+# pipeline itself reported a (non-retryable) failure. Raised exceptions are
+# treated as transient and retried until max_attempts is reached.
+JobHandler = Callable[[IngestionJob], Awaitable[bool]]
+
+
+class IngestionQueue:
+    """Service for enqueueing, claiming and running ingestion jobs"""
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.concurrency = get_env_int("INGEST_WORKER_CONCURRENCY", 2, minimum=1)
+        self.lease_seconds = get_env_int("INGEST_LEASE_SECONDS", 120, minimum=10)
+        self.poll_interval = get_env_int("INGEST_POLL_INTERVAL_SECONDS", 2, minimum=1)
+        self.max_attempts = get_env_int("INGEST_MAX_ATTEMPTS", 3, minimum=1)
+
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._active: Dict[int, asyncio.Task] = {}
+
+    # ==================== Producer side ====================
+
+    async def enqueue(
+        self,
+        db: AsyncSession,
+        exam_id: int,
+        user_id: int,
+        filename: str,
+        file_path: str,
+        is_random: bool = False
+    ) -> IngestionJob:
+        """
+        Persist a new ingestion job and wake up local workers.
+        Commits the session, so any pending changes (e.g. a new exam) are saved too.
+        """
+        job = IngestionJob(
+            exam_id=exam_id,
+            user_id=user_id,
+            filename=filename,
+            file_path=file_path,
+            is_random=is_random,
+            status=IngestionJobStatus.QUEUED,
+            max_attempts=self.max_attempts
+        )
+        db.add(job)
+        await db.commit()
+        await db.refresh(job)
+
+        print(f"[Ingest] Queued job {job.id} for exam {exam_id}: {filename}", flush=True)
+        self.notify()
+        return job
+
+    async def retry(self, db: AsyncSession, job: IngestionJob) -> IngestionJob:
+        """Put a failed job back in the queue with a fresh attempt budget"""
+        job.status = IngestionJobStatus.QUEUED
+        job.attempts = 0
+        job.lease_owner = None
+        job.lease_expires_at = None
+        job.last_error = None
+        job.progress = None
+        job.finished_at = None
+        await db.commit()
+
+        print(f"[Ingest] Requeued job {job.id} for exam {job.exam_id}", flush=True)
+        self.notify()
+        return job
+
+    def notify(self):
+        """Wake the worker loop so a new job is claimed without waiting for the next poll"""
+        self._wakeup.set()
+
+    # ==================== Claiming and leases ====================
+
+    async def claim_next(self) -> Optional[IngestionJob]:
+        """
+        Atomically claim the next runnable job, fairly across users.
+
+        Runnable means queued, or running with an expired lease (its worker died).
+        Jobs are never claimed while another live job for the same exam is
+        running, so appends to one exam are deduplicated sequentially.
+
+        Only each user's oldest runnable job is considered; users with the
+        fewest running jobs go first, and users already running
+        `ingest_max_jobs_per_user` jobs (SystemConfig, 0 = unlimited) wait, so
+        one user's backlog cannot occupy every worker slot.
+        """
+        now = datetime.utcnow()
+        running = aliased(IngestionJob)
+
+        async with AsyncSessionLocal() as db:
+            max_jobs_per_user = (await config_cache.get(db)).ingest_max_jobs_per_user
+
+            result = await db.execute(
+                select(func.min(IngestionJob.id))
+                .where(
+                    or_(
+                        IngestionJob.status == IngestionJobStatus.QUEUED,
+                        and_(
+                            IngestionJob.status == IngestionJobStatus.RUNNING,
+                            IngestionJob.lease_expires_at < now
+                        )
+                    )
+                )
+                .where(
+                    ~exists().where(
+                        and_(
+                            running.exam_id == IngestionJob.exam_id,
+                            running.id != IngestionJob.id,
+                            running.status == IngestionJobStatus.RUNNING,
+                            running.lease_expires_at >= now
+                        )
+                    )
+                )
+                .group_by(IngestionJob.user_id)
+            )
+            head_ids = result.scalars().all()
+            if not head_ids:
+                return None
+
+            result = await db.execute(
+                select(IngestionJob.user_id, func.count(IngestionJob.id))
+                .where(
+                    and_(
+                        IngestionJob.status == IngestionJobStatus.RUNNING,
+                        IngestionJob.lease_expires_at >= now
+                    )
+                )
+                .group_by(IngestionJob.user_id)
+            )
+            running_per_user = dict(result.all())
+
+            result = await db.execute(select(IngestionJob).where(IngestionJob.id.in_(head_ids)))
+            candidates = sorted(
+                (
+                    job for job in result.scalars().all()
+                    if not max_jobs_per_user or running_per_user.get(job.user_id, 0) < max_jobs_per_user
+                ),
+                key=lambda job: (running_per_user.get(job.user_id, 0), job.id)
+            )
+
+            for job in candidates:
+                if job.attempts >= job.max_attempts:
+                    await self._fail_exhausted(db, job)
+                    continue
+
+                # Compare-and-set: only one worker can move the job from the
+                # (status, attempts) pair it observed, and a running job only
+                # while its lease is still expired (its owner did not renew it).
+                claimed = await db.execute(
+                    update(IngestionJob)
+                    .where(
+                        and_(
+                            IngestionJob.id == job.id,
+                            IngestionJob.status == job.status,
+                            IngestionJob.attempts == job.attempts,
+                            or_(
+                                IngestionJob.status == IngestionJobStatus.QUEUED,
+                                IngestionJob.lease_expires_at < now
+                            )
+                        )
+                    )
+                    .values(
+                        status=IngestionJobStatus.RUNNING,
+                        lease_owner=self.worker_id,
+                        lease_expires_at=now + timedelta(seconds=self.lease_seconds),
+                        heartbeat_at=now,
+                        attempts=job.attempts + 1,
+                        started_at=now
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+
+                if claimed.rowcount != 1:
+                    continue
+
+                # Two workers may claim different jobs of the same exam at the
+                # same instant; the job with the lowest id keeps running.
+                result = await db.execute(
+                    select(func.count(IngestionJob.id)).where(
+                        and_(
+                            IngestionJob.exam_id == job.exam_id,
+                            IngestionJob.id < job.id,
+                            IngestionJob.status == IngestionJobStatus.RUNNING,
+                            IngestionJob.lease_expires_at >= now
+                        )
+                    )
+                )
+                if result.scalar():
+                    await self._set_job_state(job.id, IngestionJobStatus.QUEUED, job.last_error, refund_attempt=True)
+                    continue
+
+                await db.refresh(job)
+                print(f"[Ingest] Worker {self.worker_id} claimed job {job.id} (attempt {job.attempts}/{job.max_attempts})", flush=True)
+                return job
+
+        return None
+
+    async def _renew_lease(self, db: AsyncSession, job_id: int) -> bool:
+        now = datetime.utcnow()
+        result = await db.execute(
+            update(IngestionJob)
+            .where(
+                and_(
+                    IngestionJob.id == job_id,
+                    IngestionJob.status == IngestionJobStatus.RUNNING,
+                    IngestionJob.lease_owner == self.worker_id
+                )
+            )
+            .values(
+                heartbeat_at=now,
+                lease_expires_at=now + timedelta(seconds=self.lease_seconds)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount == 1
+
+    async def heartbeat(self, job_id: int) -> bool:
+        """Extend the lease of a job held by this worker. Returns False if the lease was lost."""
+        async with AsyncSessionLocal() as db:
+            renewed = await self._renew_lease(db, job_id)
+            await db.commit()
+            return renewed
+
+    async def confirm_lease(self, db: AsyncSession, job_id: int):
+        """
+        Renew the lease inside the caller's transaction, right before it commits
+        results; raises LeaseLostError if another worker owns the job now.
+        """
+        if not await self._renew_lease(db, job_id):
+            raise LeaseLostError(f"Lease on job {job_id} was lost")
+
+    async def _heartbeat_loop(self, job_id: int, work: asyncio.Task) -> bool:
+        """Renew the lease until cancelled; on lease loss stop `work` and return False"""
+        interval = max(1, self.lease_seconds // 3)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not await self.heartbeat(job_id):
+                    print(f"[Ingest] ⚠️ Lost lease on job {job_id}, stopping it", flush=True)
+                    work.cancel()
+                    return False
+            except Exception as e:
+                print(f"[Ingest] ⚠️ Heartbeat failed for job {job_id}: {e}", flush=True)
+
+    async def _set_job_state(
+        self,
+        job_id: int,
+        status: IngestionJobStatus,
+        error: Optional[str] = None,
+        refund_attempt: bool = False
+    ):
+        """Move a job held by this worker to a new state and drop the lease"""
+        values = {
+            "status": status,
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "last_error": error
+        }
+        if status in (IngestionJobStatus.SUCCEEDED, IngestionJobStatus.FAILED):
+            values["finished_at"] = datetime.utcnow()
+        if refund_attempt:
+            values["attempts"] = IngestionJob.attempts - 1
+
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(IngestionJob)
+                .where(
+                    and_(
+                        IngestionJob.id == job_id,
+                        IngestionJob.lease_owner == self.worker_id
+                    )
+                )
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+    async def _fail_exhausted(self, db: AsyncSession, job: IngestionJob):
+        """Give up on a job whose worker kept dying and mark its exam failed"""
+        result = await db.execute(
+            update(IngestionJob)
+            .where(
+                and_(
+                    IngestionJob.id == job.id,
+                    IngestionJob.status == job.status,
+                    IngestionJob.attempts == job.attempts
+                )
+            )
+            .values(
+                status=IngestionJobStatus.FAILED,
+                lease_owner=None,
+                lease_expires_at=None,
+                finished_at=datetime.utcnow(),
+                last_error=job.last_error or "Exceeded maximum attempts"
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            await self._mark_exam_failed(db, job.exam_id)
+            print(f"[Ingest] ❌ Job {job.id} exceeded {job.max_attempts} attempts, giving up", flush=True)
+        await db.commit()
+
+    async def _mark_exam_failed(self, db: AsyncSession, exam_id: int):
+        await db.execute(
+            update(Exam)
+            .where(
+                and_(
+                    Exam.id == exam_id,
+                    Exam.status.in_([ExamStatus.PENDING, ExamStatus.PROCESSING])
+                )
+            )
+            .values(status=ExamStatus.FAILED)
+            .execution_options(synchronize_session=False)
+        )
+        await progress_service.update_progress(ProgressUpdate(
+            exam_id=exam_id,
+            status=ProgressStatus.FAILED,
+            message="处理失败：解析任务多次中断",
+            progress=0.0
+        ))
+
+    # ==================== Cross-process progress ====================
+
+    async def persist_progress(self, progress_update: ProgressUpdate):
+        """
+        Progress sink: store the latest update on the job this worker is running,
+        so SSE endpoints served by other processes can follow along.
+        """
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(IngestionJob)
+                .where(
+                    and_(
+                        IngestionJob.exam_id == progress_update.exam_id,
+                        IngestionJob.status == IngestionJobStatus.RUNNING,
+                        IngestionJob.lease_owner == self.worker_id
+                    )
+                )
+                .values(progress=progress_update.to_dict())
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+    async def get_persisted_progress(self, exam_id: int) -> Optional[ProgressUpdate]:
+        """Latest progress snapshot stored by whichever worker handles the exam"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(IngestionJob.progress)
+                .where(IngestionJob.exam_id == exam_id)
+                .order_by(IngestionJob.id.desc())
+                .limit(1)
+            )
+            snapshot = result.scalar_one_or_none()
+
+        return ProgressUpdate.from_dict(snapshot) if snapshot else None
+
+    # ==================== Worker loop ====================
+
+    async def _execute(self, job: IngestionJob, handler: JobHandler):
+        work = asyncio.create_task(handler(job))
+        heartbeat_task = asyncio.create_task(self._heartbeat_loop(job.id, work))
+        try:
+            succeeded = await work
+        except (asyncio.CancelledError, LeaseLostError) as e:
+            lease_lost = isinstance(e, LeaseLostError) or (
+                heartbeat_task.done() and not heartbeat_task.cancelled() and heartbeat_task.result() is False
+            )
+            if lease_lost:
+                # The job belongs to the worker that reclaimed it; leave its state alone
+                print(f"[Ingest] ⚠️ Abandoned job {job.id}: lease taken over by another worker", flush=True)
+                return
+            # Shutting down: hand the job back without charging an attempt
+            heartbeat_task.cancel()
+            await self._set_job_state(job.id, IngestionJobStatus.QUEUED, "Worker shut down", refund_attempt=True)
+            print(f"[Ingest] Released job {job.id} on shutdown", flush=True)
+            raise
+        except Exception as e:
+            print(f"[Ingest] ⚠️ Job {job.id} crashed: {e}\n{traceback.format_exc()}", flush=True)
+            if job.attempts >= job.max_attempts:
+                await self._set_job_state(job.id, IngestionJobStatus.FAILED, str(e))
+                async with AsyncSessionLocal() as db:
+                    await self._mark_exam_failed(db, job.exam_id)
+                    await db.commit()
+            else:
+                await self._set_job_state(job.id, IngestionJobStatus.QUEUED, str(e))
+        else:
+            if succeeded:
+                await self._set_job_state(job.id, IngestionJobStatus.SUCCEEDED)
+            else:
+                await self._set_job_state(job.id, IngestionJobStatus.FAILED, "Document processing failed")
+        finally:
+            heartbeat_task.cancel()
+
+    async def run(self, handler: JobHandler):
+        """
+        Claim and execute jobs until stop() is called.
+        At most INGEST_WORKER_CONCURRENCY jobs run at once in this process.
+        """
+        print(f"[Ingest] Worker {self.worker_id} started (concurrency={self.concurrency})", flush=True)
+        self._stopping = False
+        progress_service.add_sink(self.persist_progress)
+
+        while not self._stopping:
+            self._wakeup.clear()
+
+            while len(self._active) < self.concurrency and not self._stopping:
+                try:
+                    job = await self.claim_next()
+                except Exception as e:
+                    print(f"[Ingest] ⚠️ Failed to claim job: {e}", flush=True)
+                    job = None
+
+                if job is None:
+                    break
+
+                task = asyncio.create_task(self._execute(job, handler))
+                self._active[job.id] = task
+                task.add_done_callback(lambda _task, job_id=job.id: self._on_job_done(job_id))
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _on_job_done(self, job_id: int):
+        self._active.pop(job_id, None)
+        self._wakeup.set()
+
+    async def stop(self):
+        """Stop claiming new jobs and release the ones in progress"""
+        self._stopping = True
+        self._wakeup.set()
+
+        active = list(self._active.values())
+        for task in active:
+            task.cancel()
+        if active:
+            await asyncio.gather(*active, return_exceptions=True)
+
+        print(f"[Ingest] Worker {self.worker_id} stopped", flush=True)
+
+
+# Singleton instance
+ingestion_queue = IngestionQueue()
@@ -0,0 +1,211 @@
+"""
+LLM Cache Service - Persistent on-disk cache of LLM responses
+
+Responses are stored in a local SQLite file keyed by a fingerprint of
+provider, model, temperature, max tokens and the full prompt (plus any
+attached document bytes), so re-ingests, retries and repeated grading reuse
+earlier answers instead of calling the provider again. Entries expire after
+LLM_CACHE_TTL_SECONDS and the least recently used ones are evicted once the
+cache grows past LLM_CACHE_MAX_ENTRIES or LLM_CACHE_MAX_MB.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+
+import aiosqlite
+
+from concurrency_utils import get_env_int
+
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_MB = 200
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_responses (
+    fingerprint TEXT PRIMARY KEY,
+    call_site TEXT NOT NULL,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_llm_responses_last_used ON llm_responses (last_used_at);
+"""
+
+
+class LLMCache:
+    """Size-bounded LRU/TTL cache of provider responses shared by all processes on the host"""
+
+    def __init__(self):
+        self._db: Optional[aiosqlite.Connection] = None
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+
+    @staticmethod
+    def get_path() -> str:
+        return os.getenv("LLM_CACHE_PATH", "./data/llm_cache.db")
+
+    @staticmethod
+    def fingerprint(
+        provider: str,
+        model: str,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        attachment: Optional[bytes] = None
+    ) -> str:
+        """SHA-256 over every request parameter that can change the response"""
+        digest = hashlib.sha256()
+        digest.update(json.dumps(
+            [provider, model, temperature, max_tokens, system_prompt, prompt],
+            ensure_ascii=False
+        ).encode("utf-8"))
+        if attachment is not None:
+            digest.update(b"\0attachment\0")
+            digest.update(attachment)
+        return digest.hexdigest()
+
+    async def _connect(self) -> aiosqlite.Connection:
+        if self._db is None:
+            async with self._lock:
+                if self._db is None:
+                    path = self.get_path()
+                    directory = os.path.dirname(path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+
+                    db = await aiosqlite.connect(path)
+                    # WAL + busy timeout: API and worker processes share the file
+                    await db.execute("PRAGMA journal_mode=WAL")
+                    await db.execute("PRAGMA busy_timeout=5000")
+                    await db.executescript(SCHEMA)
+                    await db.commit()
+                    self._db = db
+                    print(f"[LLM Cache] Using {path}", flush=True)
+        return self._db
+
+    async def get(self, fingerprint: str) -> Optional[str]:
+        """Cached response text, or None on a miss / expired entry"""
+        if not self.is_enabled():
+            return None
+
+        try:
+            db = await self._connect()
+            now = time.time()
+            ttl = get_env_int("LLM_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS)
+
+            async with db.execute(
+                "SELECT response, created_at FROM llm_responses WHERE fingerprint = ?",
+                (fingerprint,)
+            ) as cursor:
+                row = await cursor.fetchone()
+
+            if row is None or (ttl and now - row[1] > ttl):
+                self.misses += 1
+                return None
+
+            await db.execute(
+                "UPDATE llm_responses SET hits = hits + 1, last_used_at = ? WHERE fingerprint = ?",
+                (now, fingerprint)
+            )
+            await db.commit()
+            self.hits += 1
+            return row[0]
+        except Exception as e:
+            # The cache must never break a provider call
+            print(f"[LLM Cache] ⚠️ Lookup failed: {e}", flush=True)
+            self.misses += 1
+            return None
+
+    async def put(self, fingerprint: str, response: str, call_site: str):
+        """Store a response and evict expired / least recently used entries past the limits"""
+        if not self.is_enabled():
+            return
+
+        try:
+            db = await self._connect()
+            now = time.time()
+            await db.execute(
+                "INSERT OR REPLACE INTO llm_responses "
+                "(fingerprint, call_site, response, size, hits, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, 0, ?, ?)",
+                (fingerprint, call_site, response, len(response.encode("utf-8")), now, now)
+            )
+            await self._evict(db, now)
+            await db.commit()
+        except Exception as e:
+            print(f"[LLM Cache] ⚠️ Store failed: {e}", flush=True)
+
+    async def _evict(self, db: aiosqlite.Connection, now: float):
+        ttl = get_env_int("LLM_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS)
+        max_entries = get_env_int("LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES, minimum=1)
+        max_bytes = get_env_int("LLM_CACHE_MAX_MB", DEFAULT_MAX_MB, minimum=1) * 1024 * 1024
+
+        if ttl:
+            cursor = await db.execute("DELETE FROM llm_responses WHERE created_at < ?", (now - ttl,))
+            self.evictions += max(cursor.rowcount, 0)
+
+        async with db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_responses") as cursor:
+            entries, total_bytes = await cursor.fetchone()
+
+        if entries <= max_entries and total_bytes <= max_bytes:
+            return
+
+        # Drop least recently used entries until both limits hold again
+        excess_entries = max(0, entries - max_entries)
+        excess_bytes = max(0, total_bytes - max_bytes)
+        evict = []
+        freed = 0
+        async with db.execute(
+            "SELECT fingerprint, size FROM llm_responses ORDER BY last_used_at ASC"
+        ) as cursor:
+            async for fingerprint, size in cursor:
+                if len(evict) >= excess_entries and freed >= excess_bytes:
+                    break
+                evict.append((fingerprint,))
+                freed += size
+
+        await db.executemany("DELETE FROM llm_responses WHERE fingerprint = ?", evict)
+        self.evictions += len(evict)
+
+    async def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of this process plus current cache size"""
+        stats: Dict[str, Any] = {
+            "enabled": self.is_enabled(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / (self.hits + self.misses), 3) if self.hits + self.misses else 0.0
+        }
+        if not self.is_enabled():
+            return stats
+
+        try:
+            db = await self._connect()
+            async with db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_responses") as cursor:
+                entries, total_bytes = await cursor.fetchone()
+            stats["entries"] = entries
+            stats["size_mb"] = round(total_bytes / (1024 * 1024), 2)
+        except Exception as e:
+            stats["error"] = str(e)
+        return stats
+
+    async def close(self):
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+
+# Singleton instance
+llm_cache = LLMCache()
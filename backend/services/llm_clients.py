@@ -0,0 +1,126 @@
+"""
+LLM Client Registry - Process-wide pooled provider clients
+
+LLMService is constructed per request / ingestion job, but the SDK clients it
+uses are shared here, keyed by provider, base URL and API key. Every client
+sits on one httpx connection pool with configurable limits and keep-alive, so
+requests reuse warm TLS connections instead of opening (and leaking) a new
+pool each time. All clients are closed on shutdown.
+"""
+import hashlib
+from typing import Any, Dict, Tuple
+
+import httpx
+from openai import AsyncOpenAI
+from anthropic import AsyncAnthropic
+
+from concurrency_utils import get_env_int
+
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 10
+DEFAULT_KEEPALIVE_EXPIRY_SECONDS = 30
+DEFAULT_REQUEST_TIMEOUT_SECONDS = 120
+
+
+def key_fingerprint(api_key: str) -> str:
+    """Stable identifier of an API key that is safe to show in stats and logs"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+class LLMClientRegistry:
+    """Shared AsyncOpenAI / AsyncAnthropic / httpx clients with pool statistics"""
+
+    def __init__(self):
+        self._clients: Dict[Tuple[str, str, str], Any] = {}
+        self._pools: Dict[Tuple[str, str, str], httpx.AsyncClient] = {}
+        self.created = 0
+        self.reused = 0
+
+    @staticmethod
+    def _key(provider: str, base_url: str, api_key: str) -> Tuple[str, str, str]:
+        # The key is hashed so the registry never exposes it in stats or logs
+        return provider, base_url or "", key_fingerprint(api_key)
+
+    @staticmethod
+    def _timeout() -> float:
+        return float(get_env_int("LLM_REQUEST_TIMEOUT_SECONDS", DEFAULT_REQUEST_TIMEOUT_SECONDS, minimum=1))
+
+    @staticmethod
+    def _new_pool() -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=get_env_int("LLM_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS, minimum=1),
+            max_keepalive_connections=get_env_int(
+                "LLM_MAX_KEEPALIVE_CONNECTIONS", DEFAULT_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            keepalive_expiry=get_env_int("LLM_KEEPALIVE_EXPIRY_SECONDS", DEFAULT_KEEPALIVE_EXPIRY_SECONDS)
+        )
+        return httpx.AsyncClient(timeout=LLMClientRegistry._timeout(), limits=limits)
+
+    def _get(self, provider: str, base_url: str, api_key: str, factory) -> Any:
+        key = self._key(provider, base_url, api_key)
+        client = self._clients.get(key)
+        if client is not None:
+            self.reused += 1
+            return client
+
+        pool = self._new_pool()
+        client = factory(pool)
+        self._clients[key] = client
+        self._pools[key] = pool
+        self.created += 1
+        print(f"[LLM Clients] Created {provider} client for {base_url or 'default endpoint'}", flush=True)
+        return client
+
+    def get_openai(self, provider: str, api_key: str, base_url: str, default_headers: Dict[str, str]) -> AsyncOpenAI:
+        """OpenAI-compatible client (OpenAI, Qwen)"""
+        return self._get(provider, base_url, api_key, lambda pool: AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            default_headers=default_headers,
+            timeout=self._timeout(),
+            max_retries=0,  # Retries and backoff are handled by llm_resilience
+            http_client=pool
+        ))
+
+    def get_anthropic(self, api_key: str) -> AsyncAnthropic:
+        return self._get("anthropic", "", api_key, lambda pool: AsyncAnthropic(
+            api_key=api_key,
+            timeout=self._timeout(),
+            max_retries=0,
+            http_client=pool
+        ))
+
+    def get_http(self, provider: str, api_key: str, base_url: str) -> httpx.AsyncClient:
+        """Plain httpx client for REST providers (Gemini)"""
+        return self._get(provider, base_url, api_key, lambda pool: pool)
+
+    def stats(self) -> Dict[str, Any]:
+        """Client counts and per-pool connection usage"""
+        pools = []
+        for (provider, base_url, _), pool in self._pools.items():
+            entry: Dict[str, Any] = {"provider": provider, "base_url": base_url}
+            try:
+                connections = pool._transport._pool.connections
+                entry["connections"] = len(connections)
+                entry["idle"] = sum(1 for connection in connections if connection.is_idle())
+            except AttributeError:
+                # Pool internals differ between httpx versions
+                pass
+            pools.append(entry)
+
+        return {
+            "clients": len(self._clients),
+            "created": self.created,
+            "reused": self.reused,
+            "pools": pools
+        }
+
+    async def close(self):
+        for pool in self._pools.values():
+            await pool.aclose()
+        self._clients.clear()
+        self._pools.clear()
+
+
+# Singleton instance
+llm_clients = LLMClientRegistry()
@@ -0,0 +1,253 @@
+"""
+LLM Resilience - Retries with backoff and per-provider circuit breakers
+
+Provider calls are retried on rate limits, 5xx responses, timeouts and
+connection errors with jittered exponential backoff (honouring Retry-After).
+Consecutive upstream failures open a per-provider circuit breaker; while it
+is open, callers either wait for the cool-down (bulk ingestion slows down
+instead of failing) or fail fast so LLMService can switch to the fallback
+provider.
+"""
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+import openai
+import anthropic
+
+from concurrency_utils import get_env_int
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+CONNECTION_ERRORS = (
+    httpx.TransportError,
+    openai.APIConnectionError,
+    anthropic.APIConnectionError,
+    asyncio.TimeoutError,
+)
+
+DEFAULT_RETRY_ATTEMPTS = 4
+DEFAULT_RETRY_BASE_DELAY_MS = 500
+DEFAULT_RETRY_MAX_DELAY_SECONDS = 30
+DEFAULT_BREAKER_FAILURE_THRESHOLD = 5
+DEFAULT_BREAKER_RESET_SECONDS = 30
+
+
+class LLMUnavailableError(Exception):
+    """The provider kept failing (or its circuit is open) after all retries"""
+
+
+class KeyRejectedError(Exception):
+    """One API key was rejected (401/403/429) while other keys can serve the request"""
+
+
+def status_code(error: BaseException) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether an error is a transient upstream failure worth retrying"""
+    if isinstance(error, CONNECTION_ERRORS):
+        return True
+    status = status_code(error)
+    return status is not None and status in RETRYABLE_STATUS_CODES
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _describe(error: BaseException) -> str:
+    status = status_code(error)
+    return f"HTTP {status}" if status else type(error).__name__
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `threshold` consecutive failures; after `reset_seconds`
+    a single probe call is let through (half-open) and decides whether the
+    circuit closes again.
+    """
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened_count = 0
+        self._probe_in_flight = False
+
+    @staticmethod
+    def _reset_seconds() -> int:
+        return get_env_int("LLM_BREAKER_RESET_SECONDS", DEFAULT_BREAKER_RESET_SECONDS, minimum=1)
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self._reset_seconds():
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit lets a call through again"""
+        if self.state == "open":
+            return max(0.0, self.opened_at + self._reset_seconds() - time.monotonic())
+        return DEFAULT_RETRY_BASE_DELAY_MS / 1000
+
+    def release(self):
+        """The probe ended without a verdict on the provider (cancelled, local error)"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        if self.state != "closed":
+            print(f"[LLM Breaker] {self.provider} recovered, closing circuit", flush=True)
+        self.state = "closed"
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._probe_in_flight = False
+        self.failures += 1
+        threshold = get_env_int("LLM_BREAKER_FAILURE_THRESHOLD", DEFAULT_BREAKER_FAILURE_THRESHOLD, minimum=1)
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= threshold):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.opened_count += 1
+            print(
+                f"[LLM Breaker] {self.provider} opened after {self.failures} consecutive failures, "
+                f"pausing calls for {self._reset_seconds()}s",
+                flush=True
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "opened_count": self.opened_count,
+            "retry_after_seconds": round(self.retry_after(), 1) if self.state == "open" else 0
+        }
+
+
+class ProviderResilience:
+    """Retry loop and circuit breakers shared by every LLMService in the process"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.retries = 0
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        if provider not in self._breakers:
+            self._breakers[provider] = CircuitBreaker(provider)
+        return self._breakers[provider]
+
+    @staticmethod
+    def _backoff(attempt: int, error: Optional[BaseException]) -> float:
+        """Full-jitter exponential backoff, at least the server's Retry-After"""
+        base = get_env_int("LLM_RETRY_BASE_DELAY_MS", DEFAULT_RETRY_BASE_DELAY_MS) / 1000
+        cap = get_env_int("LLM_RETRY_MAX_DELAY_SECONDS", DEFAULT_RETRY_MAX_DELAY_SECONDS)
+        delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+        retry_after = retry_after_seconds(error) if error is not None else None
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return min(cap, delay)
+
+    async def call(
+        self,
+        provider: str,
+        operation: Callable[[], Awaitable[T]],
+        call_site: str = "llm",
+        fail_fast: bool = False,
+        can_retry: Optional[Callable[[], bool]] = None
+    ) -> T:
+        """
+        Run `operation` (one provider request) with retries.
+
+        Args:
+            provider: Breaker key
+            operation: Coroutine function performing a single attempt
+            call_site: Name used for logging
+            fail_fast: Raise at once while the circuit is open instead of
+                waiting for the cool-down (used when a fallback provider exists)
+            can_retry: Checked before each retry, e.g. to stop once a stream
+                has already delivered results
+
+        Raises:
+            LLMUnavailableError when the retries are exhausted or the circuit
+            stays open; non-retryable errors (bad request, auth) propagate as is
+        """
+        breaker = self.breaker(provider)
+        attempts = get_env_int("LLM_RETRY_ATTEMPTS", DEFAULT_RETRY_ATTEMPTS, minimum=1)
+        cap = get_env_int("LLM_RETRY_MAX_DELAY_SECONDS", DEFAULT_RETRY_MAX_DELAY_SECONDS)
+
+        for attempt in range(attempts):
+            last_attempt = attempt + 1 >= attempts
+            if not breaker.allow():
+                if fail_fast or last_attempt:
+                    raise LLMUnavailableError(f"{provider} circuit is open")
+                delay = min(cap, breaker.retry_after() + random.uniform(0, 1))
+                print(f"[LLM Breaker] {call_site} waiting {delay:.1f}s for {provider} circuit", flush=True)
+                await asyncio.sleep(delay)
+                continue
+
+            try:
+                result = await operation()
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            except KeyRejectedError as e:
+                # Not a provider outage: retry at once, the scheduler picks another key
+                breaker.release()
+                if last_attempt or (can_retry is not None and not can_retry()):
+                    raise LLMUnavailableError(f"{provider} keys rejected: {e}") from e
+                print(f"[LLM Retry] {call_site} on {provider}: {e}, switching key", flush=True)
+                continue
+            except Exception as e:
+                if not is_retryable(e):
+                    status = status_code(e)
+                    if status is not None and 400 <= status < 500:
+                        # The provider answered; the request itself is at fault
+                        breaker.record_success()
+                    else:
+                        # A local error says nothing about the provider's health
+                        breaker.release()
+                    raise
+                breaker.record_failure()
+                if last_attempt or (can_retry is not None and not can_retry()):
+                    raise LLMUnavailableError(f"{provider} unavailable ({_describe(e)}): {e}") from e
+                delay = self._backoff(attempt, e)
+                self.retries += 1
+                print(
+                    f"[LLM Retry] {call_site} on {provider} failed ({_describe(e)}), "
+                    f"retry {attempt + 1}/{attempts - 1} in {delay:.1f}s",
+                    flush=True
+                )
+                await asyncio.sleep(delay)
+            else:
+                breaker.record_success()
+                return result
+
+        raise LLMUnavailableError(f"{provider} circuit is open")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "retries": self.retries,
+            "breakers": {provider: breaker.stats() for provider, breaker in self._breakers.items()}
+        }
+
+
+# Singleton instance
+llm_resilience = ProviderResilience()
@@ -0,0 +1,426 @@
+"""
+LLM Scheduler - Process-wide token buckets for provider rate limits
+
+Every provider request (including retries) takes one request and an estimated
+number of tokens from the buckets of its provider/model/API key before it is
+sent; callers queue while a bucket is empty. Once the provider reports actual
+usage the token bucket is corrected, so concurrent ingestions and live grading
+share the quota and run close to it without 429 storms.
+
+Requests run in one of two lanes. Interactive calls (a user is waiting, e.g.
+short-answer grading) always go ahead of queued bulk calls (document parsing,
+batch reference answers), and bulk calls leave LLM_INTERACTIVE_RESERVE_PERCENT
+of every bucket untouched, so a large ingestion cannot drain the quota that
+grading needs. A bulk call already waiting for its bucket yields its place as
+soon as an interactive call arrives. Independently of any rate limit, bulk
+calls may hold at most LLM_BULK_MAX_IN_FLIGHT requests per provider key, by
+default the connection pool minus the same reserve, so grading always finds a
+free connection.
+
+When a provider is configured with several API keys, each request goes to the
+key with the most remaining quota and the fewest recent errors; keys answering
+401/403 or 429 are rested for a while and the request moves to another key.
+
+Limits come from LLM_RATE_LIMITS and apply per API key, e.g.
+    gemini=15:1000000,openai/gpt-4o-mini=500:200000
+(`provider[/model]=requests_per_minute:tokens_per_minute`, 0 = unlimited).
+Providers without an entry are not throttled.
+"""
+import asyncio
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from concurrency_utils import get_env_int
+from services.llm_clients import DEFAULT_MAX_CONNECTIONS
+from services.llm_resilience import KeyRejectedError, is_retryable, retry_after_seconds, status_code
+
+# Rough tokenizer-free estimate: CJK characters are about one token each,
+# other text about four characters per token
+ASCII_CHARS_PER_TOKEN = 4
+TOKENS_PER_PDF_PAGE = 258
+DEFAULT_OUTPUT_TOKENS = 1024
+PDF_PAGE_PATTERN = re.compile(rb"/Type\s*/Page\b")
+
+ERROR_RATE_DECAY = 0.2  # Weight of the newest outcome in a key's error rate
+ERROR_PENALTY_SECONDS = 5.0  # A key failing every call ranks like one with 5 s of queueing
+DEFAULT_KEY_RATE_LIMIT_COOLDOWN_SECONDS = 10
+MAX_KEY_RATE_LIMIT_COOLDOWN_SECONDS = 300
+DEFAULT_KEY_AUTH_COOLDOWN_SECONDS = 600
+DEFAULT_INTERACTIVE_RESERVE_PERCENT = 20
+
+INTERACTIVE = 0
+BULK = 1
+LANE_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    if not text:
+        return 0
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return (len(text) - ascii_chars) + ascii_chars // ASCII_CHARS_PER_TOKEN + 1
+
+
+def estimate_request_tokens(
+    prompt: str,
+    system_prompt: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+    pdf_bytes: Optional[bytes] = None
+) -> int:
+    """Input estimate plus the output budget, as providers count both against TPM"""
+    tokens = estimate_tokens(prompt) + estimate_tokens(system_prompt)
+    if pdf_bytes is not None:
+        tokens += max(1, len(PDF_PAGE_PATTERN.findall(pdf_bytes))) * TOKENS_PER_PDF_PAGE
+    return tokens + (max_tokens or DEFAULT_OUTPUT_TOKENS)
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute up to `per_minute`; may go into debt"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.available = float(per_minute)
+        self._updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, reserve: float = 0.0) -> float:
+        """Seconds until `amount` can be taken while leaving `reserve` (0-1) of the bucket"""
+        # A request larger than the whole bucket only waits for a full bucket
+        needed = min(amount + reserve * self.capacity, self.capacity) - self.available
+        return max(0.0, needed / self.rate)
+
+    def take(self, amount: float):
+        self.available -= amount
+
+    def give_back(self, amount: float):
+        self.available = min(self.capacity, self.available + amount)
+
+
+class ProviderLimiter:
+    """Request and token buckets of one provider/model/API key"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.calls = {lane: 0 for lane in LANE_NAMES}
+        self.waits = {lane: 0 for lane in LANE_NAMES}
+        self.wait_seconds = {lane: 0.0 for lane in LANE_NAMES}
+        self.estimated_tokens = 0
+        self.reported_tokens = 0
+        self._queue: List[Tuple[int, int]] = []  # (lane, arrival) of waiting callers
+        self._arrivals = 0
+        self._changed = asyncio.Condition()
+
+    @staticmethod
+    def reserve(lane: int) -> float:
+        """Share of each bucket bulk calls must leave for interactive ones"""
+        if lane == INTERACTIVE:
+            return 0.0
+        percent = get_env_int("LLM_INTERACTIVE_RESERVE_PERCENT", DEFAULT_INTERACTIVE_RESERVE_PERCENT)
+        return min(percent, 90) / 100
+
+    def wait_time(self, tokens: int, lane: int = INTERACTIVE) -> float:
+        """Seconds until a request of this size would be admitted in `lane`"""
+        wait = 0.0
+        reserve = self.reserve(lane)
+        for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+            if bucket is not None:
+                bucket.refill()
+                wait = max(wait, bucket.wait_time(amount, reserve))
+        return wait
+
+    async def acquire(self, tokens: int, lane: int = BULK):
+        """
+        Wait until the buckets admit this request. Only the head of the queue
+        (interactive first, then by arrival) may take from the buckets; it
+        sleeps on the condition so a newly arrived interactive call wakes it
+        and takes its place.
+        """
+        started = time.monotonic()
+        async with self._changed:
+            self._arrivals += 1
+            entry = (lane, self._arrivals)
+            self._queue.append(entry)
+            self._changed.notify_all()
+            try:
+                while True:
+                    wait = None
+                    if min(self._queue) == entry:
+                        wait = self.wait_time(tokens, lane)
+                        if wait <= 0:
+                            break
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self._queue.remove(entry)
+                self._changed.notify_all()
+
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(tokens)
+
+        waited = time.monotonic() - started
+        self.calls[lane] += 1
+        self.estimated_tokens += tokens
+        if waited > 0.01:
+            self.waits[lane] += 1
+            self.wait_seconds[lane] += waited
+
+    def reconcile(self, estimated: int, actual: int):
+        """Correct the token bucket once the provider reported real usage"""
+        self.reported_tokens += actual
+        if self.tokens is None:
+            return
+        if actual > estimated:
+            self.tokens.take(actual - estimated)
+        else:
+            self.tokens.give_back(estimated - actual)
+
+    def stats(self) -> Dict[str, Any]:
+        def bucket_stats(bucket: Optional[TokenBucket]) -> Optional[Dict[str, float]]:
+            if bucket is None:
+                return None
+            bucket.refill()
+            return {"per_minute": int(bucket.capacity), "available": round(bucket.available)}
+
+        return {
+            "requests": bucket_stats(self.requests),
+            "tokens": bucket_stats(self.tokens),
+            "queued": len(self._queue),
+            "lanes": {
+                name: {
+                    "calls": self.calls[lane],
+                    "throttled_calls": self.waits[lane],
+                    "throttled_seconds": round(self.wait_seconds[lane], 1)
+                }
+                for lane, name in LANE_NAMES.items()
+            },
+            "estimated_tokens": self.estimated_tokens,
+            "reported_tokens": self.reported_tokens
+        }
+
+
+class KeyHealth:
+    """Recent outcomes of one API key"""
+
+    def __init__(self):
+        self.error_rate = 0.0
+        self.consecutive_rejections = 0
+        self.cooldown_until = 0.0
+        self.in_flight = 0
+        self.last_used = 0.0
+        self.calls = 0
+        self.rejections = 0
+
+    def available(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+    def record_success(self):
+        self.error_rate *= 1 - ERROR_RATE_DECAY
+        self.consecutive_rejections = 0
+
+    def record_error(self, error: BaseException) -> bool:
+        """Returns True when the key itself was rejected and is now resting"""
+        self.error_rate = self.error_rate * (1 - ERROR_RATE_DECAY) + ERROR_RATE_DECAY
+        status = status_code(error)
+        if status in (401, 403):
+            cooldown = get_env_int("LLM_KEY_AUTH_COOLDOWN_SECONDS", DEFAULT_KEY_AUTH_COOLDOWN_SECONDS)
+        elif status == 429:
+            # Doubles while the key keeps getting limited, at least Retry-After
+            base = get_env_int("LLM_KEY_RATE_LIMIT_COOLDOWN_SECONDS", DEFAULT_KEY_RATE_LIMIT_COOLDOWN_SECONDS)
+            cooldown = min(MAX_KEY_RATE_LIMIT_COOLDOWN_SECONDS, base * (2 ** self.consecutive_rejections))
+            cooldown = max(cooldown, retry_after_seconds(error) or 0)
+        else:
+            return False
+
+        self.consecutive_rejections += 1
+        self.rejections += 1
+        self.cooldown_until = time.monotonic() + cooldown
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "in_flight": self.in_flight,
+            "error_rate": round(self.error_rate, 2),
+            "rejections": self.rejections,
+            "resting_seconds": round(max(0.0, self.cooldown_until - time.monotonic()))
+        }
+
+
+class Lease:
+    """The API key chosen for one request and the usage it reported"""
+
+    def __init__(self, key_index: int):
+        self.key_index = key_index
+        self.usage: Dict[str, int] = {}
+
+
+class LLMScheduler:
+    """Routes every provider request through the limiter of its provider/model/key"""
+
+    def __init__(self):
+        self._limiters: Dict[Tuple[str, str, str], Optional[ProviderLimiter]] = {}
+        self._health: Dict[Tuple[str, str], KeyHealth] = {}
+        self._bulk_gates: Dict[Tuple[str, str], asyncio.Semaphore] = {}
+        self._bulk_in_flight: Dict[Tuple[str, str], int] = {}
+
+    @staticmethod
+    def _configured_limits() -> Dict[str, Tuple[int, int]]:
+        limits: Dict[str, Tuple[int, int]] = {}
+        for entry in os.getenv("LLM_RATE_LIMITS", "").split(","):
+            if not entry.strip():
+                continue
+            try:
+                target, values = entry.split("=", 1)
+                rpm, tpm = (values.split(":", 1) + ["0"])[:2]
+                limits[target.strip()] = (int(rpm or 0), int(tpm or 0))
+            except ValueError:
+                print(f"[LLM Scheduler] Ignoring malformed LLM_RATE_LIMITS entry: {entry}", flush=True)
+        return limits
+
+    def limiter(self, provider: str, model: str, key_id: str = "") -> Optional[ProviderLimiter]:
+        key = (provider, model, key_id)
+        if key not in self._limiters:
+            limits = self._configured_limits()
+            rpm, tpm = limits.get(f"{provider}/{model}") or limits.get(provider) or (0, 0)
+            self._limiters[key] = ProviderLimiter(rpm, tpm) if rpm > 0 or tpm > 0 else None
+            if self._limiters[key]:
+                print(f"[LLM Scheduler] {provider}/{model}: {rpm or '∞'} RPM, {tpm or '∞'} TPM", flush=True)
+        return self._limiters[key]
+
+    @staticmethod
+    def bulk_capacity() -> int:
+        """LLM_BULK_MAX_IN_FLIGHT, by default LLM_MAX_CONNECTIONS minus the interactive reserve"""
+        connections = get_env_int("LLM_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS, minimum=1)
+        reserved = max(1, round(connections * ProviderLimiter.reserve(BULK)))
+        return get_env_int("LLM_BULK_MAX_IN_FLIGHT", max(1, connections - reserved), minimum=1)
+
+    def bulk_gate(self, provider: str, key_id: str) -> asyncio.Semaphore:
+        key = (provider, key_id)
+        if key not in self._bulk_gates:
+            self._bulk_gates[key] = asyncio.Semaphore(self.bulk_capacity())
+            self._bulk_in_flight[key] = 0
+        return self._bulk_gates[key]
+
+    def health(self, provider: str, key_id: str) -> KeyHealth:
+        key = (provider, key_id)
+        if key not in self._health:
+            self._health[key] = KeyHealth()
+        return self._health[key]
+
+    def _pick_key(self, provider: str, model: str, key_ids: Sequence[str], tokens: int, lane: int) -> int:
+        if len(key_ids) == 1:
+            return 0
+
+        now = time.monotonic()
+        candidates = [index for index, key_id in enumerate(key_ids) if self.health(provider, key_id).available(now)]
+        if not candidates:
+            # Every key is resting: use the one that recovers first rather than failing
+            return min(range(len(key_ids)), key=lambda index: self.health(provider, key_ids[index]).cooldown_until)
+
+        def score(index: int) -> Tuple[float, int, float]:
+            limiter = self.limiter(provider, model, key_ids[index])
+            health = self.health(provider, key_ids[index])
+            wait = limiter.wait_time(tokens, lane) if limiter is not None else 0.0
+            return wait + health.error_rate * ERROR_PENALTY_SECONDS, health.in_flight, health.last_used
+
+        return min(candidates, key=score)
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        provider: str,
+        model: str,
+        estimated_tokens: int,
+        key_ids: Sequence[str] = ("",),
+        interactive: bool = False
+    ) -> AsyncIterator[Lease]:
+        """
+        Pick an API key, wait for its capacity, then run one provider request.
+        The request stores the provider-reported total in
+        `lease.usage["total_tokens"]`; without it the estimate stands.
+        Interactive requests skip ahead of bulk ones and may use the reserve;
+        bulk requests also wait for one of the bulk lane's connections.
+
+        Raises:
+            KeyRejectedError when the chosen key answered 401/403/429 and
+            another key can take the retry
+        """
+        lane = INTERACTIVE if interactive else BULK
+        index = self._pick_key(provider, model, key_ids, estimated_tokens, lane)
+        key_id = key_ids[index]
+        health = self.health(provider, key_id)
+        limiter = self.limiter(provider, model, key_id)
+        lease = Lease(index)
+
+        gate = self.bulk_gate(provider, key_id) if lane == BULK else None
+        if gate is not None:
+            await gate.acquire()
+            self._bulk_in_flight[(provider, key_id)] += 1
+        try:
+            if limiter is not None:
+                await limiter.acquire(estimated_tokens, lane)
+            health.in_flight += 1
+            health.calls += 1
+            health.last_used = time.monotonic()
+            try:
+                yield lease
+            except Exception as e:
+                # Only upstream answers count against the key, not local errors
+                if is_retryable(e) or status_code(e) in (401, 403):
+                    rejected = health.record_error(e)
+                    now = time.monotonic()
+                    others = [other for other in key_ids if other != key_id and self.health(provider, other).available(now)]
+                    if rejected:
+                        print(
+                            f"[LLM Scheduler] {provider} key {key_id[:8]} rejected (HTTP {status_code(e)}), "
+                            f"resting it; {len(others)} other key(s) available",
+                            flush=True
+                        )
+                    if rejected and others:
+                        raise KeyRejectedError(f"key {key_id[:8]} answered HTTP {status_code(e)}") from e
+                raise
+            else:
+                health.record_success()
+            finally:
+                health.in_flight -= 1
+                if limiter is not None and lease.usage.get("total_tokens"):
+                    limiter.reconcile(estimated_tokens, lease.usage["total_tokens"])
+        finally:
+            if gate is not None:
+                self._bulk_in_flight[(provider, key_id)] -= 1
+                gate.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limits": {
+                f"{provider}/{model}" + (f"#{key_id[:8]}" if key_id else ""): limiter.stats()
+                for (provider, model, key_id), limiter in self._limiters.items()
+                if limiter is not None
+            },
+            "keys": {
+                f"{provider}#{key_id[:8]}": health.stats()
+                for (provider, key_id), health in self._health.items()
+                if key_id
+            },
+            "bulk_in_flight": {
+                provider + (f"#{key_id[:8]}" if key_id else ""): in_flight
+                for (provider, key_id), in_flight in self._bulk_in_flight.items()
+            },
+            "bulk_max_in_flight": self.bulk_capacity()
+        }
+
+
+# Singleton instance
+llm_scheduler = LLMScheduler()
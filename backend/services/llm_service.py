@@ -3,13 +3,32 @@ LLM Service for AI-powered question parsing and grading
 """
 import os
 import json
-from typing import List, Dict, Any, Optional
-from openai import AsyncOpenAI
-from anthropic import AsyncAnthropic
-import httpx
+import re
+from typing import List, Dict, Any, AsyncIterator, Awaitable, Callable, Optional, Iterator, Tuple
 
 from models import QuestionType
 from utils import calculate_content_hash
+from services.llm_cache import llm_cache
+from services.llm_clients import llm_clients, key_fingerprint
+from services.llm_resilience import llm_resilience, LLMUnavailableError
+from services.llm_scheduler import llm_scheduler, estimate_request_tokens, estimate_tokens
+from json_stream_utils import JSONArrayStreamParser, repair_json
+
+# Bump whenever the extraction prompts or post-processing change, so cached
+# extraction results produced by older prompts are no longer reused.
+PROMPT_VERSION = "1"
+
+
+class NoQuestionsFoundError(Exception):
+    """The LLM answered correctly but the content contains no questions"""
+
+
+class ParsedQuestions(list):
+    """Questions decoded from an LLM response; `complete` is False when the response was cut off"""
+
+    def __init__(self, questions=(), complete: bool = True):
+        super().__init__(questions)
+        self.complete = complete
 
 
 class LLMService:
@@ -45,89 +64,560 @@ class LLMService:
         # Get provider from config or environment
         self.provider = (config or {}).get("ai_provider") or os.getenv("AI_PROVIDER", "openai")
 
+        # Optional secondary provider used once the primary keeps failing
+        # (an empty value saved by the admin disables the environment default)
+        fallback_provider = (config or {}).get("fallback_ai_provider")
+        if fallback_provider is None:
+            fallback_provider = os.getenv("FALLBACK_AI_PROVIDER")
+        self.fallback_provider = fallback_provider if fallback_provider != self.provider else None
+        self.fallback_provider = self.fallback_provider or None
+        self._config = config
+        self._fallback: Optional["LLMService"] = None
+
         if self.provider == "openai":
-            api_key = (config or {}).get("openai_api_key") or os.getenv("OPENAI_API_KEY")
+            api_keys = self._split_api_keys((config or {}).get("openai_api_key") or os.getenv("OPENAI_API_KEY"))
             base_url = self._normalize_openai_base_url(
                 (config or {}).get("openai_base_url") or os.getenv("OPENAI_BASE_URL"),
                 "https://api.openai.com/v1"
             )
             self.model = (config or {}).get("openai_model") or os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
-            if not api_key:
+            if not api_keys:
                 raise ValueError("OpenAI API key not configured")
 
-            self.client = AsyncOpenAI(
-                api_key=api_key,
-                base_url=base_url,
-                default_headers=self._openai_compat_headers(),
-                timeout=120.0,  # 增加超时时间到 120 秒
-                max_retries=3   # 自动重试 3 次
-            )
+            self.clients = [
+                llm_clients.get_openai(self.provider, api_key, base_url, self._openai_compat_headers())
+                for api_key in api_keys
+            ]
 
             # Log configuration for debugging
             print(f"[LLM Config] Provider: OpenAI", flush=True)
             print(f"[LLM Config] Base URL: {base_url}", flush=True)
             print(f"[LLM Config] Model: {self.model}", flush=True)
-            print(f"[LLM Config] API Key: {api_key[:10]}...{api_key[-4:] if len(api_key) > 14 else 'xxxx'}", flush=True)
+            print(f"[LLM Config] API Keys: {self._describe_api_keys(api_keys)}", flush=True)
 
         elif self.provider == "anthropic":
-            api_key = (config or {}).get("anthropic_api_key") or os.getenv("ANTHROPIC_API_KEY")
+            api_keys = self._split_api_keys((config or {}).get("anthropic_api_key") or os.getenv("ANTHROPIC_API_KEY"))
             self.model = (config or {}).get("anthropic_model") or os.getenv("ANTHROPIC_MODEL", "claude-3-haiku-20240307")
 
-            if not api_key:
+            if not api_keys:
                 raise ValueError("Anthropic API key not configured")
 
-            self.client = AsyncAnthropic(
-                api_key=api_key
-            )
+            self.clients = [llm_clients.get_anthropic(api_key) for api_key in api_keys]
 
         elif self.provider == "qwen":
-            api_key = (config or {}).get("qwen_api_key") or os.getenv("QWEN_API_KEY")
+            api_keys = self._split_api_keys((config or {}).get("qwen_api_key") or os.getenv("QWEN_API_KEY"))
             base_url = (config or {}).get("qwen_base_url") or os.getenv("QWEN_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
             self.model = (config or {}).get("qwen_model") or os.getenv("QWEN_MODEL", "qwen-plus")
 
-            if not api_key:
+            if not api_keys:
                 raise ValueError("Qwen API key not configured")
 
-            self.client = AsyncOpenAI(
-                api_key=api_key,
-                base_url=base_url,
-                default_headers=self._openai_compat_headers(),
-                timeout=120.0,  # 增加超时时间到 120 秒
-                max_retries=3   # 自动重试 3 次
-            )
+            self.clients = [
+                llm_clients.get_openai(self.provider, api_key, base_url, self._openai_compat_headers())
+                for api_key in api_keys
+            ]
 
         elif self.provider == "gemini":
-            api_key = (config or {}).get("gemini_api_key") or os.getenv("GEMINI_API_KEY")
+            api_keys = self._split_api_keys((config or {}).get("gemini_api_key") or os.getenv("GEMINI_API_KEY"))
             base_url = (config or {}).get("gemini_base_url") or os.getenv("GEMINI_BASE_URL")
             self.model = (config or {}).get("gemini_model") or os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp")
 
-            if not api_key:
+            if not api_keys:
                 raise ValueError("Gemini API key not configured")
 
             # Store Gemini configuration for REST API calls
-            self.gemini_api_key = api_key
             self.gemini_base_url = base_url or "https://generativelanguage.googleapis.com"
 
-            # Create httpx client for REST API calls (instead of SDK)
-            self.client = httpx.AsyncClient(
-                timeout=120.0,
-                limits=httpx.Limits(max_keepalive_connections=5, max_connections=10)
-            )
+            # Shared httpx clients for REST API calls (instead of SDK)
+            self.clients = [llm_clients.get_http(self.provider, api_key, self.gemini_base_url) for api_key in api_keys]
 
             # Log configuration for debugging
             print(f"[LLM Config] Provider: Gemini (REST API)", flush=True)
             print(f"[LLM Config] Model: {self.model}", flush=True)
             print(f"[LLM Config] Base URL: {self.gemini_base_url}", flush=True)
-            print(f"[LLM Config] API Key: {api_key[:10]}...{api_key[-4:] if len(api_key) > 14 else 'xxxx'}", flush=True)
+            print(f"[LLM Config] API Keys: {self._describe_api_keys(api_keys)}", flush=True)
 
         else:
             raise ValueError(f"Unsupported AI provider: {self.provider}")
 
-    async def parse_document(self, content: str) -> List[Dict[str, Any]]:
+        # Several keys per provider are load-balanced by llm_scheduler
+        self.api_keys = api_keys
+        self.key_ids = [key_fingerprint(api_key) for api_key in api_keys]
+        self.client = self.clients[0]
+
+    @staticmethod
+    def _split_api_keys(value: Optional[str]) -> List[str]:
+        """A key setting may hold several keys separated by commas or newlines"""
+        keys: List[str] = []
+        for key in re.split(r"[,\s]+", value or ""):
+            if key and key not in keys:
+                keys.append(key)
+        return keys
+
+    @staticmethod
+    def _describe_api_keys(api_keys: List[str]) -> str:
+        first = api_keys[0]
+        masked = f"{first[:10]}...{first[-4:] if len(first) > 14 else 'xxxx'}"
+        return masked if len(api_keys) == 1 else f"{masked} (+{len(api_keys) - 1} more)"
+
+    def _get_fallback(self, pdf_bytes: Optional[bytes] = None) -> Optional["LLMService"]:
+        """Service for the fallback provider, or None if none is usable for this request"""
+        if not self.fallback_provider or (pdf_bytes is not None and self.fallback_provider != "gemini"):
+            return None
+
+        if self._fallback is None:
+            try:
+                fallback = LLMService({**(self._config or {}), "ai_provider": self.fallback_provider})
+            except ValueError as e:
+                print(f"[LLM Failover] Fallback provider {self.fallback_provider} unusable: {e}", flush=True)
+                self.fallback_provider = None
+                return None
+            # The fallback never fails over again
+            fallback.fallback_provider = None
+            self._fallback = fallback
+        return self._fallback
+
+    async def complete(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        pdf_bytes: Optional[bytes] = None,
+        call_site: str = "llm",
+        parse: Optional[Callable[[str], Any]] = None,
+        use_cache: bool = True,
+        interactive: bool = False
+    ) -> Any:
+        """
+        Send one prompt to the configured provider and return the response.
+
+        Responses are served from / stored in the persistent LLM cache, keyed by
+        provider, model, temperature, max tokens and the full prompt. When
+        `parse` is given its result is returned, and a response is only cached
+        once it parsed successfully, so a malformed answer is never replayed.
+
+        Args:
+            prompt: User prompt
+            system_prompt: System message (OpenAI-compatible providers)
+            temperature: Sampling temperature (OpenAI-compatible providers)
+            max_tokens: Response token limit (Anthropic defaults to 4096)
+            pdf_bytes: PDF document sent inline (Gemini only)
+            call_site: Name used for logging and LLM_CACHE_SKIP_SITES
+            parse: Optional function turning the response text into a result
+            use_cache: Per-call opt-out of the response cache
+            interactive: A user is waiting for this call; it goes ahead of bulk
+                work in the rate-limit queue and fails fast while the circuit is open
+        """
+        skip_sites = {site.strip() for site in os.getenv("LLM_CACHE_SKIP_SITES", "").split(",") if site.strip()}
+        fingerprint = None
+        if use_cache and call_site not in skip_sites and llm_cache.is_enabled():
+            fingerprint = llm_cache.fingerprint(
+                self.provider, self.model, prompt, system_prompt, temperature, max_tokens, pdf_bytes
+            )
+            cached = await llm_cache.get(fingerprint)
+            if cached is not None:
+                print(f"[LLM Cache] Hit for {call_site} ({self.provider}/{self.model})", flush=True)
+                try:
+                    return parse(cached) if parse else cached
+                except Exception as e:
+                    print(f"[LLM Cache] Cached {call_site} response no longer parses, refetching: {e}", flush=True)
+
+        try:
+            result = await llm_resilience.call(
+                self.provider,
+                lambda: self._scheduled_call(prompt, system_prompt, temperature, max_tokens, pdf_bytes, interactive),
+                call_site=call_site,
+                fail_fast=interactive or self._get_fallback(pdf_bytes) is not None
+            )
+        except LLMUnavailableError as e:
+            fallback = self._get_fallback(pdf_bytes)
+            if fallback is None:
+                raise
+            print(f"[LLM Failover] {call_site}: {e}; using {fallback.provider}", flush=True)
+            return await fallback.complete(
+                prompt, system_prompt, temperature, max_tokens, pdf_bytes, call_site, parse, use_cache, interactive
+            )
+        parsed = parse(result) if parse else result
+
+        if fingerprint:
+            await llm_cache.put(fingerprint, result, call_site)
+        return parsed
+
+    async def stream_json_array(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        pdf_bytes: Optional[bytes] = None,
+        call_site: str = "llm",
+        on_item: Optional[Callable[[Dict[str, Any]], Awaitable[Any]]] = None,
+        use_cache: bool = True
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Request a JSON array of objects and decode it while the response streams in.
+
+        Each object is passed to `on_item` as soon as it is complete. If the
+        stream breaks off after some objects arrived, those are kept and the
+        truncated response is not cached; only complete arrays are cached.
+        Set LLM_STREAM_RESPONSES=false for providers without streaming support.
+
+        Returns:
+            (objects, whether the whole array was received)
+        """
+        skip_sites = {site.strip() for site in os.getenv("LLM_CACHE_SKIP_SITES", "").split(",") if site.strip()}
+        fingerprint = None
+        cached = None
+        if use_cache and call_site not in skip_sites and llm_cache.is_enabled():
+            fingerprint = llm_cache.fingerprint(
+                self.provider, self.model, prompt, system_prompt, temperature, max_tokens, pdf_bytes
+            )
+            cached = await llm_cache.get(fingerprint)
+
+        parser = JSONArrayStreamParser()
+        items: List[Dict[str, Any]] = []
+
+        async def consume(text: str):
+            for item in parser.feed(text):
+                items.append(item)
+                if on_item:
+                    await on_item(item)
+
+        if cached is not None:
+            print(f"[LLM Cache] Hit for {call_site} ({self.provider}/{self.model})", flush=True)
+            await consume(cached)
+            if parser.complete:
+                return items, True
+            # A cached entry that no longer decodes is refetched
+            parser = JSONArrayStreamParser()
+            items = []
+
+        response_parts: List[str] = []
+
+        async def attempt():
+            nonlocal parser
+            # A retried request starts over; nothing has been handed to on_item yet
+            parser = JSONArrayStreamParser()
+            response_parts.clear()
+            if os.getenv("LLM_STREAM_RESPONSES", "true").lower() == "true":
+                estimate = estimate_request_tokens(prompt, system_prompt, max_tokens, pdf_bytes)
+                async with llm_scheduler.slot(self.provider, self.model, estimate, self.key_ids) as lease:
+                    async for delta in self._stream_provider(
+                        prompt, system_prompt, temperature, max_tokens, pdf_bytes, lease.usage, lease.key_index
+                    ):
+                        response_parts.append(delta)
+                        await consume(delta)
+            else:
+                response_parts.append(
+                    await self._scheduled_call(prompt, system_prompt, temperature, max_tokens, pdf_bytes)
+                )
+                await consume(response_parts[0])
+
+        fallback = self._get_fallback(pdf_bytes)
+        try:
+            await llm_resilience.call(
+                self.provider,
+                attempt,
+                call_site=call_site,
+                fail_fast=fallback is not None,
+                can_retry=lambda: not items
+            )
+        except Exception as e:
+            if not items:
+                if fallback is None or not isinstance(e, LLMUnavailableError):
+                    raise
+                print(f"[LLM Failover] {call_site}: {e}; using {fallback.provider}", flush=True)
+                return await fallback.stream_json_array(
+                    prompt, system_prompt, temperature, max_tokens, pdf_bytes, call_site, on_item, use_cache
+                )
+            print(f"[LLM Stream] {call_site} interrupted after {len(items)} complete objects, keeping them: {e}", flush=True)
+            return items, False
+
+        response = "".join(response_parts)
+        parser.finish()
+        print(
+            f"[LLM Stream] {call_site}: {len(response)} chars, {len(items)} objects, "
+            f"{parser.skipped} skipped, repairs {parser.fixes or 'none'}",
+            flush=True
+        )
+
+        if not parser.started:
+            print(f"[JSON Error] No '[' found in response:\n{response[:300]}", flush=True)
+            raise Exception("LLM response does not contain a JSON array")
+
+        if not parser.complete:
+            print(f"[LLM Stream] {call_site} response was truncated, keeping {len(items)} complete objects", flush=True)
+        elif fingerprint:
+            await llm_cache.put(fingerprint, response, call_site)
+        return items, parser.complete
+
+    async def _scheduled_call(
+        self,
+        prompt: str,
+        system_prompt: Optional[str],
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        pdf_bytes: Optional[bytes],
+        interactive: bool = False
+    ) -> str:
+        """_call_provider admitted by the provider's rate-limit buckets"""
+        estimate = estimate_request_tokens(prompt, system_prompt, max_tokens, pdf_bytes)
+        async with llm_scheduler.slot(self.provider, self.model, estimate, self.key_ids, interactive) as lease:
+            return await self._call_provider(
+                prompt, system_prompt, temperature, max_tokens, pdf_bytes, lease.usage, lease.key_index
+            )
+
+    def _gemini_request(self, prompt: str, pdf_bytes: Optional[bytes], method: str) -> Tuple[str, Dict[str, Any]]:
+        """URL and JSON payload of a Gemini REST request"""
+        parts: List[Dict[str, Any]] = []
+        if pdf_bytes is not None:
+            import base64
+            pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
+            print(f"[Gemini PDF] PDF encoded to base64: {len(pdf_base64)} chars", flush=True)
+            parts.append({"inline_data": {"mime_type": "application/pdf", "data": pdf_base64}})
+        parts.append({"text": prompt})
+
+        url = f"{self.gemini_base_url}/v1beta/models/{self.model}:{method}"
+        payload = {
+            "contents": [{
+                "parts": parts
+            }]
+        }
+        return url, payload
+
+    def _openai_request(
+        self,
+        prompt: str,
+        system_prompt: Optional[str],
+        temperature: Optional[float],
+        max_tokens: Optional[int]
+    ) -> Dict[str, Any]:
+        """Keyword arguments of an OpenAI-compatible chat completion request"""
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+
+        request: Dict[str, Any] = {"model": self.model, "messages": messages}
+        if temperature is not None:
+            request["temperature"] = temperature
+        if max_tokens is not None:
+            request["max_tokens"] = max_tokens
+        return request
+
+    async def _call_provider(
+        self,
+        prompt: str,
+        system_prompt: Optional[str],
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        pdf_bytes: Optional[bytes],
+        usage: Optional[Dict[str, int]] = None,
+        key_index: int = 0
+    ) -> str:
+        """
+        Single request to the configured provider; returns the response text.
+        Reported token usage is stored in `usage["total_tokens"]` when given;
+        `key_index` selects one of the configured API keys.
+        """
+        usage = usage if usage is not None else {}
+        client = self.clients[key_index]
+        if pdf_bytes is not None and self.provider != "gemini":
+            raise ValueError(f"Native PDF input is not supported by provider {self.provider}")
+
+        if self.provider == "anthropic":
+            response = await client.messages.create(
+                model=self.model,
+                max_tokens=max_tokens or 4096,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ]
+            )
+            usage["total_tokens"] = response.usage.input_tokens + response.usage.output_tokens
+            return response.content[0].text
+        elif self.provider == "gemini":
+            # Gemini uses REST API
+            print(f"[Gemini] Calling Gemini REST API with model: {self.model}", flush=True)
+            url, payload = self._gemini_request(prompt, pdf_bytes, "generateContent")
+            response = await client.post(
+                url,
+                headers={"Content-Type": "application/json"},
+                params={"key": self.api_keys[key_index]},
+                json=payload
+            )
+            response.raise_for_status()
+            response_data = response.json()
+            print(f"[Gemini] API call completed", flush=True)
+            usage["total_tokens"] = response_data.get("usageMetadata", {}).get("totalTokenCount", 0)
+
+            # Extract text from response
+            return response_data["candidates"][0]["content"]["parts"][0]["text"]
+        else:  # OpenAI or Qwen
+            response = await client.chat.completions.create(
+                **self._openai_request(prompt, system_prompt, temperature, max_tokens)
+            )
+            if response.usage:
+                usage["total_tokens"] = response.usage.total_tokens
+            return response.choices[0].message.content
+
+    async def _stream_provider(
+        self,
+        prompt: str,
+        system_prompt: Optional[str],
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        pdf_bytes: Optional[bytes],
+        usage: Optional[Dict[str, int]] = None,
+        key_index: int = 0
+    ) -> AsyncIterator[str]:
+        """Streaming variant of _call_provider; yields response text as it arrives"""
+        usage = usage if usage is not None else {}
+        client = self.clients[key_index]
+        if pdf_bytes is not None and self.provider != "gemini":
+            raise ValueError(f"Native PDF input is not supported by provider {self.provider}")
+
+        if self.provider == "anthropic":
+            async with client.messages.stream(
+                model=self.model,
+                max_tokens=max_tokens or 4096,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ]
+            ) as stream:
+                async for text in stream.text_stream:
+                    yield text
+                final = await stream.get_final_message()
+                usage["total_tokens"] = final.usage.input_tokens + final.usage.output_tokens
+        elif self.provider == "gemini":
+            # Server-sent events from the REST API
+            print(f"[Gemini] Streaming Gemini REST API with model: {self.model}", flush=True)
+            url, payload = self._gemini_request(prompt, pdf_bytes, "streamGenerateContent")
+            async with client.stream(
+                "POST",
+                url,
+                headers={"Content-Type": "application/json"},
+                params={"key": self.api_keys[key_index], "alt": "sse"},
+                json=payload
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[5:])
+                    if event.get("usageMetadata"):
+                        usage["total_tokens"] = event["usageMetadata"].get("totalTokenCount", 0)
+                    for candidate in event.get("candidates", [])[:1]:
+                        for part in candidate.get("content", {}).get("parts", []):
+                            if part.get("text"):
+                                yield part["text"]
+        else:  # OpenAI or Qwen
+            # Ask for a final usage chunk (not every compatible endpoint accepts it)
+            include_usage = os.getenv("LLM_STREAM_INCLUDE_USAGE", "true").lower() == "true"
+            stream = await client.chat.completions.create(
+                **self._openai_request(prompt, system_prompt, temperature, max_tokens),
+                stream=True,
+                extra_body={"stream_options": {"include_usage": True}} if include_usage else None
+            )
+            output: List[str] = []
+            async for chunk in stream:
+                reported = getattr(chunk, "usage", None)
+                if isinstance(reported, dict):
+                    reported = reported.get("total_tokens")
+                elif reported is not None:
+                    reported = getattr(reported, "total_tokens", None)
+                if reported:
+                    usage["total_tokens"] = reported
+                if chunk.choices and chunk.choices[0].delta.content:
+                    output.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+            if not usage.get("total_tokens"):
+                # Settle the token bucket on the actual output length rather than the max_tokens budget
+                usage["total_tokens"] = (
+                    estimate_tokens(prompt) + estimate_tokens(system_prompt) + estimate_tokens("".join(output))
+                )
+
+    @staticmethod
+    def _normalize_question(question: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Fix the type of one parsed question and add its content hash.
+        Returns None for objects without content.
+        """
+        if not question.get("content"):
+            print(f"[Warning] Question missing 'content' field: {question}", flush=True)
+            return None
+
+        valid_types = {"single", "multiple", "judge", "short"}
+        type_mapping = {
+            "proof": "short",
+            "essay": "short",
+            "calculation": "short",
+            "fill": "short",
+            "填空": "short",
+            "证明": "short",
+            "计算": "short",
+            "问答": "short",
+            "单选": "single",
+            "多选": "multiple",
+            "判断": "judge",
+            "简答": "short"
+        }
+
+        # Validate and fix question type
+        q_type = question.get("type", "short")
+        if isinstance(q_type, str):
+            q_type_lower = q_type.lower()
+            if q_type_lower not in valid_types:
+                # Try to map to valid type
+                if q_type_lower in type_mapping:
+                    question["type"] = type_mapping[q_type_lower]
+                    print(f"[Type Fix] Changed '{q_type}' to '{question['type']}' for question: {question['content'][:50]}...", flush=True)
+                else:
+                    # Default to short answer
+                    print(f"[Type Fix] Unknown type '{q_type}', defaulting to 'short' for question: {question['content'][:50]}...", flush=True)
+                    question["type"] = "short"
+            else:
+                question["type"] = q_type_lower
+        else:
+            question["type"] = "short"
+
+        question["content_hash"] = calculate_content_hash(question["content"])
+        return question
+
+    async def _stream_questions(
+        self,
+        prompt: str,
+        call_site: str,
+        on_question: Optional[Callable[[Dict[str, Any]], Awaitable[Any]]] = None,
+        **request: Any
+    ) -> ParsedQuestions:
+        """Stream a question array, normalizing each question as it arrives"""
+        questions: List[Dict[str, Any]] = []
+
+        async def on_item(item: Dict[str, Any]):
+            question = self._normalize_question(item)
+            if question is None:
+                return
+            questions.append(question)
+            if on_question:
+                await on_question(question)
+
+        _, complete = await self.stream_json_array(prompt, call_site=call_site, on_item=on_item, **request)
+        return ParsedQuestions(questions, complete=complete)
+
+    async def parse_document(
+        self,
+        content: str,
+        on_question: Optional[Callable[[Dict[str, Any]], Awaitable[Any]]] = None
+    ) -> ParsedQuestions:
         """
         Parse document content and extract questions.
 
+        The response is streamed; `on_question` is awaited for every question
+        as soon as it has been decoded. A cut-off response keeps the questions
+        it contains, with `complete` set to False on the result.
+
         Returns a list of dictionaries with question data:
         [
             {
@@ -222,216 +712,65 @@ class LLMService:
 - 只返回 JSON 数组，不要有任何其他内容"""
 
         try:
-            if self.provider == "anthropic":
-                response = await self.client.messages.create(
-                    model=self.model,
-                    max_tokens=4096,
-                    messages=[
-                        {"role": "user", "content": prompt.format(content=content)}
-                    ]
-                )
-                result = response.content[0].text
-            elif self.provider == "gemini":
-                # Gemini uses REST API
-                print(f"[Gemini Text] Calling Gemini REST API with model: {self.model}", flush=True)
-
-                url = f"{self.gemini_base_url}/v1beta/models/{self.model}:generateContent"
-                headers = {"Content-Type": "application/json"}
-                params = {"key": self.gemini_api_key}
-                payload = {
-                    "contents": [{
-                        "parts": [{"text": prompt.format(content=content)}]
-                    }]
-                }
-
-                response = await self.client.post(url, headers=headers, params=params, json=payload)
-                response.raise_for_status()
-                response_data = response.json()
-
-                # Extract text from response
-                result = response_data["candidates"][0]["content"]["parts"][0]["text"]
-                print(f"[Gemini Text] API call completed", flush=True)
-            else:  # OpenAI or Qwen
-                response = await self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": "You are a professional question parser. Return only JSON."},
-                        {"role": "user", "content": prompt.format(content=content)}
-                    ],
-                    temperature=0.3,
-                )
-                result = response.choices[0].message.content
-
-            # Log original response for debugging
-            import sys
-            print(f"[LLM Raw Response] Length: {len(result)} chars", flush=True)
-            print(f"[LLM Raw Response] First 300 chars:\n{result[:300]}", flush=True)
-            print(f"[LLM Raw Response] Last 200 chars:\n{result[-200:]}", flush=True)
-            sys.stdout.flush()
-
-            # Clean result and parse JSON
-            result = result.strip()
-
-            # Remove markdown code blocks
-            if result.startswith("```json"):
-                result = result[7:]
-            elif result.startswith("```"):
-                result = result[3:]
-
-            if result.endswith("```"):
-                result = result[:-3]
-
-            result = result.strip()
-
-            # Try to find JSON array if there's extra text
-            if not result.startswith('['):
-                # Find the first '[' character
-                start_idx = result.find('[')
-                if start_idx != -1:
-                    print(f"[JSON Cleanup] Found '[' at position {start_idx}, extracting array...")
-                    result = result[start_idx:]
-                else:
-                    print(f"[JSON Error] No '[' found in response!")
-                    raise Exception("LLM response does not contain a JSON array")
+            questions = await self._stream_questions(
+                prompt.format(content=content),
+                call_site="parse_document",
+                on_question=on_question,
+                system_prompt="You are a professional question parser. Return only JSON.",
+                temperature=0.3
+            )
 
-            if not result.endswith(']'):
-                # Find the last ']' character
-                end_idx = result.rfind(']')
-                if end_idx != -1:
-                    print(f"[JSON Cleanup] Found last ']' at position {end_idx}")
-                    result = result[:end_idx + 1]
+            if len(questions) == 0:
+                raise NoQuestionsFoundError("No questions found in the parsed result")
 
-            result = result.strip()
+            return questions
 
-            # Additional cleanup: fix common JSON issues
-            # 1. Remove trailing commas before closing brackets
-            import re
-            result = re.sub(r',(\s*[}\]])', r'\1', result)
+        except NoQuestionsFoundError:
+            raise
+        except Exception as e:
+            print(f"[Error] Document parsing failed: {str(e)}")
+            raise Exception(f"Failed to parse document: {str(e)}")
 
-            # 2. Fix unescaped quotes in string values (basic attempt)
-            # This is tricky and may not catch all cases, but helps with common issues
+    @staticmethod
+    def plan_pdf_page_ranges(total_pages: int, pages_per_chunk: int = 4, overlap: int = 1) -> List[Tuple[int, int]]:
+        """
+        Compute overlapping [start, end) page ranges without touching the PDF.
 
-            # Log the cleaned result for debugging
-            print(f"[LLM Cleaned JSON] Length: {len(result)} chars")
-            print(f"[LLM Cleaned JSON] First 300 chars:\n{result[:300]}")
+        Args:
+            total_pages: Number of pages in the document
+            pages_per_chunk: Number of pages per chunk (default: 4)
+            overlap: Number of overlapping pages between chunks (default: 1)
 
-            try:
-                questions = json.loads(result)
-            except json.JSONDecodeError as je:
-                print(f"[JSON Error] Failed to parse JSON at line {je.lineno}, column {je.colno}")
-                print(f"[JSON Error] Error: {je.msg}")
-
-                # If error is about control characters, try to fix them
-                if "control character" in je.msg.lower() or "invalid \\escape" in je.msg.lower():
-                    print(f"[JSON Cleanup] Attempting to fix control characters...", flush=True)
-
-                    # Fix unescaped control characters in JSON string values
-                    import re
-
-                    def fix_string_value(match):
-                        """Fix control characters inside a JSON string value"""
-                        string_content = match.group(1)
-                        # Escape control characters
-                        string_content = string_content.replace('\n', '\\n')
-                        string_content = string_content.replace('\r', '\\r')
-                        string_content = string_content.replace('\t', '\\t')
-                        string_content = string_content.replace('\b', '\\b')
-                        string_content = string_content.replace('\f', '\\f')
-                        return f'"{string_content}"'
-
-                    # Match string values in JSON
-                    # Pattern matches: "..." (handles escaped quotes and backslashes)
-                    # (?:[^"\\]|\\.)* means: either non-quote-non-backslash OR backslash-followed-by-anything, repeated
-                    fixed_result = re.sub(r'"((?:[^"\\]|\\.)*)"', fix_string_value, result)
-
-                    print(f"[JSON Cleanup] Retrying with fixed control characters...", flush=True)
-                    try:
-                        questions = json.loads(fixed_result)
-                        print(f"[JSON Cleanup] ✅ Successfully parsed after fixing control characters!", flush=True)
-                    except json.JSONDecodeError as je2:
-                        print(f"[JSON Error] Still failed after fix: {je2.msg}", flush=True)
-                        # Print context around the error
-                        lines = result.split('\n')
-                        if je.lineno <= len(lines):
-                            start = max(0, je.lineno - 3)
-                            end = min(len(lines), je.lineno + 2)
-                            print(f"[JSON Error] Context (lines {start+1}-{end}):")
-                            for i in range(start, end):
-                                marker = " >>> " if i == je.lineno - 1 else "     "
-                                print(f"{marker}{i+1}: {lines[i]}")
-                        raise Exception(f"Invalid JSON format from LLM: {je.msg} at line {je.lineno}")
-                else:
-                    # Print context around the error
-                    lines = result.split('\n')
-                    if je.lineno <= len(lines):
-                        start = max(0, je.lineno - 3)
-                        end = min(len(lines), je.lineno + 2)
-                        print(f"[JSON Error] Context (lines {start+1}-{end}):")
-                        for i in range(start, end):
-                            marker = " >>> " if i == je.lineno - 1 else "     "
-                            print(f"{marker}{i+1}: {lines[i]}")
-                    raise Exception(f"Invalid JSON format from LLM: {je.msg} at line {je.lineno}")
-
-            # Validate that we got a list
-            if not isinstance(questions, list):
-                raise Exception(f"Expected a list of questions, got {type(questions)}")
+        Returns:
+            List of (start, end) page index tuples
+        """
+        if total_pages <= pages_per_chunk:
+            return [(0, total_pages)]
 
-            if len(questions) == 0:
-                raise Exception("No questions found in the parsed result")
-
-            # Validate and fix question types
-            valid_types = {"single", "multiple", "judge", "short"}
-            type_mapping = {
-                "proof": "short",
-                "essay": "short",
-                "calculation": "short",
-                "fill": "short",
-                "填空": "short",
-                "证明": "short",
-                "计算": "short",
-                "问答": "short",
-                "单选": "single",
-                "多选": "multiple",
-                "判断": "judge",
-                "简答": "short"
-            }
-
-            # Add content hash and validate types
-            for q in questions:
-                if "content" not in q:
-                    print(f"[Warning] Question missing 'content' field: {q}")
-                    continue
-
-                # Validate and fix question type
-                q_type = q.get("type", "short")
-                if isinstance(q_type, str):
-                    q_type_lower = q_type.lower()
-                    if q_type_lower not in valid_types:
-                        # Try to map to valid type
-                        if q_type_lower in type_mapping:
-                            old_type = q_type
-                            q["type"] = type_mapping[q_type_lower]
-                            print(f"[Type Fix] Changed '{old_type}' to '{q['type']}' for question: {q['content'][:50]}...", flush=True)
-                        else:
-                            # Default to short answer
-                            print(f"[Type Fix] Unknown type '{q_type}', defaulting to 'short' for question: {q['content'][:50]}...", flush=True)
-                            q["type"] = "short"
-                    else:
-                        q["type"] = q_type_lower
-                else:
-                    q["type"] = "short"
+        ranges = []
+        start = 0
 
-                q["content_hash"] = calculate_content_hash(q["content"])
+        while start < total_pages:
+            end = min(start + pages_per_chunk, total_pages)
+            ranges.append((start, end))
 
-            return questions
+            # Move to next chunk with overlap
+            start = end - overlap if end < total_pages else total_pages
 
-        except Exception as e:
-            print(f"[Error] Document parsing failed: {str(e)}")
-            raise Exception(f"Failed to parse document: {str(e)}")
+        return ranges
 
-    def split_pdf_pages(self, pdf_bytes: bytes, pages_per_chunk: int = 4, overlap: int = 1) -> List[bytes]:
+    def iter_pdf_pages(
+        self,
+        pdf_bytes: bytes,
+        pages_per_chunk: int = 4,
+        overlap: int = 1
+    ) -> Tuple[int, Iterator[bytes]]:
         """
-        Split PDF into overlapping chunks to handle long documents.
+        Lazily split a PDF into overlapping chunks.
+
+        The page plan is computed up front so callers know the chunk count, but
+        each chunk is only serialized with a new PdfWriter when the iterator is
+        advanced, letting LLM calls for early chunks start immediately.
 
         Args:
             pdf_bytes: PDF file content
@@ -439,66 +778,87 @@ class LLMService:
             overlap: Number of overlapping pages between chunks (default: 1)
 
         Returns:
-            List of PDF chunks as bytes
+            (total_chunks, iterator of PDF chunk bytes)
         """
         import PyPDF2
         import io
 
         pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
         total_pages = len(pdf_reader.pages)
+        page_ranges = self.plan_pdf_page_ranges(total_pages, pages_per_chunk, overlap)
 
         # If PDF is small, don't split
-        if total_pages <= pages_per_chunk:
-            return [pdf_bytes]
+        if len(page_ranges) == 1:
+            return 1, iter([pdf_bytes])
 
         print(f"[PDF Split] Total pages: {total_pages}, splitting into chunks of {pages_per_chunk} pages with {overlap} page overlap")
 
-        chunks = []
-        start = 0
+        def generate_chunks() -> Iterator[bytes]:
+            for chunk_idx, (start, end) in enumerate(page_ranges):
+                # Create a new PDF with pages [start, end)
+                pdf_writer = PyPDF2.PdfWriter()
+                for page_num in range(start, end):
+                    pdf_writer.add_page(pdf_reader.pages[page_num])
 
-        while start < total_pages:
-            end = min(start + pages_per_chunk, total_pages)
+                # Write to bytes
+                chunk_bytes = io.BytesIO()
+                pdf_writer.write(chunk_bytes)
 
-            # Create a new PDF with pages [start, end)
-            pdf_writer = PyPDF2.PdfWriter()
-            for page_num in range(start, end):
-                pdf_writer.add_page(pdf_reader.pages[page_num])
+                print(f"[PDF Split] Chunk {chunk_idx + 1}: pages {start+1}-{end}")
+                yield chunk_bytes.getvalue()
 
-            # Write to bytes
-            chunk_bytes = io.BytesIO()
-            pdf_writer.write(chunk_bytes)
-            chunk_bytes.seek(0)
-            chunks.append(chunk_bytes.getvalue())
+        return len(page_ranges), generate_chunks()
 
-            print(f"[PDF Split] Chunk {len(chunks)}: pages {start+1}-{end}")
+    def split_pdf_pages(self, pdf_bytes: bytes, pages_per_chunk: int = 4, overlap: int = 1) -> List[bytes]:
+        """
+        Split PDF into overlapping chunks to handle long documents.
 
-            # Move to next chunk with overlap
-            start = end - overlap if end < total_pages else total_pages
+        Eager variant of iter_pdf_pages, kept for callers that need all chunks at once.
 
-        return chunks
+        Returns:
+            List of PDF chunks as bytes
+        """
+        _, chunks = self.iter_pdf_pages(pdf_bytes, pages_per_chunk, overlap)
+        return list(chunks)
 
-    async def parse_document_with_pdf(self, pdf_bytes: bytes, filename: str, exam_id: int = None) -> List[Dict[str, Any]]:
+    async def parse_document_with_pdf(
+        self,
+        pdf_bytes: bytes,
+        filename: str,
+        exam_id: int = None,
+        checkpoints=None,
+        chunk_slot=None
+    ) -> ParsedQuestions:
         """
         Parse PDF document using Gemini's native PDF understanding.
-        Automatically splits large PDFs into overlapping chunks.
+        Automatically splits large PDFs into overlapping chunks, which are
+        dispatched concurrently (PARSE_CHUNK_CONCURRENCY) and merged in page order.
         Only works with Gemini provider.
 
         Args:
             pdf_bytes: PDF file content as bytes
             filename: Original filename for logging
             exam_id: Optional exam ID for progress updates
+            checkpoints: Optional ChunkCheckpoints; finished page ranges are
+                reused and new results are stored as soon as they arrive
+            chunk_slot: Optional factory of an async context manager held
+                around each chunk's provider call (fair scheduling across users)
 
         Returns:
-            List of question dictionaries
+            Question dictionaries; `complete` is False when a chunk failed or
+            its response was cut off
         """
         if self.provider != "gemini":
             raise ValueError("PDF parsing is only supported with Gemini provider")
 
-        # Split PDF into chunks
-        pdf_chunks = self.split_pdf_pages(pdf_bytes, pages_per_chunk=4, overlap=1)
-        total_chunks = len(pdf_chunks)
+        from concurrency_utils import iter_ordered_bounded, get_chunk_concurrency
+        from dedup_utils import is_duplicate_question
+
+        # Split PDF into chunks lazily
+        total_chunks, pdf_chunks = self.iter_pdf_pages(pdf_bytes, pages_per_chunk=4, overlap=1)
+        concurrency = get_chunk_concurrency()
 
-        print(f"[Gemini PDF] Processing {total_chunks} chunk(s) for {filename}")
+        print(f"[Gemini PDF] Processing {total_chunks} chunk(s) for {filename} with up to {concurrency} in flight")
 
         # Send progress update if exam_id provided
         if exam_id:
@@ -512,43 +872,65 @@ class LLMService:
             ))
 
         all_questions = []
-        # Process each chunk with fuzzy deduplication
-        for chunk_idx, chunk_bytes in enumerate(pdf_chunks):
-            current_chunk = chunk_idx + 1
-            chunk_progress = 15.0 + (60.0 * current_chunk / total_chunks)
-
-            print(f"[Gemini PDF] Processing chunk {current_chunk}/{total_chunks}")
+        complete = True
 
-            # Send progress update
+        async def parse_chunk(chunk_idx: int, chunk_bytes: bytes) -> List[Dict[str, Any]]:
+            print(f"[Gemini PDF] Processing chunk {chunk_idx + 1}/{total_chunks}")
+            try:
+                if chunk_slot is None:
+                    return await self._parse_pdf_chunk(chunk_bytes, f"{filename}_chunk_{chunk_idx + 1}")
+                async with chunk_slot():
+                    return await self._parse_pdf_chunk(chunk_bytes, f"{filename}_chunk_{chunk_idx + 1}")
+            except NoQuestionsFoundError as e:
+                print(f"[Gemini PDF] Chunk {chunk_idx + 1} contains no questions: {str(e)}")
+                return []
+
+        async def extract_chunk(chunk_idx: int, chunk_bytes: bytes) -> List[Dict[str, Any]]:
+            if checkpoints is None:
+                return await parse_chunk(chunk_idx, chunk_bytes)
+
+            # Re-serialized chunk bytes are not stable, so key by page plan position
+            from services.checkpoint_service import calculate_chunk_hash
+            chunk_hash = calculate_chunk_hash(f"pdf:{chunk_idx}/{total_chunks}")
+            return await checkpoints.run(chunk_idx, chunk_hash, lambda: parse_chunk(chunk_idx, chunk_bytes))
+
+        async def report_chunk_done(chunk_idx, questions, error, completed_chunks):
             if exam_id:
                 await progress_service.update_progress(ProgressUpdate(
                     exam_id=exam_id,
                     status=ProgressStatus.PROCESSING_CHUNK,
-                    message=f"正在处理第 {current_chunk}/{total_chunks} 部分...",
-                    progress=chunk_progress,
+                    message=f"已完成 {completed_chunks}/{total_chunks} 部分...",
+                    progress=15.0 + (60.0 * completed_chunks / total_chunks),
                     total_chunks=total_chunks,
-                    current_chunk=current_chunk,
+                    current_chunk=completed_chunks,
                     questions_extracted=len(all_questions)
                 ))
 
-            try:
-                questions = await self._parse_pdf_chunk(chunk_bytes, f"{filename}_chunk_{current_chunk}")
-                print(f"[Gemini PDF] Chunk {current_chunk} extracted {len(questions)} questions")
-
-                # Fuzzy deduplicate across chunks
-                from dedup_utils import is_duplicate_question
-
-                for q in questions:
-                    if not is_duplicate_question(q, all_questions, threshold=0.85):
-                        all_questions.append(q)
-                    else:
-                        print(f"[PDF Split] Skipped fuzzy duplicate from chunk {current_chunk}")
+        # Process chunks concurrently, fuzzy deduplicating in page order
+        async for chunk_idx, questions, error in iter_ordered_bounded(
+            pdf_chunks,
+            extract_chunk,
+            concurrency,
+            on_complete=report_chunk_done
+        ):
+            current_chunk = chunk_idx + 1
 
-            except Exception as e:
-                print(f"[Gemini PDF] Chunk {current_chunk} failed: {str(e)}")
+            if error is not None:
+                print(f"[Gemini PDF] Chunk {current_chunk} failed: {str(error)}")
                 # Continue with other chunks
+                complete = False
                 continue
 
+            print(f"[Gemini PDF] Chunk {current_chunk} extracted {len(questions)} questions")
+            if not getattr(questions, "complete", True):
+                complete = False
+
+            for q in questions:
+                if not is_duplicate_question(q, all_questions, threshold=0.85):
+                    all_questions.append(q)
+                else:
+                    print(f"[PDF Split] Skipped fuzzy duplicate from chunk {current_chunk}")
+
         print(f"[Gemini PDF] Total questions extracted: {len(all_questions)} (after deduplication)")
 
         # Send final progress for PDF processing
@@ -563,7 +945,9 @@ class LLMService:
                 questions_extracted=len(all_questions)
             ))
 
-        return all_questions
+        if checkpoints is not None and not checkpoints.complete:
+            complete = False
+        return ParsedQuestions(all_questions, complete=complete)
 
     async def _parse_pdf_chunk(self, pdf_bytes: bytes, chunk_name: str) -> List[Dict[str, Any]]:
         """
@@ -648,174 +1032,32 @@ class LLMService:
             print(f"[Gemini PDF] Chunk size: {len(pdf_bytes)} bytes", flush=True)
 
             # Use Gemini's native PDF processing via REST API
-            import base64
-
-            # Encode PDF to base64
-            pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
-            print(f"[Gemini PDF] PDF encoded to base64: {len(pdf_base64)} chars", flush=True)
-
-            # Build REST API request
-            url = f"{self.gemini_base_url}/v1beta/models/{self.model}:generateContent"
-            headers = {"Content-Type": "application/json"}
-            params = {"key": self.gemini_api_key}
-            payload = {
-                "contents": [{
-                    "parts": [
-                        {"inline_data": {"mime_type": "application/pdf", "data": pdf_base64}},
-                        {"text": prompt}
-                    ]
-                }]
-            }
-
-            print(f"[Gemini PDF] Calling Gemini REST API with model: {self.model}", flush=True)
-            response = await self.client.post(url, headers=headers, params=params, json=payload)
-            response.raise_for_status()
-            print(f"[Gemini PDF] API call completed", flush=True)
-
-            response_data = response.json()
-
-            # Extract text from response
-            result = response_data["candidates"][0]["content"]["parts"][0]["text"]
-            print(f"[Gemini PDF] Response retrieved, checking content...", flush=True)
-
-            # Log original response for debugging
-            import sys
-            print(f"[LLM Raw Response] Length: {len(result)} chars", flush=True)
-            print(f"[LLM Raw Response] First 300 chars:\n{result[:300]}", flush=True)
-            print(f"[LLM Raw Response] Last 200 chars:\n{result[-200:]}", flush=True)
-            sys.stdout.flush()
-
-            # Clean result and parse JSON (same as text method)
-            result = result.strip()
-
-            # Remove markdown code blocks
-            if result.startswith("```json"):
-                result = result[7:]
-            elif result.startswith("```"):
-                result = result[3:]
-
-            if result.endswith("```"):
-                result = result[:-3]
-
-            result = result.strip()
-
-            # Try to find JSON array if there's extra text
-            if not result.startswith('['):
-                start_idx = result.find('[')
-                if start_idx != -1:
-                    print(f"[JSON Cleanup] Found '[' at position {start_idx}, extracting array...", flush=True)
-                    result = result[start_idx:]
-                else:
-                    print(f"[JSON Error] No '[' found in response!", flush=True)
-                    raise Exception("LLM response does not contain a JSON array")
-
-            if not result.endswith(']'):
-                end_idx = result.rfind(']')
-                if end_idx != -1:
-                    print(f"[JSON Cleanup] Found last ']' at position {end_idx}", flush=True)
-                    result = result[:end_idx + 1]
-
-            result = result.strip()
-
-            # Additional cleanup: fix common JSON issues
-            # 1. Remove trailing commas before closing brackets
-            import re
-            result = re.sub(r',(\s*[}\]])', r'\1', result)
-
-            # Log the cleaned result for debugging
-            print(f"[LLM Cleaned JSON] Length: {len(result)} chars", flush=True)
-            print(f"[LLM Cleaned JSON] First 300 chars:\n{result[:300]}", flush=True)
-
-            try:
-                questions = json.loads(result)
-            except json.JSONDecodeError as je:
-                print(f"[JSON Error] Failed to parse JSON at line {je.lineno}, column {je.colno}", flush=True)
-                print(f"[JSON Error] Error: {je.msg}", flush=True)
-                # Print context around the error
-                lines = result.split('\n')
-                if je.lineno <= len(lines):
-                    start = max(0, je.lineno - 3)
-                    end = min(len(lines), je.lineno + 2)
-                    print(f"[JSON Error] Context (lines {start+1}-{end}):", flush=True)
-                    for i in range(start, end):
-                        marker = " >>> " if i == je.lineno - 1 else "     "
-                        print(f"{marker}{i+1}: {lines[i]}", flush=True)
-                raise Exception(f"Invalid JSON format from LLM: {je.msg} at line {je.lineno}")
-
-            # Validate that we got a list
-            if not isinstance(questions, list):
-                raise Exception(f"Expected a list of questions, got {type(questions)}")
+            questions = await self._stream_questions(
+                prompt,
+                call_site="parse_pdf_chunk",
+                pdf_bytes=pdf_bytes
+            )
 
             if len(questions) == 0:
                 # Provide more helpful error message
                 print(f"[Gemini PDF] ⚠️ Gemini returned empty array - PDF may not contain recognizable questions", flush=True)
                 print(f"[Gemini PDF] 💡 Trying to get Gemini's explanation...", flush=True)
 
-                # Ask Gemini what it saw in the PDF using REST API
-                explanation_payload = {
-                    "contents": [{
-                        "parts": [
-                            {"inline_data": {"mime_type": "application/pdf", "data": pdf_base64}},
-                            {"text": "Please describe what you see in this PDF document. What is the main content? Are there any questions, exercises, or test items? Respond in Chinese."}
-                        ]
-                    }]
-                }
-
-                explanation_response = await self.client.post(url, headers=headers, params=params, json=explanation_payload)
-                explanation_response.raise_for_status()
-                explanation_data = explanation_response.json()
-                explanation = explanation_data["candidates"][0]["content"]["parts"][0]["text"]
+                # Ask Gemini what it saw in the PDF
+                explanation = await self.complete(
+                    "Please describe what you see in this PDF document. What is the main content? Are there any questions, exercises, or test items? Respond in Chinese.",
+                    pdf_bytes=pdf_bytes,
+                    call_site="describe_pdf"
+                )
                 print(f"[Gemini PDF] 📄 Gemini sees: {explanation[:500]}...", flush=True)
 
-                raise Exception(f"No questions found in PDF. Gemini's description: {explanation[:200]}...")
-
-            # Validate and fix question types
-            valid_types = {"single", "multiple", "judge", "short"}
-            type_mapping = {
-                "proof": "short",
-                "essay": "short",
-                "calculation": "short",
-                "fill": "short",
-                "填空": "short",
-                "证明": "short",
-                "计算": "short",
-                "问答": "short",
-                "单选": "single",
-                "多选": "multiple",
-                "判断": "judge",
-                "简答": "short"
-            }
-
-            # Add content hash and validate types
-            for q in questions:
-                if "content" not in q:
-                    print(f"[Warning] Question missing 'content' field: {q}", flush=True)
-                    continue
-
-                # Validate and fix question type
-                q_type = q.get("type", "short")
-                if isinstance(q_type, str):
-                    q_type_lower = q_type.lower()
-                    if q_type_lower not in valid_types:
-                        # Try to map to valid type
-                        if q_type_lower in type_mapping:
-                            old_type = q_type
-                            q["type"] = type_mapping[q_type_lower]
-                            print(f"[Type Fix] Changed '{old_type}' to '{q['type']}' for question: {q['content'][:50]}...", flush=True)
-                        else:
-                            # Default to short answer
-                            print(f"[Type Fix] Unknown type '{q_type}', defaulting to 'short' for question: {q['content'][:50]}...", flush=True)
-                            q["type"] = "short"
-                    else:
-                        q["type"] = q_type_lower
-                else:
-                    q["type"] = "short"
-
-                q["content_hash"] = calculate_content_hash(q["content"])
+                raise NoQuestionsFoundError(f"No questions found in PDF. Gemini's description: {explanation[:200]}...")
 
             print(f"[Gemini PDF] Successfully extracted {len(questions)} questions", flush=True)
             return questions
 
+        except NoQuestionsFoundError:
+            raise
         except Exception as e:
             print(f"[Error] PDF parsing failed: {str(e)}", flush=True)
             raise Exception(f"Failed to parse PDF document: {str(e)}")
@@ -834,6 +1076,9 @@ class LLMService:
             "score": 0.0-1.0,
             "feedback": "Detailed feedback"
         }
+
+        Raises on provider or response errors; a failed grading must not be
+        recorded as a score of 0.
         """
         prompt = f"""Grade the following short answer question.
 
@@ -858,65 +1103,27 @@ Be fair but strict. Consider:
 
 Return ONLY the JSON object, no markdown or explanations."""
 
-        try:
-            if self.provider == "anthropic":
-                response = await self.client.messages.create(
-                    model=self.model,
-                    max_tokens=1024,
-                    messages=[
-                        {"role": "user", "content": prompt}
-                    ]
-                )
-                result = response.content[0].text
-            elif self.provider == "gemini":
-                # Gemini uses REST API
-                url = f"{self.gemini_base_url}/v1beta/models/{self.model}:generateContent"
-                headers = {"Content-Type": "application/json"}
-                params = {"key": self.gemini_api_key}
-                payload = {
-                    "contents": [{
-                        "parts": [{"text": prompt}]
-                    }]
-                }
-
-                response = await self.client.post(url, headers=headers, params=params, json=payload)
-                response.raise_for_status()
-                response_data = response.json()
-                result = response_data["candidates"][0]["content"]["parts"][0]["text"]
-            else:  # OpenAI or Qwen
-                response = await self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": "You are a fair and strict grader. Return only JSON."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.5,
-                )
-                result = response.choices[0].message.content
-
-            # Clean and parse JSON
-            result = result.strip()
-            if result.startswith("```json"):
-                result = result[7:]
-            if result.startswith("```"):
-                result = result[3:]
-            if result.endswith("```"):
-                result = result[:-3]
-            result = result.strip()
-
-            grading = json.loads(result)
-            return {
-                "score": float(grading.get("score", 0.0)),
-                "feedback": grading.get("feedback", "")
-            }
-
-        except Exception as e:
-            print(f"Error grading answer: {e}")
-            # Return default grading on error
-            return {
-                "score": 0.0,
-                "feedback": "Unable to grade answer due to an error."
-            }
+        def load_grading(result: str) -> Dict[str, Any]:
+            grading, fixes = repair_json(result)
+            if fixes:
+                print(f"[JSON Repair] Grading response repaired: {fixes}", flush=True)
+            if not isinstance(grading, dict):
+                raise ValueError("Expected a JSON object")
+            return grading
+
+        grading = await self.complete(
+            prompt,
+            system_prompt="You are a fair and strict grader. Return only JSON.",
+            temperature=0.5,
+            max_tokens=1024,
+            call_site="grade_short_answer",
+            parse=load_grading,
+            interactive=True
+        )
+        return {
+            "score": float(grading.get("score", 0.0)),
+            "feedback": grading.get("feedback", "")
+        }
 
 
 # Singleton instance
@@ -2,7 +2,7 @@
 Progress Service - Manages document parsing progress for real-time updates
 """
 import asyncio
-from typing import Dict, Optional, AsyncGenerator
+from typing import Dict, Optional, AsyncGenerator, Awaitable, Callable, List
 from datetime import datetime
 from enum import Enum
 
@@ -59,6 +59,23 @@ class ProgressUpdate:
             "timestamp": self.timestamp
         }
 
+    @classmethod
+    def from_dict(cls, data: dict) -> "ProgressUpdate":
+        """Rebuild an update persisted by another process (see to_dict)"""
+        update = cls(
+            exam_id=data["exam_id"],
+            status=ProgressStatus(data["status"]),
+            message=data.get("message", ""),
+            progress=data.get("progress", 0.0),
+            total_chunks=data.get("total_chunks", 0),
+            current_chunk=data.get("current_chunk", 0),
+            questions_extracted=data.get("questions_extracted", 0),
+            questions_added=data.get("questions_added", 0),
+            duplicates_removed=data.get("duplicates_removed", 0)
+        )
+        update.timestamp = data.get("timestamp", update.timestamp)
+        return update
+
 
 class ProgressService:
     """Service for managing parsing progress"""
@@ -68,6 +85,13 @@ class ProgressService:
         self._progress: Dict[int, ProgressUpdate] = {}
         # Store queues for SSE connections
         self._queues: Dict[int, list] = {}
+        # Extra consumers of every update (e.g. persistence for other processes)
+        self._sinks: List[Callable[[ProgressUpdate], Awaitable[None]]] = []
+
+    def add_sink(self, sink: Callable[[ProgressUpdate], Awaitable[None]]):
+        """Register a coroutine called with every progress update"""
+        if sink not in self._sinks:
+            self._sinks.append(sink)
 
     async def update_progress(self, update: ProgressUpdate):
         """
@@ -93,16 +117,30 @@ class ProgressService:
             for dead_queue in dead_queues:
                 self._queues[exam_id].remove(dead_queue)
 
+        for sink in self._sinks:
+            try:
+                await sink(update)
+            except Exception as e:
+                print(f"[Progress] Failed to forward update to sink: {e}")
+
     def get_progress(self, exam_id: int) -> Optional[ProgressUpdate]:
         """Get current progress for an exam"""
         return self._progress.get(exam_id)
 
-    async def subscribe(self, exam_id: int) -> AsyncGenerator[ProgressUpdate, None]:
+    async def subscribe(
+        self,
+        exam_id: int,
+        poll: Optional[Callable[[], Awaitable[Optional[ProgressUpdate]]]] = None,
+        poll_interval: float = 1.0
+    ) -> AsyncGenerator[ProgressUpdate, None]:
         """
         Subscribe to progress updates for an exam (SSE stream)
 
         Args:
             exam_id: Exam ID to subscribe to
+            poll: Optional coroutine returning the latest persisted update, used
+                when the exam is being processed by another process
+            poll_interval: Seconds to wait for a local update before polling
 
         Yields:
             Progress updates as they occur
@@ -118,12 +156,28 @@ class ProgressService:
         try:
             # Send current progress if exists
             current_progress = self.get_progress(exam_id)
+            if not current_progress and poll:
+                current_progress = await poll()
+            last_timestamp = None
             if current_progress:
+                last_timestamp = current_progress.timestamp
                 yield current_progress
+                if current_progress.status in [ProgressStatus.COMPLETED, ProgressStatus.FAILED]:
+                    return
 
             # Stream updates
             while True:
-                update = await queue.get()
+                if poll is None:
+                    update = await queue.get()
+                else:
+                    try:
+                        update = await asyncio.wait_for(queue.get(), timeout=poll_interval)
+                    except asyncio.TimeoutError:
+                        update = await poll()
+                        if update is None or update.timestamp == last_timestamp:
+                            continue
+
+                last_timestamp = update.timestamp
                 yield update
 
                 # Stop streaming if completed or failed
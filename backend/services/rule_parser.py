@@ -0,0 +1,277 @@
+"""
+Rule Parser Service - Deterministic fast path for well-structured question files
+
+Documents with numbered stems, lettered options and explicit "答案：" / "解析："
+lines are parsed locally without calling the LLM. Every numbered block is
+checked structurally; blocks that fail the checks are handed back as
+unparsed text so only those parts go to the LLM.
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils import calculate_content_hash
+
+DEFAULT_MIN_CONFIDENCE = 0.6
+
+# "1." / "1、" / "1．" / "（1）" / "(1)" / "第3题" - numbering is stripped from the stem
+QUESTION_NUMBER_PATTERN = re.compile(
+    r'^\s*(?:\d{1,4}\s*[.．、](?!\d)|[（(]\s*\d{1,4}\s*[)）]|第\s*[\d一二三四五六七八九十百]{1,4}\s*[题道][.．、:：]?)\s*'
+)
+# Section headings such as "一、单选题" or "二、判断题（每题 2 分）"
+SECTION_PATTERN = re.compile(r'^\s*[一二三四五六七八九十百]{1,4}\s*[、.．]\s*(.*)$')
+OPTION_PATTERN = re.compile(r'^\s*([A-H])\s*[.．、)）:：]\s*(.*)$')
+INLINE_OPTION_PATTERN = re.compile(r'(?:^|\s)([A-H])\s*[.．、)）]\s*')
+ANSWER_PATTERN = re.compile(r'^\s*(?:正确答案|参考答案|标准答案|答案|Answer)\s*[:：]\s*(.*)$', re.IGNORECASE)
+ANALYSIS_PATTERN = re.compile(r'^\s*(?:答案解析|试题解析|解析|分析|Explanation|Analysis)\s*[:：]\s*(.*)$', re.IGNORECASE)
+CHOICE_ANSWER_PATTERN = re.compile(r'^[A-H](?:\s*[,，、/\s]?\s*[A-H])*$')
+
+JUDGE_ANSWERS = {
+    "对": "对", "错": "错", "正确": "正确", "错误": "错误",
+    "√": "对", "✓": "对", "✔": "对", "×": "错", "✗": "错", "✘": "错",
+    "true": "True", "false": "False", "t": "True", "f": "False",
+}
+
+SECTION_TYPE_HINTS = [
+    ("多选", "multiple"),
+    ("不定项", "multiple"),
+    ("单选", "single"),
+    ("判断", "judge"),
+    ("简答", "short"),
+    ("问答", "short"),
+    ("填空", "short"),
+]
+
+
+class RuleParseResult:
+    """Outcome of the rule-based parser for one piece of text"""
+    def __init__(
+        self,
+        questions: List[Dict[str, Any]],
+        unparsed_blocks: List[str],
+        total_chars: int,
+        covered_chars: int,
+        candidate_blocks: int
+    ):
+        self.questions = questions
+        self.unparsed_blocks = unparsed_blocks
+        self.total_chars = total_chars
+        self.covered_chars = covered_chars
+        self.candidate_blocks = candidate_blocks
+
+    @property
+    def coverage(self) -> float:
+        """Share of the (non-blank) text handled without the LLM"""
+        return self.covered_chars / self.total_chars if self.total_chars else 0.0
+
+    @property
+    def confidence(self) -> float:
+        """Share of numbered blocks that passed every structural check"""
+        return len(self.questions) / self.candidate_blocks if self.candidate_blocks else 0.0
+
+    @property
+    def unparsed_text(self) -> str:
+        return "\n\n".join(self.unparsed_blocks)
+
+
+class RuleParser:
+    """Parse numbered questions with options, answers and analyses using fixed rules"""
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return os.getenv("RULE_PARSER_ENABLED", "true").lower() == "true"
+
+    @staticmethod
+    def get_min_confidence() -> float:
+        try:
+            return float(os.getenv("RULE_PARSER_MIN_CONFIDENCE", str(DEFAULT_MIN_CONFIDENCE)))
+        except ValueError:
+            return DEFAULT_MIN_CONFIDENCE
+
+    @staticmethod
+    def _split_blocks(text: str) -> List[Tuple[str, List[str]]]:
+        """
+        Split text into ("question" | "section" | "preamble", lines) blocks.
+        A question block runs from a numbered line to the next numbered line or section heading.
+        """
+        blocks: List[Tuple[str, List[str]]] = []
+        kind, lines = "preamble", []
+
+        for line in text.split("\n"):
+            if QUESTION_NUMBER_PATTERN.match(line):
+                next_kind = "question"
+            elif SECTION_PATTERN.match(line):
+                next_kind = "section"
+            else:
+                lines.append(line)
+                continue
+
+            if any(l.strip() for l in lines):
+                blocks.append((kind, lines))
+            kind, lines = next_kind, [line]
+
+        if any(l.strip() for l in lines):
+            blocks.append((kind, lines))
+        return blocks
+
+    @staticmethod
+    def _split_inline_options(line: str) -> Optional[List[Tuple[str, str]]]:
+        """Split 'A. xx  B. yy  C. zz' on one line; None unless letters run A, B, C... in order"""
+        matches = list(INLINE_OPTION_PATTERN.finditer(line))
+        if len(matches) < 2:
+            return None
+
+        letters = [m.group(1) for m in matches]
+        if letters != [chr(ord("A") + i) for i in range(len(letters))]:
+            return None
+
+        options = []
+        for i, match in enumerate(matches):
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(line)
+            options.append((match.group(1), line[match.end():end].strip()))
+        return options
+
+    @staticmethod
+    def _section_type_hint(heading: str) -> Optional[str]:
+        for keyword, question_type in SECTION_TYPE_HINTS:
+            if keyword in heading:
+                return question_type
+        return None
+
+    def _parse_question(self, lines: List[str], type_hint: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Parse one numbered block; None when any structural check fails"""
+        stem_lines = [QUESTION_NUMBER_PATTERN.sub("", lines[0], count=1)]
+        options: List[Tuple[str, str]] = []
+        answer_lines: List[str] = []
+        analysis_lines: List[str] = []
+        section = "stem"
+
+        for line in lines[1:]:
+            answer_match = ANSWER_PATTERN.match(line)
+            analysis_match = ANALYSIS_PATTERN.match(line)
+            option_match = OPTION_PATTERN.match(line)
+
+            if answer_match and section != "analysis":
+                section = "answer"
+                answer_lines.append(answer_match.group(1))
+            elif analysis_match:
+                section = "analysis"
+                analysis_lines.append(analysis_match.group(1))
+            elif section in ("stem", "options") and option_match:
+                inline_options = self._split_inline_options(line) if not options else None
+                if inline_options:
+                    options.extend(inline_options)
+                else:
+                    options.append((option_match.group(1), option_match.group(2).strip()))
+                section = "options"
+            elif section == "stem":
+                stem_lines.append(line)
+            elif section == "options":
+                if line.strip():
+                    # Wrapped option text
+                    letter, option_text = options[-1]
+                    options[-1] = (letter, f"{option_text} {line.strip()}")
+            elif section == "answer":
+                answer_lines.append(line)
+            else:
+                analysis_lines.append(line)
+
+        content = "\n".join(stem_lines).strip()
+        answer = "\n".join(answer_lines).strip()
+        analysis = "\n".join(analysis_lines).strip()
+
+        # Every accepted question needs a stem and an explicit answer line
+        if not content or not answer:
+            return None
+
+        if options:
+            letters = [letter for letter, _ in options]
+            if len(options) < 2 or letters != [chr(ord("A") + i) for i in range(len(letters))]:
+                return None
+            if any(not option_text for _, option_text in options):
+                return None
+
+            compact_answer = answer.upper().replace(" ", "")
+            if not CHOICE_ANSWER_PATTERN.match(compact_answer):
+                return None
+            answer_letters = "".join(dict.fromkeys(c for c in compact_answer if c.isalpha()))
+            if any(c not in letters for c in answer_letters):
+                return None
+
+            is_multiple = len(answer_letters) > 1 or type_hint == "multiple" or "多选" in content
+            question_type = "multiple" if is_multiple else "single"
+            answer = answer_letters
+            formatted_options = [f"{letter}. {option_text}" for letter, option_text in options]
+        else:
+            judge_answer = JUDGE_ANSWERS.get(answer.strip("。.").lower())
+            if judge_answer:
+                question_type = "judge"
+                answer = judge_answer
+            elif type_hint in ("single", "multiple", "judge"):
+                # A choice/judge section without recognisable options or verdict: let the LLM decide
+                return None
+            else:
+                question_type = "short"
+            formatted_options = None
+
+        question = {
+            "content": content,
+            "type": question_type,
+            "options": formatted_options,
+            "answer": answer,
+            "analysis": analysis or None,
+            "content_hash": calculate_content_hash(content)
+        }
+        return question
+
+    def parse(self, text: str) -> RuleParseResult:
+        """
+        Parse every numbered question in `text` that passes the structural checks.
+
+        Returns:
+            RuleParseResult with the questions, the blocks left for the LLM, and
+            coverage / confidence figures
+        """
+        questions: List[Dict[str, Any]] = []
+        unparsed_blocks: List[str] = []
+        total_chars = 0
+        covered_chars = 0
+        candidate_blocks = 0
+        type_hint: Optional[str] = None
+
+        for kind, lines in self._split_blocks(text):
+            block = "\n".join(lines).strip()
+            block_chars = len(re.sub(r"\s", "", block))
+            total_chars += block_chars
+
+            if kind == "section":
+                section_match = SECTION_PATTERN.match(lines[0])
+                type_hint = self._section_type_hint(section_match.group(1)) if section_match else None
+                # A heading line followed by question-like text is not a plain heading
+                if len(lines) == 1 or not any(ANSWER_PATTERN.match(l) or OPTION_PATTERN.match(l) for l in lines):
+                    covered_chars += block_chars
+                    continue
+                unparsed_blocks.append(block)
+                continue
+
+            if kind == "preamble":
+                # Titles and instructions carry no questions unless they contain answers/options
+                if not any(ANSWER_PATTERN.match(l) or OPTION_PATTERN.match(l) for l in lines):
+                    covered_chars += block_chars
+                else:
+                    unparsed_blocks.append(block)
+                continue
+
+            candidate_blocks += 1
+            question = self._parse_question(lines, type_hint)
+            if question:
+                questions.append(question)
+                covered_chars += block_chars
+            else:
+                unparsed_blocks.append(block)
+
+        return RuleParseResult(questions, unparsed_blocks, total_chars, covered_chars, candidate_blocks)
+
+
+# Singleton instance
+rule_parser = RuleParser()
@@ -0,0 +1,12 @@
+"""
+Test configuration: make the backend modules importable and give the services
+the settings they need at import time.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+os.environ.setdefault("SECRET_KEY", "test-secret-key-for-the-test-suite-only")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
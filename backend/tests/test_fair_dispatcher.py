@@ -0,0 +1,46 @@
+"""
+FairDispatcher slot scheduling
+"""
+import asyncio
+import os
+import unittest
+from unittest import mock
+
+from services.fair_dispatcher import FairDispatcher
+
+
+class FairDispatcherTest(unittest.IsolatedAsyncioTestCase):
+    async def test_uncapped_user_gets_free_slot_while_capped_user_waits(self):
+        with mock.patch.dict(os.environ, {"INGEST_CHUNK_SLOTS": "3"}):
+            dispatcher = FairDispatcher()
+            release_a = asyncio.Event()
+            a_entered = []
+
+            async def user_a_chunk(n: int):
+                async with dispatcher.slot(1, max_per_user=1):
+                    a_entered.append(n)
+                    await release_a.wait()
+
+            first = asyncio.create_task(user_a_chunk(1))
+            await asyncio.sleep(0)
+            second = asyncio.create_task(user_a_chunk(2))
+            await asyncio.sleep(0)
+            self.assertEqual(a_entered, [1])
+            self.assertEqual(dispatcher.stats()["waiting"], {1: 1})
+
+            # User 2 must not queue behind user 1's capped waiter
+            async def user_b_chunk():
+                async with dispatcher.slot(2):
+                    return dict(dispatcher.stats()["in_flight"])
+
+            in_flight = await asyncio.wait_for(user_b_chunk(), timeout=1)
+            self.assertEqual(in_flight, {1: 1, 2: 1})
+
+            release_a.set()
+            await asyncio.wait_for(asyncio.gather(first, second), timeout=1)
+            self.assertEqual(a_entered, [1, 2])
+            self.assertEqual(dispatcher.stats()["active"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+"""
+QQuiz Ingestion Worker - standalone process that only drains the document ingestion queue.
+
+Usage (from the backend directory, or /app in the container):
+    python -m worker
+
+Any number of workers can run side by side, on one or more hosts, as long as
+they share DATABASE_URL and UPLOAD_DIR with the API. Set
+INGEST_IN_PROCESS_WORKER=false on the API so PDF parsing, LLM calls and
+deduplication no longer share an event loop with quiz traffic.
+"""
+import asyncio
+import os
+import signal
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+
+async def main() -> int:
+    # Imported here, not at module level: parser pool processes are spawned and
+    # re-import this module, and must not build the LLM service and its clients
+    from database import init_db
+    from routers.exam import run_ingestion_job
+    from services.document_parser import document_parser
+    from services.ingestion_queue import ingestion_queue
+    from services.llm_cache import llm_cache
+    from services.llm_clients import llm_clients
+
+    print("🚀 Starting QQuiz ingestion worker...")
+
+    # Make sure tables exist when a worker starts before the API
+    await init_db()
+
+    upload_dir = os.getenv("UPLOAD_DIR", "./uploads")
+    os.makedirs(upload_dir, exist_ok=True)
+    print(f"📁 Upload directory: {upload_dir}")
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # Windows: fall back to KeyboardInterrupt
+            pass
+
+    worker_task = asyncio.create_task(ingestion_queue.run(run_ingestion_job))
+    stop_task = asyncio.create_task(stop_event.wait())
+
+    await asyncio.wait({worker_task, stop_task}, return_when=asyncio.FIRST_COMPLETED)
+
+    # Release in-flight jobs so another worker can pick them up immediately
+    await ingestion_queue.stop()
+    for task in (worker_task, stop_task):
+        task.cancel()
+    results = await asyncio.gather(worker_task, stop_task, return_exceptions=True)
+    document_parser.shutdown()
+    await llm_cache.close()
+    await llm_clients.close()
+
+    print("👋 Ingestion worker stopped")
+
+    worker_error = results[0]
+    if isinstance(worker_error, Exception):
+        print(f"❌ Worker loop crashed: {worker_error}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(asyncio.run(main()))
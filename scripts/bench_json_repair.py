@@ -0,0 +1,181 @@
+"""
+Corpus check, fuzz run and benchmark for the LLM JSON repair parser.
+
+Usage (from the repository root):
+    python scripts/bench_json_repair.py [--fuzz-rounds 500] [--seed 1]
+
+The corpus in test_data/llm_responses holds failed LLM responses; expected.json
+lists, per file, how many array elements must survive and which repairs must
+be reported.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIR = os.path.join(ROOT_DIR, "test_data", "llm_responses")
+sys.path.insert(0, os.path.join(ROOT_DIR, "backend"))
+
+from json_stream_utils import JSONArrayStreamParser, repair_json  # noqa: E402
+
+
+def stream_parse(text: str, rng: random.Random):
+    """Feed text in random pieces, as a streamed response would arrive"""
+    parser = JSONArrayStreamParser()
+    items = []
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 64)
+        items.extend(parser.feed(text[position:position + size]))
+        position += size
+    parser.finish()
+    return items, parser
+
+
+def check_corpus(rng: random.Random) -> int:
+    with open(os.path.join(CORPUS_DIR, "expected.json"), encoding="utf-8") as f:
+        expected = json.load(f)
+
+    failures = 0
+    for name, spec in sorted(expected.items()):
+        with open(os.path.join(CORPUS_DIR, name), encoding="utf-8") as f:
+            text = f.read()
+
+        problems = []
+        with redirect_stdout(StringIO()):
+            if spec.get("value") == "object":
+                value, fixes = repair_json(text)
+                if not isinstance(value, dict):
+                    problems.append("expected an object")
+                complete = "truncated" not in fixes
+            else:
+                items, parser = stream_parse(text, rng)
+                fixes, complete = parser.fixes, parser.complete
+                if len(items) != spec["elements"]:
+                    problems.append(f"{len(items)} elements, expected {spec['elements']}")
+                if parser.skipped != spec.get("skipped", 0):
+                    problems.append(f"{parser.skipped} skipped, expected {spec.get('skipped', 0)}")
+                # Chunk boundaries must never change the result
+                reference = JSONArrayStreamParser().feed(text)
+                if reference != items:
+                    problems.append("result depends on how the text was split")
+
+        if complete != spec["complete"]:
+            problems.append(f"complete={complete}, expected {spec['complete']}")
+        missing = [fix for fix in spec["fixes"] if fix not in fixes]
+        if missing:
+            problems.append(f"repairs not reported: {missing}")
+
+        status = "ok" if not problems else "FAIL " + "; ".join(problems)
+        print(f"  {name:<32} {status}  repairs={fixes}")
+        failures += bool(problems)
+    return failures
+
+
+def make_questions(count: int, rng: random.Random):
+    return [
+        {
+            "content": f"第 {i} 题：下列说法正确的是？" + "内容" * rng.randint(5, 60),
+            "type": rng.choice(["single", "multiple", "judge", "short"]),
+            "options": [f"{letter}. 选项 {letter}{i}" for letter in "ABCD"],
+            "answer": rng.choice(["A", "B", "AC", "对"]),
+            "analysis": None if i % 3 else f"解析 {i}",
+        }
+        for i in range(count)
+    ]
+
+
+def mutate(text: str, rng: random.Random) -> str:
+    """Apply the damage seen in real responses at random places"""
+    chars = list(text)
+    for _ in range(rng.randint(1, 6)):
+        position = rng.randrange(len(chars))
+        kind = rng.choice(["newline", "tab", "comma", "quote", "noise"])
+        if kind == "newline":
+            chars.insert(position, "\n")
+        elif kind == "tab":
+            chars.insert(position, "\t")
+        elif kind == "comma":
+            closer = "".join(chars).find("}", position)
+            if closer != -1:
+                chars.insert(closer, ",")
+        elif kind == "quote":
+            chars.insert(position, '"')
+        else:
+            chars.insert(position, rng.choice("{}[]:,\\"))
+    if rng.random() < 0.3:
+        chars = chars[:rng.randrange(1, len(chars))]
+    return "".join(chars)
+
+
+def fuzz(rounds: int, rng: random.Random) -> int:
+    failures = 0
+    for round_index in range(rounds):
+        questions = make_questions(rng.randint(1, 12), rng)
+        text = json.dumps(questions, ensure_ascii=False, indent=rng.choice([None, 2]))
+        damaged = mutate(text, rng)
+        try:
+            with redirect_stdout(StringIO()):
+                items, _ = stream_parse(damaged, rng)
+                whole = JSONArrayStreamParser().feed(damaged)
+                try:
+                    repair_json(damaged)
+                except ValueError:
+                    # Unrepairable input must fail cleanly (JSONDecodeError is a ValueError)
+                    pass
+        except Exception as e:
+            failures += 1
+            print(f"  round {round_index}: parser raised {type(e).__name__}: {e}")
+            continue
+        if items != whole:
+            failures += 1
+            print(f"  round {round_index}: streamed and whole-text results differ")
+        with redirect_stdout(StringIO()):
+            intact, _ = stream_parse(text, rng)
+        if intact != questions:
+            failures += 1
+            print(f"  round {round_index}: undamaged response did not round-trip")
+    print(f"  {rounds} rounds, {failures} failures")
+    return failures
+
+
+def benchmark(rng: random.Random):
+    """Time per MB should stay flat as responses grow (single pass)"""
+    for count in (10, 100, 1000, 5000):
+        questions = make_questions(count, rng)
+        text = mutate(json.dumps(questions, ensure_ascii=False, indent=2), rng)
+        size_mb = len(text.encode("utf-8")) / (1024 * 1024)
+
+        start = time.perf_counter()
+        with redirect_stdout(StringIO()):
+            items, parser = stream_parse(text, rng)
+        elapsed = time.perf_counter() - start
+        print(
+            f"  {count:>5} questions  {size_mb:7.3f} MB  {elapsed * 1000:8.1f} ms  "
+            f"{size_mb / elapsed:6.2f} MB/s  {len(items)} decoded, repairs={parser.fixes}"
+        )
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--fuzz-rounds", type=int, default=500)
+    arg_parser.add_argument("--seed", type=int, default=1)
+    args = arg_parser.parse_args()
+    rng = random.Random(args.seed)
+
+    print("Corpus:")
+    failures = check_corpus(rng)
+    print("Fuzz:")
+    failures += fuzz(args.fuzz_rounds, rng)
+    print("Benchmark:")
+    benchmark(rng)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -28,6 +28,11 @@ def main() -> int:
     shared_env.setdefault("NEXT_SERVER_URL", "http://127.0.0.1:3000")
     shared_env.setdefault("NEXT_TELEMETRY_DISABLED", "1")
 
+    # Optional standalone ingestion workers; when enabled the API stops parsing in-process
+    worker_count = int(shared_env.get("INGEST_WORKER_PROCESSES", "0") or "0")
+    if worker_count > 0:
+        shared_env["INGEST_IN_PROCESS_WORKER"] = "false"
+
     next_env = shared_env.copy()
     next_env["NODE_ENV"] = "production"
     next_env["HOSTNAME"] = "0.0.0.0"
@@ -40,9 +45,15 @@ def main() -> int:
     )
 
     api_process: subprocess.Popen | None = None
+    worker_processes: list[subprocess.Popen] = []
+
+    def terminate_workers() -> None:
+        for index, worker_process in enumerate(worker_processes, start=1):
+            terminate_process(worker_process, f"ingestion worker {index}")
 
     def shutdown(signum, _frame):
         print(f"Received signal {signum}, shutting down...")
+        terminate_workers()
         terminate_process(api_process, "FastAPI")
         terminate_process(next_process, "Next.js")
         raise SystemExit(0)
@@ -61,6 +72,15 @@ def main() -> int:
             terminate_process(next_process, "Next.js")
             return migrate_result.returncode
 
+        for _ in range(worker_count):
+            worker_processes.append(
+                subprocess.Popen(
+                    [sys.executable, "-m", "worker"],
+                    cwd=ROOT_DIR,
+                    env=shared_env,
+                )
+            )
+
         api_process = subprocess.Popen(
             [
                 sys.executable,
@@ -81,15 +101,27 @@ def main() -> int:
             api_returncode = api_process.poll()
 
             if next_returncode is not None:
+                terminate_workers()
                 terminate_process(api_process, "FastAPI")
                 return next_returncode
 
             if api_returncode is not None:
                 terminate_process(next_process, "Next.js")
+                terminate_workers()
                 return api_returncode
 
+            for worker_process in worker_processes:
+                worker_returncode = worker_process.poll()
+                if worker_returncode is not None:
+                    print(f"Ingestion worker exited with code {worker_returncode}, shutting down...")
+                    terminate_workers()
+                    terminate_process(api_process, "FastAPI")
+                    terminate_process(next_process, "Next.js")
+                    return worker_returncode or 1
+
             time.sleep(1)
     finally:
+        terminate_workers()
         terminate_process(api_process, "FastAPI")
         terminate_process(next_process, "Next.js")
 
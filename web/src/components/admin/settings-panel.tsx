@@ -91,6 +91,36 @@ export function SettingsPanel({
             />
           </div>
 
+          <div className="space-y-2">
+            <label className="text-sm font-medium text-slate-700">每位用户同时解析的文档数（0 为不限）</label>
+            <Input
+              type="number"
+              value={config.ingest_max_jobs_per_user ?? 1}
+              onChange={(event) =>
+                setConfig((current) => ({
+                  ...current,
+                  ingest_max_jobs_per_user: Number(event.target.value || 0)
+                }))
+              }
+              min={0}
+            />
+          </div>
+
+          <div className="space-y-2">
+            <label className="text-sm font-medium text-slate-700">每位用户同时解析的分块数（0 为不限）</label>
+            <Input
+              type="number"
+              value={config.ingest_max_chunks_per_user ?? 0}
+              onChange={(event) =>
+                setConfig((current) => ({
+                  ...current,
+                  ingest_max_chunks_per_user: Number(event.target.value || 0)
+                }))
+              }
+              min={0}
+            />
+          </div>
+
           <div className="space-y-2">
             <label className="text-sm font-medium text-slate-700">AI 提供商</label>
             <select
@@ -109,6 +139,26 @@ export function SettingsPanel({
               <option value="qwen">Qwen</option>
             </select>
           </div>
+
+          <div className="space-y-2">
+            <label className="text-sm font-medium text-slate-700">备用 AI 提供商</label>
+            <select
+              className="flex h-11 w-full rounded-2xl border border-input bg-background px-4 py-2 text-sm"
+              value={config.fallback_ai_provider || ""}
+              onChange={(event) =>
+                setConfig((current) => ({
+                  ...current,
+                  fallback_ai_provider: event.target.value
+                }))
+              }
+            >
+              <option value="">不使用</option>
+              <option value="gemini">Gemini</option>
+              <option value="openai">OpenAI</option>
+              <option value="anthropic">Anthropic</option>
+              <option value="qwen">Qwen</option>
+            </select>
+          </div>
         </CardContent>
       </Card>
 
@@ -130,6 +180,7 @@ export function SettingsPanel({
             <label className="text-sm font-medium text-slate-700">OpenAI API Key</label>
             <Input
               type="password"
+              placeholder="多个 Key 用逗号分隔"
               value={config.openai_api_key || ""}
               onChange={(event) =>
                 setConfig((current) => ({ ...current, openai_api_key: event.target.value }))
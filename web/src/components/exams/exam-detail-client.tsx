@@ -25,6 +25,7 @@ export function ExamDetailClient({
   const [selectedFile, setSelectedFile] = useState<File | null>(null);
   const [uploading, setUploading] = useState(false);
   const [progress, setProgress] = useState<ProgressEvent | null>(null);
+  const [retrying, setRetrying] = useState(false);
 
   const isProcessing = exam.status === "processing";
 
@@ -109,6 +110,22 @@ export function ExamDetailClient({
     }
   }
 
+  async function handleRetry() {
+    setRetrying(true);
+    try {
+      const payload = await browserApi<ExamUploadResponse>(`/exams/${exam.id}/retry`, {
+        method: "POST"
+      });
+      setExam((current) => ({ ...current, status: payload.status as ExamSummary["status"] }));
+      setProgress(null);
+      toast.success("已重新开始解析");
+    } catch (error) {
+      toast.error(error instanceof Error ? error.message : "重试失败");
+    } finally {
+      setRetrying(false);
+    }
+  }
+
   const progressValue = useMemo(() => {
     if (isProcessing) {
       return Math.round(Number(progress?.progress || 0));
@@ -186,9 +203,19 @@ export function ExamDetailClient({
           </div>
 
           {exam.status === "failed" ? (
-            <div className="flex items-start gap-3 rounded-2xl border border-red-200 bg-red-50 p-4 text-sm text-red-700">
-              <AlertCircle className="mt-0.5 h-5 w-5" />
-              解析失败，请重新上传文档。
+            <div className="flex items-start justify-between gap-3 rounded-2xl border border-red-200 bg-red-50 p-4 text-sm text-red-700">
+              <div className="flex items-start gap-3">
+                <AlertCircle className="mt-0.5 h-5 w-5" />
+                解析失败，可继续解析未完成的部分，或重新上传文档。
+              </div>
+              <Button disabled={retrying} onClick={handleRetry} size="sm" variant="outline">
+                {retrying ? (
+                  <Loader2 className="h-4 w-4 animate-spin" />
+                ) : (
+                  <RefreshCw className="h-4 w-4" />
+                )}
+                继续解析
+              </Button>
             </div>
           ) : null}
         </CardContent>
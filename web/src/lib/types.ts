@@ -134,7 +134,10 @@ export interface SystemConfigResponse {
   allow_registration: boolean;
   max_upload_size_mb: number;
   max_daily_uploads: number;
+  ingest_max_jobs_per_user?: number;
+  ingest_max_chunks_per_user?: number;
   ai_provider: string;
+  fallback_ai_provider?: string | null;
   openai_api_key?: string | null;
   openai_base_url?: string | null;
   openai_model?: string | null;